@@ -1,39 +1,32 @@
 import os
 import json
 import logging
-import warnings
-import time
 import threading
-from collections import OrderedDict
+import time
+import warnings
 from urllib.parse import parse_qs
 
-from flask import Flask, request, abort, render_template, jsonify
+# 最先 import：記錄行程啟動時間，之後的初始化都用 Lazy 延到第一次使用
+from startup import STARTUP, Lazy, reset_all
 
-# -------------------- LINE SDK --------------------
-from linebot import LineBotApi, WebhookHandler
-from linebot.exceptions import InvalidSignatureError
-from linebot.models import (
-    MessageEvent, TextMessage, TextSendMessage,
-    FlexSendMessage, FollowEvent, QuickReply, QuickReplyButton, MessageAction,
-    PostbackEvent
-)
+from flask import Flask, request, abort, render_template, jsonify, g
 
-# -------------------- requests / async for ShowLoadingAnimation --------------------
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-import concurrent.futures
+# LINE SDK（linebot.*）不在這裡 import：光 import 就要 ~150ms，
+# client / parser 在 Lazy factory 裡建立，訊息 model 在各 handler 裡 import
 
 # -------------------- dotenv --------------------
-from dotenv import load_dotenv
-if os.path.exists(".env.local"):
-    load_dotenv(".env.local", override=True)
+# 沒有 .env 檔（例如容器裡直接給環境變數）時連 dotenv 都不 import
+def _load_env_file(path):
+    if os.path.exists(path):
+        from dotenv import load_dotenv
+        load_dotenv(path, override=True)
+
+_load_env_file(".env.local")
 
 APP_ENV = os.getenv("APP_ENV", "local")
 if APP_ENV == "prod":
     print("🚀 使用 .env.prod 設定")
-    if os.path.exists(".env.prod"):
-        load_dotenv(".env.prod", override=True)
+    _load_env_file(".env.prod")
 else:
     print("🛠 使用 .env.local 設定")
 
@@ -48,40 +41,199 @@ LIFF_ID_BOOKING   = os.getenv("LIFF_ID_BOOKING", "")
 LIFF_URL_SUBSCRIBE = f"https://liff.line.me/{LIFF_ID_SUBSCRIBE}"
 LIFF_URL_BOOKING   = f"https://liff.line.me/{LIFF_ID_BOOKING}"
 
+# -------------------- 後端選擇（離線壓測 / profiling） --------------------
+# FIRESTORE_BACKEND=memory → 行程內假的 Firestore（fake_firestore.py）
+# LINE_API_BACKEND=fake    → 行程內啟動假的 LINE API server（fake_line.py）
+FIRESTORE_BACKEND = os.getenv("FIRESTORE_BACKEND", "firestore")
+LINE_API_BACKEND = os.getenv("LINE_API_BACKEND", "line")
+LINE_API_ENDPOINT = os.getenv("LINE_API_ENDPOINT", "https://api.line.me").rstrip("/")
+
+fake_line_server = None
+if LINE_API_BACKEND == "fake":
+    from fake_line import start_fake_line_server
+    fake_line_server = start_fake_line_server(
+        port=int(os.getenv("FAKE_LINE_PORT", 0)),
+        latency_ms=float(os.getenv("FAKE_LINE_LATENCY_MS", 0)),
+        jitter_ms=float(os.getenv("FAKE_LINE_JITTER_MS", 0)),
+        error_rate=float(os.getenv("FAKE_LINE_ERROR_RATE", 0)),
+    )
+    LINE_API_ENDPOINT = fake_line_server.endpoint
+    LINE_CHANNEL_ACCESS_TOKEN = LINE_CHANNEL_ACCESS_TOKEN or "fake-channel-access-token"
+    LINE_CHANNEL_SECRET = LINE_CHANNEL_SECRET or "fake-channel-secret"
+
 if not LINE_CHANNEL_ACCESS_TOKEN or not LINE_CHANNEL_SECRET:
     raise ValueError("❌ 請先設定 LINE_CHANNEL_ACCESS_TOKEN 與 LINE_CHANNEL_SECRET 環境變數")
 
 # -------------------- 基本設定 --------------------
 warnings.filterwarnings("ignore", category=DeprecationWarning)
-logging.basicConfig(level=logging.INFO)
+# 寫 log 交給背景執行緒（QueueHandler / QueueListener），輸出 JSON 並遮罩電話號碼
+import logs
+logs.setup_logging()
 log = logging.getLogger("app")
 
 app = Flask(__name__)
-line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN)
-handler = WebhookHandler(LINE_CHANNEL_SECRET)
-
-# -------------------- Firebase 初始化 --------------------
-import firebase_admin
-from firebase_admin import credentials, firestore
 
-if not firebase_admin._apps:
-    raw_json = os.getenv("FIREBASE_CREDENTIALS")
-    raw_file = os.getenv("FIREBASE_CREDENTIALS_FILE")
-    try:
-        if raw_json:
-            cred = credentials.Certificate(json.loads(raw_json))
-            log.info("✅ 使用 FIREBASE_CREDENTIALS JSON 初始化成功")
-        elif raw_file and os.path.exists(raw_file):
-            cred = credentials.Certificate(raw_file)
-            log.info(f"✅ 使用 FIREBASE_CREDENTIALS_FILE ({raw_file}) 初始化成功")
+# webhook handler 註冊在自己的表（dispatcher.HandlerRegistry），以事件類別名稱查找
+from dispatcher import HandlerRegistry, WebhookDispatcher
+handlers = HandlerRegistry()
+
+def _init_webhook_parser():
+    from linebot import WebhookParser
+    return WebhookParser(LINE_CHANNEL_SECRET)
+
+webhook_parser = Lazy(_init_webhook_parser, "webhook_parser")
+
+# -------------------- Prometheus 指標 (/metrics) --------------------
+import metrics
+
+def _init_line_bot_api():
+    from linebot import LineBotApi
+
+    api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN, endpoint=LINE_API_ENDPOINT)
+    # reply / push / get_profile 等 SDK 呼叫都包上計時
+    return metrics.instrument_line_api(api)
+
+line_bot_api = Lazy(_init_line_bot_api, "line_bot_api")
+
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _observe_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        # 用 url_rule（/debug/push/<user_id>）而不是實際路徑，避免 label 數量爆炸
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.HTTP_SECONDS.labels(route, request.method, response.status_code).observe(
+            time.perf_counter() - started)
+    return response
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return metrics.render(), 200, {"Content-Type": metrics.CONTENT_TYPE}
+
+# -------------------- Firebase 初始化 (延遲到第一次使用) --------------------
+def _import_firestore():
+    """firebase_admin 會一路 import google-cloud-firestore / gRPC，是冷啟動最慢的一段"""
+    if FIRESTORE_BACKEND == "memory":
+        import fake_firestore
+        return fake_firestore
+    from firebase_admin import firestore as firebase_firestore
+    return firebase_firestore
+
+# 只用到 firestore.SERVER_TIMESTAMP，第一次存取時才 import
+firestore = Lazy(_import_firestore, "import:firestore")
+
+def _init_firebase_app():
+    """firebase_admin.initialize_app（同步 / 非同步 client 共用，只會初始化一次）"""
+    import firebase_admin
+    from firebase_admin import credentials
+
+    if not firebase_admin._apps:
+        raw_json = os.getenv("FIREBASE_CREDENTIALS")
+        raw_file = os.getenv("FIREBASE_CREDENTIALS_FILE")
+        try:
+            if raw_json:
+                cred = credentials.Certificate(json.loads(raw_json))
+                log.info("✅ 使用 FIREBASE_CREDENTIALS JSON 初始化成功")
+            elif raw_file and os.path.exists(raw_file):
+                cred = credentials.Certificate(raw_file)
+                log.info("✅ 使用 FIREBASE_CREDENTIALS_FILE (%s) 初始化成功", raw_file)
+            else:
+                raise RuntimeError("❌ 缺少 FIREBASE_CREDENTIALS 或 FIREBASE_CREDENTIALS_FILE")
+            firebase_admin.initialize_app(cred)
+        except Exception:
+            log.exception("❌ Firebase 初始化失敗")
+            raise
+
+def _init_firestore():
+    if FIRESTORE_BACKEND == "memory":
+        client = firestore.client(latency_ms=float(os.getenv("FAKE_FIRESTORE_LATENCY_MS", 0)))
+        seed = os.getenv("FAKE_FIRESTORE_SEED", "listings.csv")
+        if seed and os.path.exists(seed):
+            count = firestore.load_listings(client, seed)
+            log.info("🧪 使用記憶體 Firestore，匯入 %s 筆 listings (%s)", count, seed)
         else:
-            raise RuntimeError("❌ 缺少 FIREBASE_CREDENTIALS 或 FIREBASE_CREDENTIALS_FILE")
-        firebase_admin.initialize_app(cred)
-    except Exception:
-        log.exception("❌ Firebase 初始化失敗")
-        raise
+            log.info("🧪 使用記憶體 Firestore（空的）")
+        return client
+
+    _init_firebase_app()
+    return firestore.client()
+
+db = Lazy(_init_firestore, "firestore")
+
+# -------------------- Firestore 存取層 --------------------
+from write_behind import WriteBehindBuffer
+from repository import Repository, begin_request, end_request, round_trip_totals
+
+# 搜尋紀錄只新增不修改 → 背景批次寫入 (write-behind)
+# 建構時就會啟動背景執行緒 → 延到第一次使用，fork 之後才建立
+search_log_buffer = Lazy(lambda: WriteBehindBuffer(
+    db, "search_logs",
+    max_batch=int(os.getenv("SEARCH_LOG_BATCH", 100)),
+    flush_interval_ms=int(os.getenv("SEARCH_LOG_FLUSH_MS", 1000)),
+), "search_log_buffer")
+repo = Repository(db, search_log_buffer=search_log_buffer)
+
+@app.before_request
+def _count_round_trips():
+    g.round_trip_token = begin_request()
+
+@app.after_request
+def _report_round_trips(response):
+    token = g.pop("round_trip_token", None)
+    if token is not None:
+        counts = end_request(token)
+        total = sum(counts.values())
+        response.headers["X-Firestore-Round-Trips"] = str(total)
+        if total:
+            log.info("[repository] %s Firestore 往返 %s 次 %s", request.path, total, counts)
+    return response
+
+# -------------------- request_id（每行 log 都帶上；回應標頭 X-Request-ID） --------------------
+@app.before_request
+def _bind_request_id():
+    g.request_id_token = logs.set_request_id(request.headers.get("X-Request-ID"))
+
+@app.after_request
+def _return_request_id(response):
+    response.headers["X-Request-ID"] = logs.get_request_id() or ""
+    return response
+
+@app.teardown_request
+def _unbind_request_id(exc):
+    token = g.pop("request_id_token", None)
+    if token is not None:
+        logs.reset_request_id(token)
+
+# -------------------- 同機器 worker 共用快取 (SQLite WAL) --------------------
+from shared_cache import SharedCache, MISSING
+
+def _init_shared_cache():
+    """第一次使用時才開 SQLite；停用或開檔失敗時回傳 None（只用行程內快取）"""
+    if os.getenv("SHARED_CACHE_ENABLED", "1") != "1":
+        return None
+    try:
+        cache = SharedCache(
+            os.getenv("SHARED_CACHE_PATH") or None,
+            ttl=int(os.getenv("SHARED_CACHE_TTL", 300)),
+        )
+    except Exception as e:
+        log.warning("⚠️ 共用快取初始化失敗，只使用行程內快取: %s", e)
+        return None
+    cache.add_invalidation_listener(_on_shared_invalidation)
+    return cache
+
+# 值可能是 None，用 shared_cache.get() 取出後再判斷
+shared_cache = Lazy(_init_shared_cache, "shared_cache")
 
-db = firestore.client()
+# -------------------- 物件記憶體索引 (listings on_snapshot) --------------------
+from listing_index import ListingIndex
+
+LISTING_INDEX_ENABLED = os.getenv("LISTING_INDEX_ENABLED", "1") == "1"
+# 監聽在 warmup() 才開始；首次同步完成前 get_top_flex 會退回即時查詢
+listing_index = ListingIndex(Lazy(lambda: db.collection("listings"), "collection:listings"))
 
 # -------------------- 表單頁面 --------------------
 @app.route("/setting", methods=["GET"])
@@ -106,91 +258,216 @@ def show_entrust_form():
        
 # -------------------- Flex Templates --------------------
 import flex_templates as ft
+from render_cache import RenderCache
+
+# 物件卡片以 (doc_id, updated_at) 快取，物件變動時由索引監聽器清除
+listing_cards = RenderCache(ft.listing_card, maxsize=int(os.getenv("RENDER_CACHE_SIZE", 2048)),
+                            name="listing_card", shared=shared_cache)
+detail_cards = RenderCache(ft.property_flex, maxsize=int(os.getenv("RENDER_CACHE_SIZE", 2048)),
+                           name="property_flex", shared=shared_cache)
+listing_index.add_listener(listing_cards.on_listing_changes)
+listing_index.add_listener(detail_cards.on_listing_changes)
 
 def get_top_flex():
-    docs = db.collection("listings").where("top", "==", True).limit(5).stream()
+    if listing_index.ready:
+        items = listing_index.top(5)
+    else:
+        # 索引尚未完成首次同步 → 退回即時查詢
+        items = repo.listings.top(5)
     bubbles = []
-    for doc in docs:
-        data = doc.to_dict()
+    for doc_id, data in items:
         if not data:
             continue
         try:
-            bubble = ft.listing_card(doc.id, data)
+            bubble = listing_cards.get(doc_id, data)
             if bubble:
                 bubbles.append(bubble)
         except Exception as e:
-            log.error(f"[get_top_flex] 產生 Flex 失敗: {e}")
+            log.error("[get_top_flex] 產生 Flex 失敗: %s", e)
     if not bubbles:
         return None
     return {"type": "carousel", "contents": bubbles}
 
+# -------------------- 精選 carousel (預先組好、凍結) --------------------
+from top_listings import TopCarousel
+
+def _build_top_message():
+    with metrics.FLEX_RENDER_SECONDS.labels("top_carousel").time():
+        flex = get_top_flex()
+        return ft.freeze_flex("精選物件", flex) if flex else None
+
+top_carousel = TopCarousel(_build_top_message, ttl=int(os.getenv("TOP_CAROUSEL_TTL", 60)))
+listing_index.add_listener(top_carousel.on_listing_changes)
+
 # -------------------- 非阻塞 Loading：session + 執行緒池 --------------------
-_session = requests.Session()
-_retries = Retry(total=2, backoff_factor=0.1, status_forcelist=[429, 500, 502, 503, 504])
-_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=50, max_retries=_retries)
-_session.mount("https://", _adapter)
-_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+def _init_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    retries = Retry(total=2, backoff_factor=0.1, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=50, max_retries=retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)  # LINE_API_ENDPOINT 指向本機假的 LINE API 時
+    return session
+
+def _init_executor():
+    import concurrent.futures
+    return concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="loading")
+
+_session = Lazy(_init_session, "http_session")
+_executor = Lazy(_init_executor, "loading_executor")
 
 def _post_loading(chat_id: str, seconds: int):
     try:
-        url = "https://api.line.me/v2/bot/chat/loading/start"
+        url = f"{LINE_API_ENDPOINT}/v2/bot/chat/loading/start"
         headers = {
             "Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}",
             "Content-Type": "application/json",
         }
         s = max(5, min(60, int(round((seconds or 5) / 5.0) * 5)))
         payload = {"chatId": chat_id, "loadingSeconds": s}
-        r = _session.post(url, headers=headers, json=payload, timeout=(1, 1.5))
-        log.info(f"[loading] {r.status_code} payload={payload}")
+        started = time.perf_counter()
+        try:
+            r = _session.post(url, headers=headers, json=payload, timeout=(1, 1.5))
+        except Exception as e:
+            metrics.observe_line_api("show_loading_animation", time.perf_counter() - started)
+            metrics.LINE_API_ERRORS.labels("show_loading_animation", type(e).__name__).inc()
+            raise
+        metrics.observe_line_api("show_loading_animation", time.perf_counter() - started, r.status_code)
+        log.info("[loading] %s payload=%s", r.status_code, payload)
     except Exception as e:
-        log.warning(f"[loading] fail: {e}")
+        log.warning("[loading] fail: %s", e)
 
 def send_loading_animation_async(user_id: str, seconds: int = 5):
     if not user_id:
         return
     _executor.submit(_post_loading, user_id, seconds)
 
-# -------------------- Tiny Cache --------------------
-class TinyTTLCache:
-    def __init__(self, maxsize=256, ttl=30):
-        self.maxsize = maxsize
-        self.ttl = ttl
-        self.cache = OrderedDict()
-        self.lock = threading.RLock()
-    def get(self, key):
-        now = time.time()
-        with self.lock:
-            if key in self.cache:
-                val, ts = self.cache[key]
-                if now - ts < self.ttl:
-                    self.cache.move_to_end(key)
-                    return val
-                else:
-                    self.cache.pop(key, None)
-        return None
-    def set(self, key, val):
-        with self.lock:
-            self.cache[key] = (val, time.time())
-            self.cache.move_to_end(key)
-            if len(self.cache) > self.maxsize:
-                self.cache.popitem(last=False)
+# -------------------- 使用者名稱快取 --------------------
+from profiles import ProfileResolver, user_doc
+
+profiles = Lazy(lambda: ProfileResolver(
+    lambda user_id: line_bot_api.get_profile(user_id),
+    users=repo.users,
+    ttl=int(os.getenv("PROFILE_TTL", 6 * 3600)),
+    fetch_timeout=float(os.getenv("PROFILE_FETCH_TIMEOUT", 1.5)),
+), "profiles")
+
+# -------------------- 預先序列化訊息直送 --------------------
+from line_raw import RawMessagingClient
+
+line_raw = RawMessagingClient(_session, LINE_CHANNEL_ACCESS_TOKEN, endpoint=LINE_API_ENDPOINT)
+
+FROZEN_CARDS = [
+    ("seller_card", "行情評估"),
+    ("search_card", "立即找房"),
+    ("intro_card", "買房找我"),
+    ("buyer_card", "需求條件", LIFF_URL_SUBSCRIBE),
+    ("no_result_card", "搜尋結果", LIFF_URL_SUBSCRIBE if LIFF_ID_SUBSCRIBE else "#"),
+]
+
+def warm_frozen_cards():
+    """固定卡片啟動時先凍結好，reply 時直接送出 JSON"""
+    for card, alt_text, *args in FROZEN_CARDS:
+        ft.frozen_flex(card, alt_text, *args)
+
+def push_message(to, messages, retry_key=None):
+    """
+    一律走 line_raw（FrozenMessage 直送，SDK model 在這裡序列化）。
+    SDK v2 的 push_message(retry_key=...) 會把 X-Line-Retry-Key 留在共用的 LineBotApi.headers，
+    之後同一個 client 的 reply 都帶著舊的 key 而被 LINE 以 409 拒絕
+    """
+    return line_raw.push(to, messages, retry_key=retry_key)
+
+# -------------------- 非同步推播佇列 --------------------
+from outbox import Outbox
+
+outbox = Lazy(lambda: Outbox(
+    push_message,
+    workers=int(os.getenv("OUTBOX_WORKERS", 4)),
+    maxsize=int(os.getenv("OUTBOX_MAXSIZE", 1000)),
+    put_timeout=float(os.getenv("OUTBOX_PUT_TIMEOUT", 0.2)),
+), "outbox")
+
+# -------------------- 物件詳情快取 (single-flight + SWR) --------------------
+from cache import SWRCache
+
+# 共用快取裡的物件只有 listings 監聽器會清；索引沒在跑（停用或尚未同步）時沒人清，只放短時間
+LISTING_SHARED_TTL_UNINDEXED = int(os.getenv("LISTING_SHARED_TTL_UNINDEXED", 30))
+
+def _load_listing(house_id):
+    key = f"listing:{house_id}"
+    shared = shared_cache.get()
+    if shared is not None:
+        cached = shared.get(key)
+        if cached is not MISSING:
+            return cached
+
+    house = repo.listings.get(house_id)
+
+    if shared is not None:
+        # 不存在的 ID 只短暫快取
+        if house is None:
+            ttl = 10
+        else:
+            ttl = None if listing_index.ready else LISTING_SHARED_TTL_UNINDEXED
+        shared.set(key, house, ttl=ttl)
+    return house
+
+_detail_cache = SWRCache(
+    loader=_load_listing,
+    maxsize=int(os.getenv("DETAIL_CACHE_SIZE", 1024)),
+    ttl=30,
+    stale_ttl=300,
+    negative_ttl=10,
+    name="listing_detail",
+)
 
-_detail_cache = TinyTTLCache(maxsize=256, ttl=30)
+def _change_version(old, new):
+    """同一筆變動在各 worker 算出相同的值；沒有 updated_at 時回傳 None（不去重）"""
+    if new is not None:
+        updated_at = new.get("updated_at")
+        return None if updated_at is None else str(updated_at)
+    updated_at = (old or {}).get("updated_at")
+    return None if updated_at is None else f"removed:{updated_at}"
+
+def _invalidate_listing_details(changes, version):
+    for _kind, doc_id, _old, _new in changes:
+        _detail_cache.invalidate(doc_id)
+    shared = shared_cache.get()
+    if shared is not None and version > 1:
+        # 首次同步（version 1）是全量載入，不算變動。
+        # 每個 worker 的監聽器都會看到同一筆變動，以物件的 updated_at 當版本去重
+        shared.invalidate([(f"listing:{doc_id}", _change_version(old, new))
+                           for _kind, doc_id, old, new in changes])
+
+def _on_shared_invalidation(keys):
+    """其他 worker 更新了共用快取 → 清掉本行程對應的快取"""
+    for key in keys:
+        if key.startswith("listing:"):
+            doc_id = key[len("listing:"):]
+            _detail_cache.invalidate(doc_id)
+            listing_cards.invalidate(doc_id)
+            detail_cards.invalidate(doc_id)
+
+listing_index.add_listener(_invalidate_listing_details)
 
 # -------------------- 關鍵字回復 --------------------
-@handler.add(MessageEvent, message=TextMessage)
+@handlers.add("MessageEvent", message="TextMessage")
 def handle_message(event):
+    from linebot.models import FlexSendMessage, TextSendMessage
+
     msg = event.message.text.strip()
     user_id = event.source.user_id
-    log.info(f"[handle_message] 收到訊息: {repr(msg)} user_id={user_id}")
+    log.info("[handle_message] 收到訊息: %r user_id=%s", msg, user_id)
+    profiles.warm(user_id)
 
     if msg == "中壢夜市生活圈精選":
-        flex = get_top_flex()
-        if flex:
-            line_bot_api.reply_message(
-                event.reply_token,
-                FlexSendMessage(alt_text="精選物件", contents=flex)
-            )
+        top = top_carousel.get()
+        if top:
+            line_raw.reply(event.reply_token, top)
         else:
             line_bot_api.reply_message(
                 event.reply_token,
@@ -198,31 +475,22 @@ def handle_message(event):
             )
 
     elif msg == "我要賣房":
-        line_bot_api.reply_message(
-            event.reply_token, 
-            FlexSendMessage(alt_text="行情評估", contents=ft.seller_card()))
+        line_raw.reply(event.reply_token, ft.frozen_flex("seller_card", "行情評估"))
 
     elif msg == "立即找房":
-        line_bot_api.reply_message(
-            event.reply_token,
-            FlexSendMessage(alt_text="立即找房", contents=ft.search_card())
-        )
+        line_raw.reply(event.reply_token, ft.frozen_flex("search_card", "立即找房"))
 
     elif msg == "你的介紹":
-        line_bot_api.reply_message(
-            event.reply_token,
-            FlexSendMessage(alt_text="買房找我", contents=ft.intro_card())
-        )
+        line_raw.reply(event.reply_token, ft.frozen_flex("intro_card", "買房找我"))
 
     elif msg == "管理我的追蹤條件":
-        doc = db.collection("forms").document(user_id).get()
-        if doc.exists:
-            data = doc.to_dict()
+        data = repo.forms.get(user_id)
+        if data is not None:
             budget = data.get("budget", "-")
             room = data.get("room", "-")
             genre = data.get("genre", "-")
 
-            log.info(f"[manage_condition] user_id={user_id}, data={data}")
+            log.info("[manage_condition] user_id=%s, data=%s", user_id, logs.payload(data))
             line_bot_api.reply_message(
                 event.reply_token,
                 FlexSendMessage(
@@ -231,28 +499,26 @@ def handle_message(event):
                 )
             )
         else:
-            log.info(f"[manage_condition] user_id={user_id}, 尚未填過表單 → 顯示 buyer_card")
-            line_bot_api.reply_message(
-                event.reply_token,
-                FlexSendMessage(
-                    alt_text="需求條件",
-                    contents=ft.buyer_card(LIFF_URL_SUBSCRIBE)
-                )
-            )
+            log.info("[manage_condition] user_id=%s, 尚未填過表單 → 顯示 buyer_card", user_id)
+            line_raw.reply(event.reply_token, ft.frozen_flex("buyer_card", "需求條件", LIFF_URL_SUBSCRIBE))
 
 
 # -------------------- 歡迎訊息 --------------------
-@handler.add(FollowEvent)
+WELCOME_TEXT = (
+    "我可以協助你：\n"
+    "✔ 快速尋找適合的物件\n"
+    "✔ 新上架物件搶先通知\n"
+    "✔  房市行情與成交資訊即時更新\n\n"
+    "請點「立即找房」或「委託賣房」開始吧！"
+)
+
+@handlers.add("FollowEvent")
 def handle_follow(event):
-    welcome_text = (
-        "我可以協助你：\n"
-        "✔ 快速尋找適合的物件\n"
-        "✔ 新上架物件搶先通知\n"
-        "✔  房市行情與成交資訊即時更新\n\n"
-        "請點「立即找房」或「委託賣房」開始吧！"
-    )
+    from linebot.models import MessageAction, QuickReply, QuickReplyButton, TextSendMessage
+
+    profiles.warm(getattr(event.source, "user_id", None), force=True)
     quick_reply = TextSendMessage(
-        text=welcome_text,
+        text=WELCOME_TEXT,
         quick_reply=QuickReply(
             items=[
                 QuickReplyButton(action=MessageAction(label="立即找房", text="立即找房")),
@@ -266,6 +532,8 @@ def handle_follow(event):
 # -------------------- 追蹤物件表單提交 --------------------
 @app.route("/submit_form", methods=["POST"])
 def submit_form():
+    from linebot.models import FlexSendMessage
+
     try:
         data = request.get_json(force=True, silent=True) or request.form.to_dict()
         budget = data.get("budget")
@@ -277,18 +545,10 @@ def submit_form():
             return jsonify({"status": "error", "message": "missing user_id"}), 400
 
         # ---------------- 取得使用者名稱 ----------------
-        try:
-            profile = line_bot_api.get_profile(user_id)
-            display_name = profile.display_name
-            log.info(f"[submit_form] 使用者名稱：{display_name}")
-        except Exception as e:
-            display_name = "未知使用者"
-            log.warning(f"[submit_form] 無法取得 display_name: {e}")
+        display_name = profiles.display_name(user_id)
+        log.info("[submit_form] 使用者名稱：%s", display_name)
 
         # ---------------- Firestore forms ----------------
-        doc_ref = db.collection("forms").document(user_id)
-        existed = doc_ref.get().exists
-
         payload = {
             "budget": budget,
             "room": room,
@@ -298,17 +558,21 @@ def submit_form():
             "updated_at": firestore.SERVER_TIMESTAMP
         }
 
-        if not existed:
-            payload["created_at"] = firestore.SERVER_TIMESTAMP
-
-        doc_ref.set(payload, merge=True)
+        # 追蹤索引已同步時可直接判斷是否已有表單，省掉 create() 失敗再 set 的那次往返
+        created = repo.forms.create_or_update(
+            user_id, payload,
+            on_create={"created_at": firestore.SERVER_TIMESTAMP},
+            exists_hint=(user_id in subscription_index) if subscription_index.ready else None,
+        )
+        existed = not created
 
         # ---------------- 推送確認卡片 ----------------
         title = "🎉 追蹤成功！" if not existed else "條件已更新"
         card = ft.manage_condition_card(budget, room, genre, LIFF_URL_SUBSCRIBE)
-        line_bot_api.push_message(
+        outbox.push(
             user_id,
-            FlexSendMessage(alt_text=title, contents=card)
+            FlexSendMessage(alt_text=title, contents=card),
+            tag="submit_form"
         )
 
         return jsonify({"status": "success"}), 200
@@ -318,9 +582,18 @@ def submit_form():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+# -------------------- 搜尋紀錄批次寫入 (write-behind) --------------------
+@app.route("/debug/write_behind")
+def debug_write_behind():
+    return jsonify(search_log_buffer.stats())
+
 # -------------------- 搜尋物件表單提交 --------------------
+from search_query import parse_budget, parse_room, MAX_RESULTS
+
 @app.route("/submit_search", methods=["POST"])
 def submit_search():
+    from linebot.models import FlexSendMessage
+
     try:
         data = request.get_json(force=True)
         user_id = data.get("user_id")
@@ -328,69 +601,37 @@ def submit_search():
         room    = data.get("room")
         genre   = data.get("genre")
 
-        log.info(f"[submit_search] 收到 user_id={user_id}, budget={budget}, room={room}, genre={genre}")
+        log.info("[submit_search] 收到 user_id=%s, budget=%s, room=%s, genre=%s", user_id, budget, room, genre)
 
         if not user_id:
             return jsonify({"status": "error", "message": "❌ 缺少 user_id"}), 400
 
         # ---------------- 取得使用者名稱 ----------------
-        try:
-            profile = line_bot_api.get_profile(user_id)
-            display_name = profile.display_name
-            log.info(f"[submit_search] 使用者名稱：{display_name}")
-        except Exception as e:
-            display_name = "未知使用者"
-            log.warning(f"[submit_search] 無法取得 display_name: {e}")
-
-        # ---------------- 查 Firestore listings ----------------
-        query = db.collection("listings")
-
-        # ✅ 改良：安全轉換 room（避免空字串或非數字報錯）
-        if room:
-            try:
-                room_int = int(room)
-                if room_int > 0:
-                    query = query.where("room", "==", room_int)
-            except ValueError:
-                log.warning(f"[submit_search] room 不是有效數字: {room}")
-
-        # ✅ genre 為空字串時不查
-        if genre:
-            query = query.where("genre", "==", genre)
-
-        docs = list(query.stream())
-        log.info(f"[submit_search] 找到 {len(docs)} 筆 listings (未過濾價格)")
-
-        # ---------------- 預算篩選 ----------------
-        min_budget, max_budget = None, None
-        if budget:
-            try:
-                if "-" in budget:
-                    parts = budget.replace("萬", "").split("-")
-                    min_budget, max_budget = int(parts[0]), int(parts[1])
-                elif "以下" in budget:
-                    max_budget = int(budget.replace("萬以下", ""))
-                elif "以上" in budget:
-                    min_budget = int(budget.replace("萬以上", ""))
-            except Exception as e:
-                log.warning(f"[submit_search] 預算解析失敗: {e}")
+        display_name = profiles.display_name(user_id)
+        log.info("[submit_search] 使用者名稱：%s", display_name)
+
+        # ---------------- 條件解析 ----------------
+        min_budget, max_budget = parse_budget(budget)
+        room_int = parse_room(room)
+
+        # ---------------- 查 listings (記憶體索引 / Firestore) ----------------
+        if listing_index.ready:
+            items = listing_index.search(room=room_int, genre=genre or None,
+                                         min_price=min_budget, max_price=max_budget,
+                                         limit=MAX_RESULTS)
+            log.info("[submit_search] 索引命中 %s 筆 listings version=%s", len(items), listing_index.version)
+        else:
+            # 索引尚未同步 → 價格範圍與分頁交給 Firestore，只讀要顯示的筆數
+            items = repo.listings.search(room=room_int, genre=genre or None,
+                                         min_budget=min_budget, max_budget=max_budget, limit=MAX_RESULTS)
+            log.info("[submit_search] Firestore 找到 %s 筆 listings", len(items))
 
-        # ---------------- 篩選並生成 Flex 卡片 ----------------
+        # ---------------- 生成 Flex 卡片 ----------------
         bubbles = []
         matched_list = []
-        for d in docs:
-            data_ = d.to_dict()
-            price = data_.get("price")
-
-            # ✅ 價格篩選
-            if price is not None:
-                if min_budget and price < min_budget:
-                    continue
-                if max_budget and price > max_budget:
-                    continue
-
+        for doc_id, data_ in items:
             matched_list.append({
-                "doc_id": d.id,
+                "doc_id": doc_id,
                 "title": data_.get("title"),
                 "price": data_.get("price"),
                 "room": data_.get("room"),
@@ -398,28 +639,28 @@ def submit_search():
             })
 
             try:
-                bubbles.append(ft.listing_card(d.id, data_))
+                bubbles.append(listing_cards.get(doc_id, data_))
             except Exception as e:
-                log.error(f"[submit_search] listing_card 失敗 doc_id={d.id}, error={e}")
+                log.error("[submit_search] listing_card 失敗 doc_id=%s, error=%s", doc_id, e)
 
         # ---------------- 推送搜尋結果 ----------------
         if not bubbles:
-            from flex_templates import no_result_card
-            LIFF_ID_SUBSCRIBE = os.getenv("LIFF_ID_SUBSCRIBE", "")
-            form_url = f"https://liff.line.me/{LIFF_ID_SUBSCRIBE}" if LIFF_ID_SUBSCRIBE else "#"
-            line_bot_api.push_message(
+            form_url = LIFF_URL_SUBSCRIBE if LIFF_ID_SUBSCRIBE else "#"
+            outbox.push(
                 user_id,
-                FlexSendMessage(alt_text="搜尋結果", contents=no_result_card(form_url))
+                ft.frozen_flex("no_result_card", "搜尋結果", form_url),
+                tag="submit_search"
             )
         else:
-            flex_message = {"type": "carousel", "contents": bubbles[:50]}
-            line_bot_api.push_message(
+            flex_message = {"type": "carousel", "contents": bubbles[:MAX_RESULTS]}
+            outbox.push(
                 user_id,
-                FlexSendMessage(alt_text="搜尋結果", contents=flex_message)
+                FlexSendMessage(alt_text="搜尋結果", contents=flex_message),
+                tag="submit_search"
             )
 
         # ---------------- Firestore 紀錄搜尋紀錄 ----------------
-        db.collection("search_logs").add({
+        repo.search_logs.append({
             "user_id": user_id,
             "user_name": display_name,
             "budget": budget,
@@ -428,7 +669,7 @@ def submit_search():
             "result_count": len(bubbles),
             "created_at": firestore.SERVER_TIMESTAMP
         })
-        log.info(f"[submit_search] ✅ Firestore 寫入 search_logs 成功 user_id={user_id}, name={display_name}")
+        log.info("[submit_search] ✅ search_logs 已排入批次寫入 user_id=%s, name=%s", user_id, display_name)
 
         return jsonify({"status": "ok"}), 200
 
@@ -440,6 +681,8 @@ def submit_search():
 # -------------------- 委託賣房表單 (幫我評估行情) --------------------
 @app.route("/submit_entrust", methods=["POST"])
 def submit_entrust():
+    from linebot.models import FlexSendMessage
+
     try:
         data = request.get_json(force=True, silent=True) or request.form.to_dict()
         user_id = data.get("user_id")
@@ -455,15 +698,9 @@ def submit_entrust():
             return jsonify({"status": "error", "message": "❌ 請完整填寫表單"}), 400
 
         # --- 取得使用者名稱 ---
-        try:
-            profile = line_bot_api.get_profile(user_id)
-            display_name = profile.display_name
-        except Exception as e:
-            display_name = "未知使用者"
-            log.warning(f"[submit_entrust] 取得 display_name 失敗: {e}")
+        display_name = profiles.display_name(user_id)
 
         # --- 寫入 Firestore ---
-        doc_ref = db.collection("entrust_forms").document()
         payload = {
             "user_id": user_id,
             "user_name": display_name,
@@ -473,59 +710,35 @@ def submit_entrust():
             "phone": phone,
             "created_at": firestore.SERVER_TIMESTAMP
         }
-        doc_ref.set(payload)
-        log.info(f"[submit_entrust] ✅ 寫入 Firestore 成功 user_id={user_id}")
+        repo.entrust_forms.add(payload)
+        log.info("[submit_entrust] ✅ 寫入 Firestore 成功 user_id=%s", user_id)
 
         # --- 回覆屋主 ---
-        reply_card = {
-            "type": "bubble",
-            "body": {
-                "type": "box",
-                "layout": "vertical",
-                "contents": [
-                    {"type": "text", "text": "收到你的資料囉！", "weight": "bold", "size": "lg", "color": "#EB941E"},
-                    {"type": "text", "text": "我們會盡快提供初估行情，協助你了解市場價位 💬", "wrap": True, "margin": "md"},
-                ]
-            }
-        }
+        reply_card = ft.entrust_received_card()
         try:
-            line_bot_api.push_message(
+            outbox.push(
                 user_id,
-                FlexSendMessage(alt_text="收到委託資料", contents=reply_card)
+                FlexSendMessage(alt_text="收到委託資料", contents=reply_card),
+                tag="submit_entrust"
             )
         except Exception as e:
-            log.warning(f"[submit_entrust] 推播屋主失敗: {e}")
+            log.warning("[submit_entrust] 推播屋主失敗: %s", e)
 
         # --- 推播通知給房仲 ---
         try:
             agent_id = os.getenv("AGENT_LINE_USER_ID") or os.getenv("AGENT_USER_ID")  # ✅ 支援兩種名稱
             if agent_id:
-                agent_card = {
-                    "type": "bubble",
-                    "body": {
-                        "type": "box",
-                        "layout": "vertical",
-                        "contents": [
-                            {"type": "text", "text": "🏡 新的屋主委託！", "weight": "bold", "size": "lg", "color": "#EB941E"},
-                            {"type": "text", "text": f"👤 姓名：{display_name}", "wrap": True, "margin": "sm"},
-                            {"type": "text", "text": f"📞 電話：{phone}", "wrap": True, "margin": "sm"},
-                            {"type": "text", "text": f"📍 區域 / 社區：{area}", "wrap": True, "margin": "sm"},
-                            {"type": "text", "text": f"🏠 格局 / 類型：{layout}", "wrap": True, "margin": "sm"},
-                            {"type": "text", "text": f"📐 坪數：{size} 坪", "wrap": True, "margin": "sm"},
-                            {"type": "separator", "margin": "md"},
-                            {"type": "text", "text": "請儘快聯繫屋主，提供初估行情 🙌", "size": "sm", "color": "#555", "margin": "md"}
-                        ]
-                    }
-                }
-                line_bot_api.push_message(
+                agent_card = ft.entrust_agent_card(display_name, phone, area, layout, size)
+                outbox.push(
                     agent_id,
-                    FlexSendMessage(alt_text="🏡 新的屋主委託！", contents=agent_card)
+                    FlexSendMessage(alt_text="🏡 新的屋主委託！", contents=agent_card),
+                    tag="submit_entrust:agent"
                 )
-                log.info(f"[submit_entrust] ✅ 已通知房仲 agent_id={agent_id}")
+                log.info("[submit_entrust] ✅ 已排入房仲通知 agent_id=%s", agent_id)
             else:
                 log.warning("[submit_entrust] ⚠️ 沒有設定 AGENT_LINE_USER_ID")
         except Exception as e:
-            log.exception(f"[submit_entrust] ❌ 通知房仲失敗 error={e}")
+            log.exception("[submit_entrust] ❌ 通知房仲失敗 error=%s", e)
 
         # --- 回傳結果給前端 ---
         return jsonify({
@@ -552,9 +765,11 @@ TIMESLOT_MAP = {
 # -------------------- 預約賞屋表單 --------------------
 @app.route("/api/booking", methods=["POST"])
 def api_booking():
+    from linebot.models import FlexSendMessage, TextSendMessage
+
     try:
         data = request.get_json(force=True)
-        log.info(f"[api_booking] 收到資料: {data}")
+        log.info("[api_booking] 收到資料: %s", logs.payload(data))
 
         user_id     = data.get("userId")
         displayName = data.get("displayName", "")
@@ -568,70 +783,54 @@ def api_booking():
             log.error("[api_booking] 缺少 userId")
             return jsonify({"status": "error", "message": "missing userId"}), 400
 
+        # LIFF 前端已帶 displayName，順便更新名稱快取（users 和 bookings 一起寫）
+        profiles.put(user_id, displayName, write_through=False)
+
         # ---------------- 時段轉中文 ----------------
         timeslot_cn = TIMESLOT_MAP.get(timeslot, timeslot)
 
-        # ---------------- Firestore ----------------
-        db.collection("bookings").document().set({
-            "userId": user_id,
-            "displayName": displayName,
-            "name": name,
-            "phone": phone,
-            "timeslot": timeslot,
-            "timeslot_cn": timeslot_cn,
-            "houseId": house_id,
-            "houseTitle": house_title,
-            "created_at": firestore.SERVER_TIMESTAMP
-        })
+        # ---------------- Firestore：bookings + users 一次 batch commit ----------------
+        with repo.pipeline() as p:
+            repo.bookings.add({
+                "userId": user_id,
+                "displayName": displayName,
+                "name": name,
+                "phone": phone,
+                "timeslot": timeslot,
+                "timeslot_cn": timeslot_cn,
+                "houseId": house_id,
+                "houseTitle": house_title,
+                "created_at": firestore.SERVER_TIMESTAMP
+            }, pipeline=p)
+            if displayName:
+                repo.users.set(user_id, user_doc(user_id, displayName), merge=True, pipeline=p)
         log.info("[api_booking] ✅ Firestore 寫入成功")
 
         # ---------------- Flex 卡片：回覆使用者 ----------------
-        booking_card = {
-            "type": "bubble",
-            "size": "mega",
-            "body": {
-                "type": "box",
-                "layout": "vertical",
-                "spacing": "md",
-                "contents": [
-                    {"type": "text", "text": "✅ 預約成功！", "weight": "bold", "size": "lg", "color": "#EB941E"},
-                    {"type": "text", "text": f"物件：{house_title}", "wrap": True},
-                    {"type": "text", "text": f"姓名：{name}", "wrap": True},
-                    {"type": "text", "text": f"電話：{phone}", "wrap": True},
-                    {"type": "text", "text": f"時段：{timeslot_cn}", "wrap": True},
-                    {"type": "separator", "margin": "md"},
-                    {"type": "text", "text": "我們將盡快與您聯繫 🙏", "align": "center", "color": "#555555", "size": "sm"}
-                ]
-            }
-        }
+        booking_card = ft.booking_success_card(house_title, name, phone, timeslot_cn)
 
         # ---------------- Push 給使用者 ----------------
         try:
-            line_bot_api.push_message(
+            outbox.push(
                 user_id,
-                FlexSendMessage(alt_text="預約成功！", contents=booking_card)
+                FlexSendMessage(alt_text="預約成功！", contents=booking_card),
+                tag="api_booking"
             )
-            log.info(f"[api_booking] ✅ Push 成功 user_id={user_id}")
+            log.info("[api_booking] ✅ 已排入推播 user_id=%s", user_id)
         except Exception as e:
-            log.exception(f"[api_booking] ❌ Push 失敗 user_id={user_id}, error={e}")
+            log.exception("[api_booking] ❌ Push 失敗 user_id=%s, error=%s", user_id, e)
 
         # ---------------- Push 給房仲 ----------------
         try:
             agent_id = os.getenv("AGENT_LINE_USER_ID")  # 在 .env.local / .env.prod 裡設定
             if agent_id:
-                agent_message = (
-                    f"📢 有人預約囉！\n\n"
-                    f"🏠 物件：{house_title}\n"
-                    f"👤 姓名：{name}\n"
-                    f"📞 電話：{phone}\n"
-                    f"🕒 時段：{timeslot_cn}"
-                )
-                line_bot_api.push_message(agent_id, TextSendMessage(text=agent_message))
-                log.info(f"[api_booking] ✅ 已通知房仲 agent_id={agent_id}")
+                agent_message = ft.booking_agent_text(house_title, name, phone, timeslot_cn)
+                outbox.push(agent_id, TextSendMessage(text=agent_message), tag="api_booking:agent")
+                log.info("[api_booking] ✅ 已排入房仲通知 agent_id=%s", agent_id)
             else:
                 log.warning("[api_booking] ⚠️ 沒有設定 AGENT_LINE_USER_ID")
         except Exception as e:
-            log.exception(f"[api_booking] ❌ 通知房仲失敗 error={e}")
+            log.exception("[api_booking] ❌ 通知房仲失敗 error=%s", e)
 
         return jsonify({"status": "success"}), 200
 
@@ -649,9 +848,79 @@ def debug_agent():
     else:
         return "❌ 沒有讀到 AGENT_LINE_USER_ID，請檢查 .env"
     
+# -------------------- 相同訊息合併 multicast --------------------
+from fanout import Fanout
+
+fanout = Fanout(line_raw, push_one=lambda user_id, message: outbox.push(user_id, message, tag="fanout"))
+
+@app.route("/debug/fanout")
+def debug_fanout():
+    return jsonify(fanout.stats())
+
+# -------------------- 追蹤條件比對 (新上架物件搶先通知) --------------------
+from subscriptions import SubscriptionIndex, SubscriptionNotifier
+
+subscription_index = SubscriptionIndex(Lazy(lambda: db.collection("forms"), "collection:forms"))
+
+def _deliver_new_listings(pairs):
+    # 符合物件相同的使用者會得到位元組完全相同的訊息 → 合併成 multicast
+    # 回傳送不出去的 user_id，讓 notifier 釋放通知紀錄，下次變動時可以再通知
+    failed = []
+    fanout.deliver(((user_id, ft.freeze_flex("新上架物件通知", carousel)) for user_id, carousel in pairs),
+                   on_failed=failed.extend)
+    return failed
+
+# 通知執行緒池在 warmup（或第一次有物件變動）時才建立
+subscription_notifier = Lazy(lambda: SubscriptionNotifier(
+    subscription_index,
+    listing_cards.get,
+    _deliver_new_listings,
+    claims_col=Lazy(lambda: db.collection("notifications"), "collection:notifications"),
+), "subscription_notifier")
+
+def _notify_subscribers(changes, version):
+    subscription_notifier.on_listing_changes(changes, version)
+
+# seed_listings.py 或其他程式寫入 listings 都會經過索引監聽器 → 比對追蹤條件
+SUBSCRIPTION_NOTIFY_ENABLED = LISTING_INDEX_ENABLED and os.getenv("SUBSCRIPTION_NOTIFY_ENABLED", "1") == "1"
+if SUBSCRIPTION_NOTIFY_ENABLED:
+    listing_index.add_listener(_notify_subscribers)
+
+@app.route("/debug/subscriptions")
+def debug_subscriptions():
+    if not subscription_notifier.ready:
+        return jsonify({"ready": False, "subscriptions": len(subscription_index)})
+    return jsonify(subscription_notifier.stats())
+
+@app.route("/debug/outbox")
+def debug_outbox():
+    return jsonify(outbox.stats())
+
+@app.route("/debug/repository")
+def debug_repository():
+    return jsonify(round_trip_totals())
+
+@app.route("/debug/cache")
+def debug_cache():
+    shared = shared_cache.get()
+    return jsonify({
+        "listing_detail": _detail_cache.stats(),
+        "shared": shared.stats() if shared is not None else None,
+    })
+
+@app.route("/debug/render")
+def debug_render():
+    return jsonify({"listing_card": listing_cards.stats(), "property_flex": detail_cards.stats()})
+
+@app.route("/debug/profiles")
+def debug_profiles():
+    return jsonify(profiles.stats())
+
 # -------------------- 測試 --------------------
 @app.route("/debug/push/<user_id>")
 def debug_push(user_id):
+    from linebot.models import TextSendMessage
+
     try:
         line_bot_api.push_message(
             user_id,
@@ -663,18 +932,18 @@ def debug_push(user_id):
 
 
 # -------------------- PostbackEvent (物件詳情) --------------------
-from flex_templates import property_flex
-
-@handler.add(PostbackEvent)
+@handlers.add("PostbackEvent")
 def handle_postback(event):
+    from linebot.models import FlexSendMessage, TextSendMessage
+
     data = event.postback.data
-    log.info(f"[PostbackEvent] data={data}")
+    log.info("[PostbackEvent] data=%s", data)
 
     params = parse_qs(data or "")
     action = (params.get("action") or [None])[0]
     house_id = (params.get("id") or [None])[0]
 
-    log.info(f"[PostbackEvent] action={action}, house_id={house_id}")
+    log.info("[PostbackEvent] action=%s, house_id=%s", action, house_id)
 
     if action == "detail" and house_id:
         user_id = getattr(event.source, "user_id", None)
@@ -682,20 +951,15 @@ def handle_postback(event):
         if source_type == "user" and user_id:
             send_loading_animation_async(user_id, 5)
 
-        cache_key = f"listing:{house_id}"
-        house = _detail_cache.get(cache_key)
+        house = listing_index.get(house_id) if listing_index.ready else _detail_cache.get(house_id)
         if house is None:
-            doc = db.collection("listings").document(house_id).get()
-            if not doc.exists:
-                line_bot_api.reply_message(event.reply_token, TextSendMessage(text="❌ 找不到物件資訊"))
-                return
-            house = doc.to_dict() or {}
-            _detail_cache.set(cache_key, house)
+            line_bot_api.reply_message(event.reply_token, TextSendMessage(text="❌ 找不到物件資訊"))
+            return
 
         try:
-            flex_json = property_flex(house_id, house)
+            flex_json = detail_cards.get(house_id, house)
         except Exception as e:
-            log.error(f"[PostbackEvent] property_flex error: {e}")
+            log.error("[PostbackEvent] property_flex error: %s", e)
             line_bot_api.reply_message(event.reply_token, TextSendMessage(text="❌ 物件詳情載入失敗"))
             return
 
@@ -707,6 +971,29 @@ def handle_postback(event):
             )
         )
 
+# -------------------- Webhook 事件分派 --------------------
+dispatcher = Lazy(lambda: WebhookDispatcher(
+    webhook_parser.get(),
+    handlers,
+    workers=int(os.getenv("WEBHOOK_WORKERS", 8)),
+    maxsize=int(os.getenv("WEBHOOK_QUEUE_MAXSIZE", 1000)),
+    put_timeout=float(os.getenv("WEBHOOK_PUT_TIMEOUT", 0.2)),
+), "webhook_dispatcher")
+
+@app.route("/debug/webhook")
+def debug_webhook():
+    return jsonify(dispatcher.stats())
+
+# 佇列深度在 /metrics 抓取時才讀
+# 還沒建立的佇列不輸出（回傳 None），抓取 /metrics 不會觸發初始化
+metrics.gauge("webhook_queue_depth", "webhook 事件佇列長度", lambda: dispatcher.depth() if dispatcher.ready else None)
+metrics.gauge("outbox_queue_depth", "推播佇列長度", lambda: outbox.depth() if outbox.ready else None)
+metrics.gauge("outbox_dropped", "推播佇列已滿而丟棄的筆數", lambda: outbox.dropped() if outbox.ready else None)
+metrics.gauge("write_behind_pending", "search_logs 尚未寫入的筆數",
+              lambda: search_log_buffer.stats()["pending"] if search_log_buffer.ready else None)
+metrics.gauge("log_queue_depth", "尚未寫出的 log 筆數", lambda: logs.stats().get("queued"))
+metrics.gauge("log_records_dropped", "log 佇列已滿而丟棄的筆數", lambda: logs.stats().get("dropped"))
+
 # -------------------- 基礎路由 --------------------
 @app.route("/", methods=["GET"])
 def index():
@@ -714,18 +1001,41 @@ def index():
 
 @app.route("/healthz", methods=["GET"])
 def healthz():
+    # 不碰 Firestore / LINE：冷啟動時也要在 STARTUP_BUDGET_MS 內回應
     return "ok"
 
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """warmup 完成前回 503，讓負載平衡器 / startup probe 知道還在預熱"""
+    if _warmup_done.is_set():
+        return "ready"
+    return "warming up", 503
+
+@app.route("/debug/logs")
+def debug_logs():
+    return jsonify(logs.stats())
+
+@app.route("/debug/startup")
+def debug_startup():
+    report = STARTUP.summary()
+    report.update({"budget_ms": STARTUP_BUDGET_MS, "warmup_mode": WARMUP_MODE, "ready": _warmup_done.is_set()})
+    return jsonify(report)
+
 @app.route("/callback", methods=["POST"])
 def callback():
+    from linebot.exceptions import InvalidSignatureError
+
     signature = request.headers.get("X-Line-Signature", "")
     body = request.get_data(as_text=True)
-    log.info(f"[callback] body={body}")  # ✅ debug log
+    # 超過 LOG_PAYLOAD_MAX_CHARS 的 body 只抽樣輸出（截斷），其餘只記長度
+    log.info("[callback] body=%s", logs.payload(body))
     try:
-        handler.handle(body, signature)
+        # 驗證簽章後事件交給背景 worker，立即回 200 給 LINE
+        count = dispatcher.dispatch(body, signature)
     except InvalidSignatureError:
         log.error("[callback] Invalid signature")
         abort(400)
+    log.info("[callback] 已排入 %s 個事件", count)
     return "OK"
 
 #--------------  UptimeRobot  ---------------
@@ -733,6 +1043,65 @@ def callback():
 def health():
     return "OK", 200
 
+# -------------------- 預熱 (warmup) --------------------
+# background: import 完就在背景預熱（預設）；eager: import 時同步預熱；off: 完全等第一次使用
+WARMUP_MODE = os.getenv("WARMUP_MODE", "background")
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", 1000))
+_warmup_done = threading.Event()
+_warmup_lock = threading.Lock()
+
+def warmup():
+    """
+    建立 Firestore / LINE client、HTTP session 與各佇列，開始監聽 listings / forms，凍結固定卡片。
+    可以重複呼叫（例如 gunicorn post_fork 後再呼叫一次）；已建立的東西不會重建。
+    """
+    with _warmup_lock, STARTUP.phase("warmup"):
+        for lazy in (db, firestore, line_bot_api, _session, _executor, outbox, dispatcher, profiles,
+                     search_log_buffer, shared_cache):
+            lazy.get()
+        if LISTING_INDEX_ENABLED:
+            listing_index.start()
+        if SUBSCRIPTION_NOTIFY_ENABLED:
+            subscription_notifier.get()
+            subscription_index.start()
+        warm_frozen_cards()
+    _warmup_done.set()
+    STARTUP.mark("warmup_done")
+
+def _warmup_in_background():
+    try:
+        warmup()
+    except Exception:
+        # 預熱失敗不影響啟動，第一次使用時會再初始化一次
+        log.exception("[startup] ❌ warmup 失敗")
+
+def start_background_warmup():
+    threading.Thread(target=_warmup_in_background, name="warmup", daemon=True).start()
+
+def reset_after_fork():
+    """
+    gunicorn --preload 的 post_fork 呼叫（gunicorn.conf.py）。
+    master import app 時建立的 Lazy 實體、共用快取的輪詢執行緒都不能帶進 worker，這裡丟掉讓 worker 自己重建。
+    """
+    global _warmup_lock
+    if _warmup_done.is_set():
+        # Firestore 監聽已在 master 啟動，子行程收不到更新；gunicorn.conf.py 會強制 master 不預熱
+        log.warning("[startup] ⚠️ master 已經 warmup 過，listings / forms 監聽不會在 worker 內更新")
+    _warmup_lock = threading.Lock()
+    logs.after_fork()
+    # shared_cache 也是 Lazy：worker 第一次使用時重新開檔並啟動自己的輪詢執行緒
+    names = reset_all()
+    log.info("[startup] fork 後重建 pid=%s reset=%s", os.getpid(), names)
+
+_import_ms = STARTUP.mark("import_done")
+if _import_ms > STARTUP_BUDGET_MS:
+    log.warning("[startup] ⚠️ import 花了 %.0fms，超過 STARTUP_BUDGET_MS=%.0fms", _import_ms, STARTUP_BUDGET_MS)
+
+if WARMUP_MODE == "eager":
+    warmup()
+elif WARMUP_MODE == "background":
+    start_background_warmup()
+
 # -------------------- 啟動 --------------------
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", 5000)), debug=True)
@@ -0,0 +1,748 @@
+# asgi.py
+"""
+ASGI 模式：webhook 與 LIFF 表單走 asyncio（line-bot-sdk v3 AsyncMessagingApi + Firestore AsyncClient）
+
+  uvicorn asgi:app --host 0.0.0.0 --port $PORT
+  gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app
+
+等 LINE / Firestore 回應時不佔執行緒，一個行程可以同時掛著數百個 webhook 事件與表單請求。
+非同步處理的路由：
+  POST /callback        驗簽後每個事件一個 asyncio task，立即回 200
+  POST /submit_form、/submit_search、/submit_entrust、/api/booking
+  GET  /healthz、/readyz、/metrics
+其他路由（LIFF 頁面、/debug/*…）照舊交給 app.py 的 Flask app，在執行緒池裡執行。
+記憶體索引、Flex 快取、使用者名稱快取、search_logs write-behind 與 Flask 版共用（import app）。
+
+環境變數：
+  ASGI_MAX_INFLIGHT       同時處理中的 webhook 事件 / 推播上限，預設 500（超過的排隊等待）
+  ASGI_LINE_CONNECTIONS   連到 LINE API 的連線數上限，預設 100（SDK 預設是 CPU 數 × 5）
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+# 預熱改在 lifespan startup 做（worker 內、event loop 已經啟動）
+os.environ.setdefault("WARMUP_MODE", "off")
+
+import app as flask_app  # noqa: E402
+import flex_templates as ft  # noqa: E402
+import logs  # noqa: E402
+import metrics  # noqa: E402
+from profiles import DEFAULT_NAME, user_doc  # noqa: E402
+from repository import AsyncRepository, begin_request, end_request  # noqa: E402
+from line_raw import LineApiError, _messages_body, error_details  # noqa: E402
+from search_query import parse_budget, parse_room, MAX_RESULTS  # noqa: E402
+
+log = logging.getLogger("asgi")
+
+MAX_INFLIGHT = int(os.getenv("ASGI_MAX_INFLIGHT", 500))
+LINE_CONNECTIONS = int(os.getenv("ASGI_LINE_CONNECTIONS", 100))
+PUSH_MAX_RETRIES = 3
+
+
+# -------------------- LINE Messaging API (v3 async) --------------------
+def _flex(alt_text: str, contents: dict) -> Dict[str, Any]:
+    return {"type": "flex", "altText": alt_text, "contents": contents}
+
+
+def _text(text: str, **extra) -> Dict[str, Any]:
+    return {"type": "text", "text": text, **extra}
+
+
+def _status_of(e: Exception) -> Optional[int]:
+    return getattr(e, "status", None) or getattr(e, "status_code", None)
+
+
+class AsyncLine:
+    """
+    AsyncMessagingApi 的薄包裝，並記錄 /metrics。
+    reply / push 跟 line_raw 一樣直接送預先序列化的 JSON（走 SDK 同一個 aiohttp session）：
+    SDK 的 ReplyMessageRequest.from_dict 會把整個 Flex carousel 轉成 pydantic model 再序列化回去，
+    在 event loop 上這段 CPU 時間會拖慢其他所有請求。
+    """
+
+    def __init__(self, access_token: str, endpoint: str, connections: int = LINE_CONNECTIONS):
+        import aiohttp
+        from linebot.v3.messaging import AsyncApiClient, AsyncMessagingApi, Configuration
+
+        configuration = Configuration(access_token=access_token, host=endpoint)
+        configuration.connection_pool_maxsize = connections
+        # AsyncApiClient 建構時就會建立 aiohttp session，必須在 event loop 裡呼叫
+        self._client = AsyncApiClient(configuration)
+        self._api = AsyncMessagingApi(self._client)
+        self._session = self._client.rest_client.pool_manager
+        self._token = access_token
+        self.endpoint = endpoint.rstrip("/")
+        # 與 line_raw 的 (1, 5) 相同：連線 1 秒、整個請求 5 秒
+        self._timeout = aiohttp.ClientTimeout(total=5, connect=1)
+
+    async def close(self):
+        await self._client.close()
+
+    async def _call(self, api: str, coro: Awaitable):
+        started = time.perf_counter()
+        try:
+            result = await coro
+        except Exception as e:
+            metrics.LINE_API_ERRORS.labels(api, _status_of(e) or type(e).__name__).inc()
+            raise
+        finally:
+            metrics.LINE_API_SECONDS.labels(api).observe(time.perf_counter() - started)
+        return result
+
+    async def _post(self, path: str, body: str, api: str, retry_key: Optional[str] = None):
+        """與 line_raw.RawMessagingClient._post 相同（api 是 metrics 標籤）"""
+        headers = {"Authorization": f"Bearer {self._token}", "Content-Type": "application/json"}
+        if retry_key:
+            headers["X-Line-Retry-Key"] = retry_key
+        started = time.perf_counter()
+        try:
+            async with self._session.post(self.endpoint + path, data=body.encode("utf-8"), headers=headers,
+                                          timeout=self._timeout) as r:
+                text = await r.text()
+        except Exception as e:
+            metrics.observe_line_api(api, time.perf_counter() - started)
+            metrics.LINE_API_ERRORS.labels(api, type(e).__name__).inc()
+            raise
+        metrics.observe_line_api(api, time.perf_counter() - started, r.status)
+        if r.status // 100 != 2:
+            raise LineApiError(r.status, text[:200], error_details(text))
+
+    async def reply(self, reply_token: str, messages):
+        body = '{"replyToken":' + json.dumps(reply_token) + ',"messages":' + _messages_body(messages) + "}"
+        await self._post("/v2/bot/message/reply", body, "reply_message")
+
+    async def push(self, to: str, messages, retry_key: Optional[str] = None):
+        body = '{"to":' + json.dumps(to) + ',"messages":' + _messages_body(messages) + "}"
+        await self._post("/v2/bot/message/push", body, "push_message", retry_key=retry_key)
+
+    async def get_profile(self, user_id: str):
+        return await self._call("get_profile", self._api.get_profile(user_id))
+
+    async def show_loading(self, chat_id: str, seconds: int = 5):
+        from linebot.v3.messaging import ShowLoadingAnimationRequest
+
+        s = max(5, min(60, int(round((seconds or 5) / 5.0) * 5)))
+        request = ShowLoadingAnimationRequest(chat_id=chat_id, loading_seconds=s)
+        return await self._call("show_loading_animation", self._api.show_loading_animation(request))
+
+
+# -------------------- 執行期狀態 --------------------
+class Runtime:
+    """lifespan startup 時建立（aiohttp session、gRPC aio channel 都要綁在執行中的 event loop 上）"""
+
+    def __init__(self):
+        self.line: Optional[AsyncLine] = None
+        self.repo: Optional[AsyncRepository] = None
+        self.inflight: Optional[asyncio.Semaphore] = None
+        self.tasks: set = set()
+        self.profile_fetches: Dict[str, asyncio.Task] = {}
+        self.parser = None
+
+    async def start(self):
+        from linebot.v3 import WebhookParser
+
+        self.parser = WebhookParser(flask_app.LINE_CHANNEL_SECRET)
+        self.line = AsyncLine(flask_app.LINE_CHANNEL_ACCESS_TOKEN, flask_app.LINE_API_ENDPOINT)
+        loop = asyncio.get_running_loop()
+        # 同步 client / firestore 模組 / 名稱快取第一次使用會初始化 firebase（gRPC），不能在 event loop 上做
+        await loop.run_in_executor(None, _init_sync_clients)
+        self.repo = AsyncRepository(_init_async_firestore())
+        self.inflight = asyncio.Semaphore(MAX_INFLIGHT)
+        # 記憶體索引 / 監聽器 / 固定卡片照 Flask 版的 warmup 建立（會用到同步 client，放到執行緒裡）
+        loop.run_in_executor(None, flask_app._warmup_in_background)
+
+    async def stop(self):
+        if self.tasks:
+            await asyncio.wait(list(self.tasks), timeout=10)
+        if self.line is not None:
+            await self.line.close()
+
+    def spawn(self, coro: Awaitable, name: str):
+        """背景 task：同時執行數受 ASGI_MAX_INFLIGHT 限制，例外只記 log"""
+        async def run():
+            async with self.inflight:
+                try:
+                    await coro
+                except Exception:
+                    log.exception("[asgi] ❌ %s 失敗", name)
+
+        task = asyncio.get_running_loop().create_task(run(), name=name)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+
+def _init_sync_clients():
+    flask_app.db.get()
+    flask_app.firestore.get()
+    flask_app.profiles.get()
+
+
+def _init_async_firestore():
+    """_init_sync_clients 之後呼叫（firebase app 已初始化）；AsyncClient 的 gRPC aio channel 要在 event loop 上建立"""
+    if flask_app.FIRESTORE_BACKEND == "memory":
+        import fake_firestore
+        # 與同步 client 共用資料，on_snapshot 索引才看得到 async 寫入
+        return fake_firestore.async_client(flask_app.db.get())
+    from firebase_admin import firestore_async
+    return firestore_async.client()
+
+
+async def _in_thread(func, *args):
+    """同步的 Firestore / SQLite 呼叫放到預設執行緒池，不佔住 event loop"""
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+rt = Runtime()
+metrics.gauge("asgi_inflight_tasks", "ASGI 模式處理中的背景 task 數", lambda: len(rt.tasks))
+
+
+def push_later(to: str, messages, tag: str):
+    """取代 outbox.push：背景送出，429 / 5xx / 連線錯誤以同一個 retry key 重試（409 代表已送達）"""
+    retry_key = str(uuid.uuid4())
+
+    async def send():
+        for attempt in range(PUSH_MAX_RETRIES + 1):
+            try:
+                await rt.line.push(to, messages, retry_key=retry_key)
+                return
+            except Exception as e:
+                status = _status_of(e)
+                if status == 409:
+                    return
+                retriable = status is None or status == 429 or status >= 500
+                if not retriable or attempt == PUSH_MAX_RETRIES:
+                    log.error("[asgi] ❌ push 失敗 tag=%s to=%s status=%s: %s", tag, to, status, e)
+                    return
+                await asyncio.sleep(min(8.0, 0.5 * 2 ** attempt))
+
+    rt.spawn(send(), name=f"push:{tag}")
+
+
+async def _fetch_profile(user_id: str):
+    profile = await rt.line.get_profile(user_id)
+    name = profile.display_name
+    # 快取由 ProfileResolver 管，users 改用 AsyncClient 寫
+    flask_app.profiles.put(user_id, name, write_through=False)
+    log.info("[asgi] 更新名稱 user_id=%s name=%s", user_id, name)
+    await rt.repo.users.set(user_id, user_doc(user_id, name, getattr(profile, "picture_url", None)), merge=True)
+
+
+def fetch_profile(user_id: Optional[str]) -> Optional[asyncio.Task]:
+    """用 AsyncLine.get_profile 在背景更新名稱；同一個 user_id 同時只抓一次"""
+    if not user_id:
+        return None
+    task = rt.profile_fetches.get(user_id)
+    if task is None:
+        task = rt.spawn(_fetch_profile(user_id), name=f"get_profile:{user_id}")
+        rt.profile_fetches[user_id] = task
+        task.add_done_callback(lambda _: rt.profile_fetches.pop(user_id, None))
+    return task
+
+
+async def display_name(user_id: str) -> str:
+    """名稱快取 → AsyncClient 讀 users → get_profile 最多等 fetch_timeout 秒（與 ProfileResolver.display_name 相同順序）"""
+    profiles = flask_app.profiles
+    name, fresh = profiles.lookup(user_id)
+    if name is not None:
+        if not fresh:
+            fetch_profile(user_id)
+        return name
+    try:
+        data = await rt.repo.users.get(user_id)
+    except Exception as e:
+        log.warning("[asgi] 讀取 users 失敗 user_id=%s: %s", user_id, e)
+        data = None
+    name = profiles.accept_stored(user_id, data, refresh=False)
+    if name:
+        if not profiles.lookup(user_id)[1]:
+            fetch_profile(user_id)
+        return name
+    task = fetch_profile(user_id)
+    if profiles.fetch_timeout > 0:
+        try:
+            await asyncio.wait_for(asyncio.shield(task), profiles.fetch_timeout)
+        except asyncio.TimeoutError:
+            log.warning("[asgi] get_profile 超過 %.1fs，先用預設名稱 user_id=%s", profiles.fetch_timeout, user_id)
+        name = profiles.lookup(user_id)[0]
+    return name or DEFAULT_NAME
+
+
+async def warm_profile(user_id: Optional[str]):
+    """對應 profiles.warm()：快取沒有或過期才抓"""
+    if user_id and not flask_app.profiles.lookup(user_id)[1]:
+        await display_name(user_id)
+
+
+# -------------------- Webhook 事件 --------------------
+async def handle_message(event):
+    msg = event.message.text.strip()
+    user_id = event.source.user_id
+    log.info("[asgi.handle_message] 收到訊息: %r user_id=%s", msg, user_id)
+    rt.spawn(warm_profile(user_id), name="warm_profile")
+
+    if msg == "中壢夜市生活圈精選":
+        top = await _in_thread(flask_app.top_carousel.get)
+        await rt.line.reply(event.reply_token, top or _text("目前沒有精選物件 🙏"))
+    elif msg == "我要賣房":
+        await rt.line.reply(event.reply_token, ft.frozen_flex("seller_card", "行情評估"))
+    elif msg == "立即找房":
+        await rt.line.reply(event.reply_token, ft.frozen_flex("search_card", "立即找房"))
+    elif msg == "你的介紹":
+        await rt.line.reply(event.reply_token, ft.frozen_flex("intro_card", "買房找我"))
+    elif msg == "管理我的追蹤條件":
+        data = await rt.repo.forms.get(user_id)
+        if data is not None:
+            card = ft.manage_condition_card(data.get("budget", "-"), data.get("room", "-"),
+                                            data.get("genre", "-"), flask_app.LIFF_URL_SUBSCRIBE)
+            await rt.line.reply(event.reply_token, _flex("管理我的追蹤條件", card))
+        else:
+            await rt.line.reply(event.reply_token,
+                                ft.frozen_flex("buyer_card", "需求條件", flask_app.LIFF_URL_SUBSCRIBE))
+
+
+async def handle_follow(event):
+    fetch_profile(getattr(event.source, "user_id", None))
+    quick_reply = {"items": [
+        {"type": "action", "action": {"type": "message", "label": "立即找房", "text": "立即找房"}},
+        {"type": "action", "action": {"type": "message", "label": "委託賣房", "text": "我要賣房"}},
+    ]}
+    await rt.line.reply(event.reply_token, _text(flask_app.WELCOME_TEXT, quickReply=quick_reply))
+
+
+async def handle_postback(event):
+    params = parse_qs(event.postback.data or "")
+    action = (params.get("action") or [None])[0]
+    house_id = (params.get("id") or [None])[0]
+    log.info("[asgi.PostbackEvent] action=%s, house_id=%s", action, house_id)
+    if action != "detail" or not house_id:
+        return
+
+    user_id = getattr(event.source, "user_id", None)
+    if getattr(event.source, "type", None) == "user" and user_id:
+        rt.spawn(rt.line.show_loading(user_id, 5), name="loading")
+
+    index = flask_app.listing_index
+    house = index.get(house_id) if index.ready else await rt.repo.listings.get(house_id)
+    if house is None:
+        await rt.line.reply(event.reply_token, _text("❌ 找不到物件資訊"))
+        return
+    try:
+        flex_json = await _in_thread(flask_app.detail_cards.get, house_id, house)
+    except Exception as e:
+        log.error("[asgi.PostbackEvent] property_flex error: %s", e)
+        await rt.line.reply(event.reply_token, _text("❌ 物件詳情載入失敗"))
+        return
+    await rt.line.reply(event.reply_token, _flex(f"物件詳情：{house.get('title', house_id)}", flex_json))
+
+
+EVENT_HANDLERS: Dict[str, Callable[[Any], Awaitable]] = {
+    "MessageEvent": handle_message,
+    "FollowEvent": handle_follow,
+    "PostbackEvent": handle_postback,
+}
+
+
+async def run_event(event):
+    kind = type(event).__name__
+    func = EVENT_HANDLERS.get(kind)
+    if kind == "MessageEvent" and type(getattr(event, "message", None)).__name__ != "TextMessageContent":
+        func = None
+    if func is None:
+        return
+    started = time.perf_counter()
+    try:
+        await func(event)
+    except Exception:
+        metrics.WEBHOOK_EVENT_ERRORS.labels(kind).inc()
+        log.exception("[asgi] ❌ %s 處理失敗", kind)
+    finally:
+        metrics.WEBHOOK_EVENT_SECONDS.labels(kind).observe(time.perf_counter() - started)
+
+
+# -------------------- HTTP --------------------
+class Request:
+    def __init__(self, scope, body: bytes):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        self.body = body
+
+    def json(self) -> Optional[dict]:
+        try:
+            data = json.loads(self.body or b"null")
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+    def json_or_form(self) -> dict:
+        """對應 Flask 版的 request.get_json(force=True, silent=True) or request.form.to_dict()"""
+        data = self.json()
+        if data:
+            return data
+        if self.headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
+            return {k: v[0] for k, v in parse_qs(self.body.decode("utf-8")).items()}
+        return {}
+
+
+Response = Tuple[int, Any, str]
+
+
+def _json(payload: Any, status: int = 200) -> Response:
+    return status, json.dumps(payload, ensure_ascii=False), "application/json"
+
+
+async def callback(req: Request) -> Response:
+    from linebot.v3.exceptions import InvalidSignatureError
+
+    signature = req.headers.get("x-line-signature", "")
+    try:
+        events = rt.parser.parse(req.body.decode("utf-8"), signature)
+    except InvalidSignatureError:
+        log.error("[asgi.callback] Invalid signature")
+        return 400, "Bad Request", "text/plain; charset=utf-8"
+    for event in events:
+        rt.spawn(run_event(event), name=f"event:{type(event).__name__}")
+    log.info("[asgi.callback] 已排入 %s 個事件", len(events))
+    return 200, "OK", "text/plain; charset=utf-8"
+
+
+async def submit_form(req: Request) -> Response:
+    try:
+        data = req.json_or_form()
+        budget, room, genre = data.get("budget"), data.get("room"), data.get("genre")
+        user_id = data.get("user_id")
+        if not user_id:
+            return _json({"status": "error", "message": "missing user_id"}, 400)
+
+        name = await display_name(user_id)
+        payload = {
+            "budget": budget,
+            "room": room,
+            "genre": genre,
+            "user_id": user_id,
+            "user_name": name,
+            "updated_at": flask_app.firestore.SERVER_TIMESTAMP,
+        }
+        index = flask_app.subscription_index
+        created = await rt.repo.forms.create_or_update(
+            user_id, payload,
+            on_create={"created_at": flask_app.firestore.SERVER_TIMESTAMP},
+            exists_hint=(user_id in index) if index.ready else None,
+        )
+        title = "🎉 追蹤成功！" if created else "條件已更新"
+        card = ft.manage_condition_card(budget, room, genre, flask_app.LIFF_URL_SUBSCRIBE)
+        push_later(user_id, _flex(title, card), tag="submit_form")
+        return _json({"status": "success"})
+    except Exception as e:
+        log.exception("[asgi.submit_form] error")
+        return _json({"status": "error", "message": str(e)}, 500)
+
+
+def _listing_bubbles(items) -> List[dict]:
+    """listing_cards 可能查 SQLite 共用快取，整批在執行緒裡做"""
+    bubbles = []
+    for doc_id, data in items:
+        try:
+            bubbles.append(flask_app.listing_cards.get(doc_id, data))
+        except Exception as e:
+            log.error("[asgi.submit_search] listing_card 失敗 doc_id=%s, error=%s", doc_id, e)
+    return bubbles
+
+
+async def submit_search(req: Request) -> Response:
+    try:
+        data = req.json()
+        if data is None:
+            raise ValueError("invalid JSON body")
+        user_id = data.get("user_id")
+        budget, room, genre = data.get("budget"), data.get("room"), data.get("genre")
+        if not user_id:
+            return _json({"status": "error", "message": "❌ 缺少 user_id"}, 400)
+
+        name = await display_name(user_id)
+        min_budget, max_budget = parse_budget(budget)
+        room_int = parse_room(room)
+
+        index = flask_app.listing_index
+        if index.ready:
+            items = index.search(room=room_int, genre=genre or None, min_price=min_budget, max_price=max_budget,
+                                 limit=MAX_RESULTS)
+        else:
+            items = await rt.repo.listings.search(room=room_int, genre=genre or None, min_budget=min_budget,
+                                                  max_budget=max_budget, limit=MAX_RESULTS)
+
+        bubbles = await _in_thread(_listing_bubbles, items)
+
+        if not bubbles:
+            form_url = flask_app.LIFF_URL_SUBSCRIBE if flask_app.LIFF_ID_SUBSCRIBE else "#"
+            push_later(user_id, ft.frozen_flex("no_result_card", "搜尋結果", form_url), tag="submit_search")
+        else:
+            carousel = {"type": "carousel", "contents": bubbles[:MAX_RESULTS]}
+            push_later(user_id, _flex("搜尋結果", carousel), tag="submit_search")
+
+        await _in_thread(flask_app.repo.search_logs.append, {
+            "user_id": user_id,
+            "user_name": name,
+            "budget": budget,
+            "room": room or "",
+            "genre": genre or "",
+            "result_count": len(bubbles),
+            "created_at": flask_app.firestore.SERVER_TIMESTAMP,
+        })
+        return _json({"status": "ok"})
+    except Exception as e:
+        log.exception("[asgi.submit_search] error")
+        return _json({"status": "error", "message": str(e)}, 400)
+
+
+async def submit_entrust(req: Request) -> Response:
+    try:
+        data = req.json_or_form()
+        user_id = data.get("user_id")
+        area = (data.get("area") or "").strip()
+        layout = (data.get("layout") or "").strip()
+        size = (data.get("size") or "").strip()
+        phone = (data.get("phone") or "").strip()
+        if not user_id:
+            return _json({"status": "error", "message": "❌ 缺少 user_id"}, 400)
+        if not area or not layout or not size or not phone:
+            return _json({"status": "error", "message": "❌ 請完整填寫表單"}, 400)
+
+        name = await display_name(user_id)
+        await rt.repo.entrust_forms.add({
+            "user_id": user_id,
+            "user_name": name,
+            "area": area,
+            "layout": layout,
+            "size": size,
+            "phone": phone,
+            "created_at": flask_app.firestore.SERVER_TIMESTAMP,
+        })
+        push_later(user_id, _flex("收到委託資料", ft.entrust_received_card()), tag="submit_entrust")
+
+        agent_id = os.getenv("AGENT_LINE_USER_ID") or os.getenv("AGENT_USER_ID")
+        if agent_id:
+            card = ft.entrust_agent_card(name, phone, area, layout, size)
+            push_later(agent_id, _flex("🏡 新的屋主委託！", card), tag="submit_entrust:agent")
+        else:
+            log.warning("[asgi.submit_entrust] ⚠️ 沒有設定 AGENT_LINE_USER_ID")
+
+        return _json({"status": "ok",
+                      "message": "✅ 已收到你的資料囉！我們會盡快提供初估行情，幫你掌握合理售價 💬"})
+    except Exception as e:
+        log.exception("[asgi.submit_entrust] error")
+        return _json({"status": "error", "message": str(e)}, 500)
+
+
+async def api_booking(req: Request) -> Response:
+    try:
+        data = req.json()
+        if data is None:
+            raise ValueError("invalid JSON body")
+        user_id = data.get("userId")
+        display = data.get("displayName", "")
+        name = data.get("name", "")
+        phone = data.get("phone", "")
+        timeslot = data.get("timeslot", "")
+        house_id = data.get("houseId", "")
+        house_title = data.get("houseTitle", "")
+        if not user_id:
+            return _json({"status": "error", "message": "missing userId"}, 400)
+
+        # put() 會同步寫 users，這裡只更新快取，寫入交給 AsyncClient
+        flask_app.profiles.put(user_id, display, write_through=False)
+        timeslot_cn = flask_app.TIMESLOT_MAP.get(timeslot, timeslot)
+        await rt.repo.bookings.add({
+            "userId": user_id,
+            "displayName": display,
+            "name": name,
+            "phone": phone,
+            "timeslot": timeslot,
+            "timeslot_cn": timeslot_cn,
+            "houseId": house_id,
+            "houseTitle": house_title,
+            "created_at": flask_app.firestore.SERVER_TIMESTAMP,
+        })
+        if display:
+            rt.spawn(rt.repo.users.set(user_id, user_doc(user_id, display), merge=True), name="users.set")
+
+        card = ft.booking_success_card(house_title, name, phone, timeslot_cn)
+        push_later(user_id, _flex("預約成功！", card), tag="api_booking")
+        agent_id = os.getenv("AGENT_LINE_USER_ID")
+        if agent_id:
+            text = ft.booking_agent_text(house_title, name, phone, timeslot_cn)
+            push_later(agent_id, _text(text), tag="api_booking:agent")
+        else:
+            log.warning("[asgi.api_booking] ⚠️ 沒有設定 AGENT_LINE_USER_ID")
+        return _json({"status": "success"})
+    except Exception as e:
+        log.exception("[asgi.api_booking] error")
+        return _json({"status": "error", "message": str(e)}, 500)
+
+
+async def healthz(req: Request) -> Response:
+    return 200, "ok", "text/plain; charset=utf-8"
+
+
+async def readyz(req: Request) -> Response:
+    if flask_app._warmup_done.is_set() and rt.repo is not None:
+        return 200, "ready", "text/plain; charset=utf-8"
+    return 503, "warming up", "text/plain; charset=utf-8"
+
+
+async def metrics_endpoint(req: Request) -> Response:
+    return 200, metrics.render(), metrics.CONTENT_TYPE
+
+
+ROUTES: Dict[Tuple[str, str], Callable[[Request], Awaitable[Response]]] = {
+    ("POST", "/callback"): callback,
+    ("POST", "/submit_form"): submit_form,
+    ("POST", "/submit_search"): submit_search,
+    ("POST", "/submit_entrust"): submit_entrust,
+    ("POST", "/api/booking"): api_booking,
+    ("GET", "/healthz"): healthz,
+    ("GET", "/readyz"): readyz,
+    ("GET", "/metrics"): metrics_endpoint,
+}
+
+
+# -------------------- Flask 相容（其他路由） --------------------
+def _wsgi_environ(scope, body: bytes) -> Dict[str, Any]:
+    import io
+    import sys
+
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        key = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if key == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif key != "CONTENT_LENGTH":
+            key = f"HTTP_{key}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _call_wsgi(environ) -> Tuple[int, List[Tuple[bytes, bytes]], bytes]:
+    result = {}
+
+    def start_response(status, headers, exc_info=None):
+        result["status"] = int(status.split(" ", 1)[0])
+        result["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+    iterable = flask_app.app(environ, start_response)
+    try:
+        body = b"".join(iterable)
+    finally:
+        if hasattr(iterable, "close"):
+            iterable.close()
+    return result["status"], result["headers"], body
+
+
+async def _send(send, status: int, headers: List[Tuple[bytes, bytes]], body: bytes):
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+# -------------------- ASGI 進入點 --------------------
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await rt.start()
+            except Exception as e:
+                log.exception("[asgi] ❌ 啟動失敗")
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await rt.stop()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for k, v in scope.get("headers", []):
+        if k.lower() == name:
+            return v.decode("latin-1")
+    return None
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    # 背景 task 建立時會複製 context，事件 / 推播的 log 都帶著同一個 request_id
+    request_id_token = logs.set_request_id(_header(scope, b"x-request-id"))
+    try:
+        await _handle_http(scope, receive, send)
+    finally:
+        logs.reset_request_id(request_id_token)
+
+
+async def _handle_http(scope, receive, send):
+    body = await _read_body(receive)
+    request_id = logs.get_request_id()
+    handler = ROUTES.get((scope["method"], scope["path"]))
+    if handler is None:
+        # Flask 自己的 after_request 會記錄 /metrics，這裡不重複；request_id 經由 X-Request-ID 標頭傳過去
+        environ = _wsgi_environ(scope, body)
+        environ.setdefault("HTTP_X_REQUEST_ID", request_id)
+        status, headers, payload = await asyncio.get_running_loop().run_in_executor(None, _call_wsgi, environ)
+        return await _send(send, status, headers, payload)
+
+    started = time.perf_counter()
+    token = begin_request()
+    try:
+        status, payload, content_type = await handler(Request(scope, body))
+    finally:
+        counts = end_request(token)
+    data = payload.encode("utf-8") if isinstance(payload, str) else payload
+    headers = [(b"content-type", content_type.encode("latin-1")),
+               (b"content-length", str(len(data)).encode("latin-1")),
+               (b"x-firestore-round-trips", str(sum(counts.values())).encode("latin-1")),
+               (b"x-request-id", request_id.encode("latin-1"))]
+    await _send(send, status, headers, data)
+    metrics.HTTP_SECONDS.labels(scope["path"], scope["method"], status).observe(time.perf_counter() - started)
@@ -0,0 +1,140 @@
+# benchmarks/bench_normalizer.py
+"""
+匯入正規化吞吐量
+
+以 listings.csv 為樣板產生 100k 列的合成 CSV（價格 / 房數混用阿拉伯、中文、全形數字），
+分別量測：
+  legacy    舊版 seed_listings 逐列 to_number（str.replace 迴圈 + 未編譯 re.sub）
+  row       ListingNormalizer.row 逐列套用轉換表
+  iter_rows ListingNormalizer.iter_rows（seed_listings 實際使用的串流介面）
+
+用法：python benchmarks/bench_normalizer.py [--rows 100000] [--keep-csv path]
+"""
+
+import argparse
+import csv
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from listing_normalizer import ListingNormalizer  # noqa: E402
+
+PRICES = ["1,280萬", "980萬", "1億2000萬", "三千五百萬", "１５００萬", "2200", "面議", ""]
+ROOMS = ["3", "三房", "2房2廳", "4", "兩房", "1", ""]
+SIZES = ["35.5", "28坪", "四十二坪", "", "51.2"]
+
+
+def write_synthetic_csv(path: str, rows: int, seed: int = 42):
+    rnd = random.Random(seed)
+    with open(os.path.join(ROOT, "listings.csv"), newline="", encoding="utf-8-sig") as f:
+        templates = list(csv.DictReader(f))
+    fieldnames = list(templates[0].keys())
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for i in range(rows):
+            row = dict(rnd.choice(templates))
+            row["id"] = f"bench-{i:07d}"
+            row["price"] = rnd.choice(PRICES)
+            row["room"] = rnd.choice(ROOMS)
+            row["square_meters"] = rnd.choice(SIZES)
+            row["top"] = rnd.choice(["TRUE", "FALSE", ""])
+            writer.writerow(row)
+
+
+# -------------------- 舊版（改版前的 seed_listings）--------------------
+def _legacy_chinese_to_number(text):
+    mapping = {"一": "1", "二": "2", "三": "3", "四": "4", "五": "5",
+               "六": "6", "七": "7", "八": "8", "九": "9", "十": "10"}
+    for k, v in mapping.items():
+        text = text.replace(k, v)
+    return text
+
+
+def _legacy_to_number(x, default=None):
+    if x is None:
+        return default
+    try:
+        s = str(x).strip()
+        if s == "":
+            return default
+        s = _legacy_chinese_to_number(s)
+        cleaned = re.sub(r"[^0-9.]", "", s)
+        if cleaned == "":
+            return default
+        return float(cleaned) if "." in cleaned else int(cleaned)
+    except Exception:
+        return default
+
+
+def _legacy_to_bool(x):
+    if isinstance(x, bool):
+        return x
+    if x is None:
+        return False
+    return str(x).strip().lower() in ["true", "1", "yes", "y"]
+
+
+_LEGACY_TEXT = ("title", "genre", "address", "image_url", "detail1", "detail2", "project_name", "exclusive",
+                "pattern", "old", "height", "pattern_url", "video_uri", "map_uri", "text")
+
+
+def _legacy_row(item):
+    data = {k: item.get(k, "").strip() for k in _LEGACY_TEXT}
+    data["status"] = item.get("status", "active")
+    for k in ("price", "room", "square_meters", "square_meters2"):
+        data[k] = _legacy_to_number(item.get(k))
+    data["top"] = _legacy_to_bool(item.get("top"))
+    data["parking_space"] = _legacy_to_bool(item.get("parking_space"))
+    return item.get("id"), data
+
+
+# -------------------- 量測 --------------------
+def _read(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        yield from csv.DictReader(f)
+
+
+def _measure(name, items, func):
+    started = time.perf_counter()
+    n = 0
+    for _ in func(items):
+        n += 1
+    elapsed = time.perf_counter() - started
+    print(f"{name:<20} {n:>8} rows  {elapsed:7.3f}s  {n / elapsed:>10,.0f} rows/s")
+    return n / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="匯入正規化吞吐量")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--keep-csv", default=None, help="合成 CSV 存到這個路徑（預設用暫存檔）")
+    args = parser.parse_args(argv)
+
+    path = args.keep_csv or os.path.join(tempfile.mkdtemp(prefix="bench_normalizer_"), "listings.csv")
+    write_synthetic_csv(path, args.rows)
+    normalizer = ListingNormalizer()
+
+    # 只量轉換：先把 CSV 讀進記憶體
+    items = list(_read(path))
+    legacy = _measure("legacy", items, lambda rows: (_legacy_row(i) for i in rows))
+    _measure("row", items, lambda rows: (normalizer.row(i) for i in rows))
+    streamed = _measure("iter_rows", items, normalizer.iter_rows)
+    print(f"iter_rows / legacy = {streamed / legacy:.2f}x")
+
+    # 含讀檔的端到端（seed_listings 實際的串流路徑）
+    _measure("csv only", path, _read)
+    _measure("csv + iter_rows", path, lambda p: normalizer.iter_rows(_read(p)))
+
+    if not args.keep_csv:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# benchmarks/bench_workers.py
+"""
+比較 gunicorn worker 模式（sync / gthread / gevent、是否 --preload、asgi.py + uvicorn）
+
+每種設定各啟動一次 gunicorn（gunicorn.conf.py + 離線假後端），用 loadgen 打同樣的流量，
+列出吞吐量、延遲與所有 worker 的記憶體（RSS / PSS；PSS 會把 copy-on-write 共用的頁面平均分攤）。
+
+  python benchmarks/bench_workers.py
+  python benchmarks/bench_workers.py --duration 20 --concurrency 64 --line-latency-ms 80
+  python benchmarks/bench_workers.py --only gthread,gthread+preload --json workers.json
+
+假後端的延遲（--line-latency-ms / --firestore-latency-ms）用來模擬 I/O 等待；
+數字只適合互相比較，不代表正式環境的絕對值。gevent / uvicorn 需要另外 pip install。
+"""
+
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import loadgen  # noqa: E402
+
+ROOT = loadgen.ROOT
+
+# name -> (worker_class, threads, preload, app)
+CONFIGS = {
+    "sync": ("sync", 1, False, "app:app"),
+    "gthread": ("gthread", 8, False, "app:app"),
+    "gthread+preload": ("gthread", 8, True, "app:app"),
+    "gevent": ("gevent", 1, False, "app:app"),
+    "asgi": ("uvicorn.workers.UvicornWorker", 1, False, "asgi:app"),
+}
+
+
+def _children(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def _memory_kb(pid: int) -> Dict[str, int]:
+    """VmRSS 與 Pss（Linux 才有；讀不到就回空 dict）"""
+    out = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    out["rss"] = int(line.split()[1])
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    out["pss"] = int(line.split()[1])
+    except OSError:
+        pass
+    return out
+
+
+def memory_of(master_pid: int) -> Dict[str, Optional[float]]:
+    pids = [master_pid] + _children(master_pid)
+    totals = {"rss": 0, "pss": 0}
+    for pid in pids:
+        for k, v in _memory_kb(pid).items():
+            totals[k] += v
+    return {"processes": len(pids),
+            "rss_mb": round(totals["rss"] / 1024, 1) if totals["rss"] else None,
+            "pss_mb": round(totals["pss"] / 1024, 1) if totals["pss"] else None}
+
+
+def start_server(name: str, port: int, workers: int, args) -> subprocess.Popen:
+    worker_class, threads, preload, target = CONFIGS[name]
+    env = dict(os.environ)
+    env.update({
+        "PORT": str(port),
+        "GUNICORN_WORKER_CLASS": worker_class,
+        "WEB_CONCURRENCY": str(workers),
+        "GUNICORN_THREADS": str(args.threads or threads),
+        "GUNICORN_PRELOAD": "1" if preload else "0",
+        "GUNICORN_WARMUP": "eager",
+        "GUNICORN_LOG_LEVEL": "warning",
+        "FIRESTORE_BACKEND": "memory",
+        "LINE_API_BACKEND": "fake",
+        "LINE_CHANNEL_SECRET": args.secret,
+        "FAKE_LINE_LATENCY_MS": str(args.line_latency_ms),
+        "FAKE_FIRESTORE_LATENCY_MS": str(args.firestore_latency_ms),
+        # 每種設定用自己的共用快取檔，避免上一輪的資料影響結果
+        "SHARED_CACHE_PATH": os.path.join(args.tmpdir, f"bench-workers-{name}-{port}.sqlite3"),
+    })
+    cmd = [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"), target]
+    return subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                            stderr=None if args.verbose else subprocess.DEVNULL)
+
+
+def wait_ready(url: str, proc: subprocess.Popen, timeout: float) -> Optional[float]:
+    """回傳從啟動到 /healthz 回 200 的秒數；逾時或行程結束回傳 None"""
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        if proc.poll() is not None:
+            return None
+        try:
+            if requests.get(url + "/healthz", timeout=1).status_code == 200:
+                return time.monotonic() - started
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    return None
+
+
+def stop_server(proc: subprocess.Popen):
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def bench(name: str, args) -> Dict:
+    port = args.port or random.randint(20000, 40000)
+    url = f"http://127.0.0.1:{port}"
+    proc = start_server(name, port, args.workers, args)
+    try:
+        boot = wait_ready(url, proc, args.boot_timeout)
+        if boot is None:
+            return {"name": name, "error": "gunicorn 沒有啟動（gevent / uvicorn 沒安裝？加 --verbose 看 log）"}
+        time.sleep(args.settle)
+
+        traffic = loadgen.Traffic(args.users, loadgen.house_ids_from_csv(args.listings), seed=args.seed)
+        source = loadgen.generate(traffic, loadgen.parse_mix(args.mix), None)
+        rec, elapsed = loadgen.run(url, args.secret, source, args.concurrency, args.duration,
+                                   None, 0, args.timeout)
+        summary = loadgen.summarize(rec, elapsed)
+        memory = memory_of(proc.pid)
+        return {"name": name, "boot_s": round(boot, 2), "elapsed_s": round(elapsed, 1),
+                "all": summary["ALL"], "routes": summary, "memory": memory}
+    finally:
+        stop_server(proc)
+
+
+def print_table(results: List[Dict]):
+    print(f"\n{'worker 模式':<18} {'啟動':>6} {'req/s':>8} {'err':>6} {'p50':>9} {'p95':>9} {'p99':>9} "
+          f"{'RSS':>9} {'PSS':>9}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['name']:<18} ❌ {r['error']}")
+            continue
+        s, m = r["all"], r["memory"]
+        rss = f"{m['rss_mb']:.0f}MB" if m.get("rss_mb") else "-"
+        pss = f"{m['pss_mb']:.0f}MB" if m.get("pss_mb") else "-"
+        print(f"{r['name']:<18} {r['boot_s']:>5.1f}s {s['rps'] or 0:>8.1f} {s['errors']:>6} "
+              f"{s['p50_ms']:>7.1f}ms {s['p95_ms']:>7.1f}ms {s['p99_ms']:>7.1f}ms {rss:>9} {pss:>9}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="比較 gunicorn worker 模式")
+    parser.add_argument("--only", default=",".join(CONFIGS), help=f"逗號分隔（可用：{', '.join(CONFIGS)}）")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=None, help="覆寫 gthread 的執行緒數")
+    parser.add_argument("--concurrency", "-c", type=int, default=32)
+    parser.add_argument("--duration", "-d", type=float, default=15.0)
+    parser.add_argument("--mix", default=loadgen.DEFAULT_MIX)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--listings", default=os.path.join(ROOT, "listings.csv"))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--line-latency-ms", type=float, default=50.0)
+    parser.add_argument("--firestore-latency-ms", type=float, default=10.0)
+    parser.add_argument("--secret", default="fake-channel-secret")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--boot-timeout", type=float, default=60.0)
+    parser.add_argument("--settle", type=float, default=1.0, help="啟動後等幾秒再開始打（讓每個 worker 預熱完）")
+    parser.add_argument("--tmpdir", default=None, help="共用快取檔案的目錄（預設建立一個 0700 暫存目錄）")
+    parser.add_argument("--json", default=None, help="結果另存 JSON")
+    parser.add_argument("--verbose", action="store_true", help="顯示 gunicorn 的 log")
+    args = parser.parse_args(argv)
+    if args.tmpdir is None:
+        # mkdtemp 建立的目錄是 0700，共用快取拒絕放在 /tmp 這種其他人可寫入的目錄
+        args.tmpdir = tempfile.mkdtemp(prefix="bench-workers-")
+
+    names = [n.strip() for n in args.only.split(",") if n.strip()]
+    unknown = [n for n in names if n not in CONFIGS]
+    if unknown:
+        print(f"❌ 未知的設定: {', '.join(unknown)}")
+        return 1
+
+    print(f"▶️ workers={args.workers} concurrency={args.concurrency} duration={args.duration}s "
+          f"LINE 延遲 {args.line_latency_ms}ms / Firestore 延遲 {args.firestore_latency_ms}ms")
+    results = []
+    for name in names:
+        print(f"  … {name}")
+        results.append(bench(name, args))
+    print_table(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,390 @@
+# benchmarks/loadgen.py
+"""
+Webhook / LIFF 壓測工具（估算 gunicorn 要開多少 worker / thread 用）
+
+產生帶正確 X-Line-Signature 的 LINE webhook（message / postback / follow），
+以及 LIFF 表單的 /submit_search、/submit_form、/api/booking、/submit_entrust，
+依指定比例混合送出，最後列出每個 route 的吞吐量與 p50 / p95 / p99 延遲。
+
+  # 對本機 app（建議搭配 FIRESTORE_BACKEND=memory LINE_API_BACKEND=fake 啟動）
+  python benchmarks/loadgen.py --url http://127.0.0.1:5000 --duration 30 --concurrency 32
+
+  # 固定送出速率（open loop）：延遲從「預定送出時間」起算，伺服器變慢時不會少算排隊時間
+  python benchmarks/loadgen.py --rate 200 --duration 60
+
+  # 調整比例
+  python benchmarks/loadgen.py --mix "callback.message=6,callback.postback=3,submit_search=1"
+
+  # 錄下產生的流量、之後原樣重播（/callback 會用目前的 secret 重新簽章）
+  python benchmarks/loadgen.py --requests 5000 --dump traffic.jsonl
+  python benchmarks/loadgen.py --replay traffic.jsonl --speed 2
+
+重播檔為 JSON Lines，每行 {"route", "method", "path", "body", "at"}；
+at 是相對開始的秒數（--speed 0 代表不照時間、全速送出），
+缺少 path 的行（例如不是流量紀錄的 JSONL）會略過並計數。
+
+/callback 只量到 LINE 收到 200 為止；事件排隊 + 處理時間另外從 /debug/webhook 讀回來一起列出。
+"""
+
+import argparse
+import base64
+import csv
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import namedtuple
+from typing import Dict, Iterator, List, Optional
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+Req = namedtuple("Req", "route method path body at")
+
+DEFAULT_MIX = ("callback.message=5,callback.postback=3,callback.follow=1,"
+               "submit_search=2,submit_form=1,booking=1,entrust=1")
+
+KEYWORDS = ["立即找房", "我要賣房", "你的介紹", "中壢夜市生活圈精選", "管理我的追蹤條件", "你好"]
+BUDGETS = ["1001-1500萬", "1501-2000萬", "2001-2500萬", "2501-3000萬", "3000萬以上", ""]
+SEARCH_BUDGETS = ["0-1000", "1000-1500", "1500-2000", "2000-2500", "2500-3000", "3000-99999"]
+ROOMS = ["1房", "2房", "3房", "4房", "5房", ""]
+GENRES = ["電梯大樓", "公寓", "透天厝", "店面", "辦公", "土地", ""]
+TIMESLOTS = ["weekday-morning", "weekday-afternoon", "weekday-evening",
+             "weekend-morning", "weekend-afternoon", "weekend-evening"]
+
+
+def sign(body: str, secret: str) -> str:
+    """LINE 的 X-Line-Signature：HMAC-SHA256(channel secret, body) 再 base64"""
+    digest = hmac.new(secret.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+
+# -------------------- 流量產生 --------------------
+class Traffic:
+    def __init__(self, users: int = 200, house_ids: Optional[List[str]] = None, seed: Optional[int] = None):
+        self.rnd = random.Random(seed)
+        self.user_ids = [f"U{uuid.UUID(int=self.rnd.getrandbits(128)).hex}" for _ in range(users)]
+        self.house_ids = house_ids or ["test0001"]
+        self._lock = threading.Lock()
+
+    def _user(self) -> str:
+        return self.rnd.choice(self.user_ids)
+
+    def _webhook(self, event: dict) -> str:
+        event.update({
+            "mode": "active",
+            "timestamp": int(time.time() * 1000),
+            "webhookEventId": uuid.uuid4().hex.upper()[:26],
+            "deliveryContext": {"isRedelivery": False},
+            "source": {"type": "user", "userId": self._user()},
+        })
+        return json.dumps({"destination": "Uloadgen", "events": [event]}, ensure_ascii=False)
+
+    def build(self, route: str) -> Req:
+        with self._lock:  # random.Random 不是 thread-safe 的序列
+            return getattr(self, "_" + route.replace(".", "_"))()
+
+    def _callback_message(self) -> Req:
+        body = self._webhook({
+            "type": "message", "replyToken": uuid.uuid4().hex,
+            "message": {"type": "text", "id": str(self.rnd.getrandbits(60)), "quoteToken": uuid.uuid4().hex,
+                        "text": self.rnd.choice(KEYWORDS)},
+        })
+        return Req("callback.message", "POST", "/callback", body, None)
+
+    def _callback_postback(self) -> Req:
+        body = self._webhook({
+            "type": "postback", "replyToken": uuid.uuid4().hex,
+            "postback": {"data": f"action=detail&id={self.rnd.choice(self.house_ids)}"},
+        })
+        return Req("callback.postback", "POST", "/callback", body, None)
+
+    def _callback_follow(self) -> Req:
+        body = self._webhook({"type": "follow", "replyToken": uuid.uuid4().hex, "follow": {"isUnblocked": False}})
+        return Req("callback.follow", "POST", "/callback", body, None)
+
+    def _submit_search(self) -> Req:
+        body = {"user_id": self._user(), "budget": self.rnd.choice(SEARCH_BUDGETS),
+                "room": self.rnd.choice(ROOMS), "genre": self.rnd.choice(GENRES)}
+        return Req("submit_search", "POST", "/submit_search", json.dumps(body, ensure_ascii=False), None)
+
+    def _submit_form(self) -> Req:
+        body = {"user_id": self._user(), "budget": self.rnd.choice(BUDGETS),
+                "room": self.rnd.choice(ROOMS), "genre": self.rnd.choice(GENRES)}
+        return Req("submit_form", "POST", "/submit_form", json.dumps(body, ensure_ascii=False), None)
+
+    def _booking(self) -> Req:
+        body = {"userId": self._user(), "displayName": "壓測", "name": "壓測用戶",
+                "phone": f"09{self.rnd.randrange(10**8):08d}", "timeslot": self.rnd.choice(TIMESLOTS),
+                "houseId": self.rnd.choice(self.house_ids), "houseTitle": "壓測物件"}
+        return Req("booking", "POST", "/api/booking", json.dumps(body, ensure_ascii=False), None)
+
+    def _entrust(self) -> Req:
+        body = {"user_id": self._user(), "area": "桃園區", "layout": "3房2廳",
+                "size": str(self.rnd.randint(20, 60)), "phone": f"09{self.rnd.randrange(10**8):08d}"}
+        return Req("entrust", "POST", "/submit_entrust", json.dumps(body, ensure_ascii=False), None)
+
+
+ROUTES = ("callback.message", "callback.postback", "callback.follow",
+          "submit_search", "submit_form", "booking", "entrust")
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        route, _, weight = part.partition("=")
+        if route not in ROUTES:
+            raise SystemExit(f"未知的 route: {route}（可用：{', '.join(ROUTES)}）")
+        mix[route] = float(weight or 1)
+    return mix
+
+
+def generate(traffic: Traffic, mix: Dict[str, float], total: Optional[int]) -> Iterator[Req]:
+    routes, weights = list(mix), list(mix.values())
+    n = 0
+    while total is None or n < total:
+        with traffic._lock:
+            route = traffic.rnd.choices(routes, weights)[0]
+        yield traffic.build(route)
+        n += 1
+
+
+def load_replay(path: str, stats: Dict[str, int]) -> List[Req]:
+    reqs = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                stats["invalid"] += 1
+                continue
+            if not isinstance(row, dict) or not row.get("path"):
+                stats["skipped"] += 1
+                continue
+            body = row.get("body", "")
+            if not isinstance(body, str):
+                body = json.dumps(body, ensure_ascii=False)
+            reqs.append(Req(row.get("route") or row["path"].strip("/"), row.get("method", "POST").upper(),
+                            row["path"], body, row.get("at")))
+    return reqs
+
+
+def house_ids_from_csv(path: str) -> List[str]:
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return [row["id"].strip() for row in csv.DictReader(f) if (row.get("id") or "").strip()]
+
+
+# -------------------- 執行與統計 --------------------
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+
+    def add(self, route: str, seconds: float, status: str):
+        with self._lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            by_status = self.statuses.setdefault(route, {})
+            by_status[status] = by_status.get(status, 0) + 1
+
+
+def _pct(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def summarize(rec: Recorder, elapsed: float) -> Dict[str, dict]:
+    out = {}
+    everything: List[float] = []
+    for route in sorted(rec.latencies):
+        lat = sorted(rec.latencies[route])
+        everything.extend(lat)
+        errors = sum(n for s, n in rec.statuses[route].items() if not s.startswith("2"))
+        out[route] = {
+            "count": len(lat),
+            "rps": round(len(lat) / elapsed, 1) if elapsed else None,
+            "errors": errors,
+            "statuses": rec.statuses[route],
+            "p50_ms": round(_pct(lat, 0.50) * 1000, 1),
+            "p95_ms": round(_pct(lat, 0.95) * 1000, 1),
+            "p99_ms": round(_pct(lat, 0.99) * 1000, 1),
+            "max_ms": round(lat[-1] * 1000, 1),
+        }
+    everything.sort()
+    out["ALL"] = {
+        "count": len(everything),
+        "rps": round(len(everything) / elapsed, 1) if elapsed else None,
+        "errors": sum(r["errors"] for r in out.values()),
+        "p50_ms": round(_pct(everything, 0.50) * 1000, 1),
+        "p95_ms": round(_pct(everything, 0.95) * 1000, 1),
+        "p99_ms": round(_pct(everything, 0.99) * 1000, 1),
+        "max_ms": round(everything[-1] * 1000, 1) if everything else 0.0,
+    }
+    return out
+
+
+def run(url: str, secret: str, source: Iterator[Req], concurrency: int, duration: Optional[float],
+        rate: Optional[float], speed: float, timeout: float, dump: Optional[str] = None) -> (Recorder, float):
+    rec = Recorder()
+    lock = threading.Lock()
+    seq = iter(range(1 << 62))
+    stop_at = time.monotonic() + duration if duration else None
+    dump_f = open(dump, "w", encoding="utf-8") if dump else None
+    started = time.monotonic()
+
+    def next_req():
+        with lock:
+            try:
+                return next(source), next(seq)
+            except StopIteration:
+                return None, None
+
+    def worker():
+        session = requests.Session()
+        while True:
+            if stop_at is not None and time.monotonic() >= stop_at:
+                return
+            req, i = next_req()
+            if req is None:
+                return
+
+            # 預定送出時間：--rate 固定間隔；重播且 --speed > 0 時照紀錄的時間
+            scheduled = None
+            if rate:
+                scheduled = started + i / rate
+            elif req.at is not None and speed > 0:
+                scheduled = started + float(req.at) / speed
+            if scheduled is not None:
+                delay = scheduled - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                if stop_at is not None and time.monotonic() >= stop_at:
+                    return
+
+            headers = {"Content-Type": "application/json"}
+            if req.path == "/callback":
+                headers["X-Line-Signature"] = sign(req.body, secret)
+            t0 = scheduled if scheduled is not None and scheduled < time.monotonic() else time.monotonic()
+            try:
+                r = session.request(req.method, url + req.path, data=req.body.encode("utf-8"),
+                                    headers=headers, timeout=timeout)
+                status = str(r.status_code)
+            except requests.RequestException as e:
+                status = type(e).__name__
+            rec.add(req.route, time.monotonic() - t0, status)
+
+            if dump_f is not None:
+                line = json.dumps({"route": req.route, "method": req.method, "path": req.path,
+                                   "body": req.body, "at": round(time.monotonic() - started, 4)},
+                                  ensure_ascii=False)
+                with lock:
+                    dump_f.write(line + "\n")
+
+    threads = [threading.Thread(target=worker, name=f"loadgen-{i}", daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    try:
+        for t in threads:
+            while t.is_alive():
+                t.join(0.5)
+    except KeyboardInterrupt:
+        print("\n⏹ 中斷，整理目前結果…")
+        stop_at = time.monotonic()
+    elapsed = time.monotonic() - started
+    if dump_f is not None:
+        dump_f.close()
+    return rec, elapsed
+
+
+def print_report(summary: Dict[str, dict], elapsed: float):
+    print(f"\n總時間 {elapsed:.1f}s")
+    print(f"{'route':<20} {'count':>8} {'req/s':>8} {'err':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for route, s in summary.items():
+        print(f"{route:<20} {s['count']:>8} {s['rps'] or 0:>8.1f} {s['errors']:>6} "
+              f"{s['p50_ms']:>7.1f}ms {s['p95_ms']:>7.1f}ms {s['p99_ms']:>7.1f}ms {s['max_ms']:>7.1f}ms")
+
+
+def print_server_side(url: str):
+    """/callback 只量到 ack；事件排隊 + 處理時間看 dispatcher 的統計"""
+    try:
+        stats = requests.get(url + "/debug/webhook", timeout=5).json()
+    except (requests.RequestException, ValueError):
+        return None
+    types = stats.get("event_types") or {}
+    if types:
+        print("\n伺服器端事件處理（收到 → handler 結束）")
+        for kind, s in sorted(types.items()):
+            print(f"  {kind:<18} {s.get('count', 0):>8}  p50 {s.get('latency_ms_p50')}ms  "
+                  f"p95 {s.get('latency_ms_p95')}ms  max {s.get('latency_ms_max')}ms")
+    return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Webhook / LIFF 壓測工具")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--secret", default=os.getenv("LINE_CHANNEL_SECRET", "fake-channel-secret"),
+                        help="LINE channel secret（預設讀 LINE_CHANNEL_SECRET；假後端為 fake-channel-secret）")
+    parser.add_argument("--concurrency", "-c", type=int, default=16)
+    parser.add_argument("--duration", "-d", type=float, default=None, help="秒數；與 --requests 都沒給時預設 30 秒")
+    parser.add_argument("--requests", "-n", type=int, default=None, help="總請求數")
+    parser.add_argument("--rate", type=float, default=None, help="固定每秒送出數（open loop）")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"route=權重，逗號分隔（預設 {DEFAULT_MIX}）")
+    parser.add_argument("--users", type=int, default=200, help="模擬的使用者數")
+    parser.add_argument("--listings", default=os.path.join(ROOT, "listings.csv"), help="postback / 預約用的物件 id 來源")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--replay", default=None, help="重播 JSON Lines 流量檔")
+    parser.add_argument("--speed", type=float, default=1.0, help="重播速度倍率；0 = 全速")
+    parser.add_argument("--dump", default=None, help="把送出的流量寫成 JSON Lines（可再 --replay）")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--json", default=None, help="結果另存 JSON")
+    args = parser.parse_args(argv)
+
+    url = args.url.rstrip("/")
+    if args.replay:
+        counts = {"invalid": 0, "skipped": 0}
+        reqs = load_replay(args.replay, counts)
+        if counts["skipped"] or counts["invalid"]:
+            print(f"ℹ️ 重播檔略過 {counts['skipped']} 行（沒有 path）、{counts['invalid']} 行（不是 JSON）")
+        if not reqs:
+            print("❌ 重播檔裡沒有可送出的請求")
+            return 1
+        if args.requests:
+            reqs = reqs[:args.requests]
+        source: Iterator[Req] = iter(reqs)
+        print(f"▶️ 重播 {len(reqs)} 個請求 → {url}（speed={args.speed or '全速'}）")
+    else:
+        duration = args.duration if args.duration or args.requests else 30.0
+        args.duration = duration
+        traffic = Traffic(args.users, house_ids_from_csv(args.listings), seed=args.seed)
+        source = generate(traffic, parse_mix(args.mix), args.requests)
+        print(f"▶️ {url} concurrency={args.concurrency} "
+              + (f"rate={args.rate}/s " if args.rate else "")
+              + (f"duration={args.duration}s " if args.duration else "")
+              + (f"requests={args.requests}" if args.requests else ""))
+
+    rec, elapsed = run(url, args.secret, source, args.concurrency, args.duration, args.rate,
+                       args.speed if args.replay else 0, args.timeout, args.dump)
+    summary = summarize(rec, elapsed)
+    print_report(summary, elapsed)
+    server = print_server_side(url)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"elapsed_s": round(elapsed, 3), "routes": summary, "server": server},
+                      f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,368 @@
+# benchmarks/suite.py
+"""
+熱路徑效能基準
+
+涵蓋：
+  flex.listing_card / flex.property_flex   單張 Flex 卡片
+  flex.carousel_50                         50 張 bubble 的 carousel（產生 + 序列化）
+  flex.carousel_50_cached                  同上，走 RenderCache 命中
+  search.parse_budget                      預算字串解析
+  search.index_filter                      ListingIndex 10k 筆依房數 / 類型 / 價格篩選
+  cache.swr_contention                     SWRCache 8 執行緒搶同一批熱門 key
+  import.normalize_rows                    匯入正規化（1000 列）
+  webhook.callback                         /callback 端到端（簽章 → 分派 → handler，LINE / Firestore 用假的）
+
+每個項目重複 rounds 輪，取每次操作時間的中位數與 p95。
+--save 把結果存成 baseline.json；之後執行會和 baseline 比較，
+中位數比 baseline 慢超過 --threshold（預設 25%）就標成 REGRESSION 並以 exit code 1 結束。
+baseline 與機器有關，請在同一台機器（或同一種 CI runner）上產生與比較。
+
+用法：
+  python benchmarks/suite.py                    # 全部執行並與 baseline 比較
+  python benchmarks/suite.py -k flex --rounds 20
+  python benchmarks/suite.py --save             # 更新 baseline
+"""
+
+import argparse
+import base64
+import csv
+import hashlib
+import hmac
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import namedtuple
+from typing import Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+class Skip(Exception):
+    """環境不足（缺套件等）時由 setup 拋出，該項目標成 SKIP"""
+
+
+# -------------------- 註冊 --------------------
+Case = namedtuple("Case", "name setup number")
+CASES: List[Case] = []
+
+
+def case(name: str, number: int = 100):
+    """
+    setup() 回傳要量測的 op；op() 回傳這次做了幾次操作（None 視為 1），
+    用來讓多執行緒 / 批次類的項目也能算出每次操作的時間。
+    """
+    def register(setup: Callable[[], Callable[[], Optional[int]]]):
+        CASES.append(Case(name, setup, number))
+        return setup
+    return register
+
+
+# -------------------- 測試資料 --------------------
+def _read_listing_csv() -> List[dict]:
+    with open(os.path.join(ROOT, "listings.csv"), newline="", encoding="utf-8-sig") as f:
+        return list(csv.DictReader(f))
+
+
+def _sample_listings() -> List[tuple]:
+    from listing_normalizer import ListingNormalizer
+    return list(ListingNormalizer().iter_rows(_read_listing_csv()))
+
+
+def _synthetic_listings(n: int, seed: int = 7) -> List[tuple]:
+    rnd = random.Random(seed)
+    base = _sample_listings()
+    genres = sorted({d["genre"] for _, d in base if d.get("genre")}) or ["電梯大樓"]
+    out = []
+    for i in range(n):
+        _, data = base[i % len(base)]
+        data = dict(data)
+        data["genre"] = rnd.choice(genres)
+        data["room"] = rnd.randint(1, 5)
+        data["price"] = rnd.choice([None] + [rnd.randint(500, 6000) for _ in range(20)])
+        out.append((f"bench-{i:06d}", data))
+    return out
+
+
+# -------------------- Flex --------------------
+@case("flex.listing_card", number=2000)
+def _listing_card():
+    import flex_templates as ft
+    rows = _sample_listings()
+    it = iter(range(1 << 62))
+
+    def op():
+        doc_id, data = rows[next(it) % len(rows)]
+        ft.listing_card(doc_id, data)
+    return op
+
+
+@case("flex.property_flex", number=1000)
+def _property_flex():
+    import flex_templates as ft
+    rows = _sample_listings()
+    it = iter(range(1 << 62))
+
+    def op():
+        doc_id, data = rows[next(it) % len(rows)]
+        ft.property_flex(doc_id, data)
+    return op
+
+
+@case("flex.carousel_50", number=20)
+def _carousel_50():
+    import flex_templates as ft
+    rows = _synthetic_listings(50)
+
+    def op():
+        bubbles = [ft.listing_card(doc_id, data) for doc_id, data in rows]
+        ft.freeze_flex("搜尋結果", {"type": "carousel", "contents": bubbles})
+    return op
+
+
+@case("flex.carousel_50_cached", number=200)
+def _carousel_50_cached():
+    import flex_templates as ft
+    from render_cache import RenderCache
+    rows = _synthetic_listings(50)
+    cards = RenderCache(ft.listing_card, maxsize=256, name="bench")
+    for doc_id, data in rows:
+        cards.get(doc_id, data)
+
+    def op():
+        bubbles = [cards.get(doc_id, data) for doc_id, data in rows]
+        ft.freeze_flex("搜尋結果", {"type": "carousel", "contents": bubbles})
+    return op
+
+
+# -------------------- 搜尋 --------------------
+BUDGETS = ["1000-1500", "1001-1500萬", "1000萬以下", "3000萬以上", "", None, "不限", "2000-3000萬"]
+
+
+@case("search.parse_budget", number=1000)
+def _parse_budget():
+    from search_query import parse_budget
+
+    def op():
+        for b in BUDGETS:
+            parse_budget(b)
+        return len(BUDGETS)
+    return op
+
+
+@case("search.index_filter", number=500)
+def _index_filter():
+    from listing_index import ListingIndex
+    from search_query import parse_budget, MAX_RESULTS
+
+    Doc = namedtuple("Doc", "id to_dict")
+    Kind = namedtuple("Kind", "name")
+    Change = namedtuple("Change", "type document")
+    added = Kind("ADDED")
+
+    index = ListingIndex(None)
+    rows = _synthetic_listings(10_000)
+    index._on_snapshot(None, [Change(added, Doc(doc_id, (lambda d=data: d))) for doc_id, data in rows], None)
+    genre = rows[0][1]["genre"]
+    queries = [(3, genre, "1000-3000萬"), (None, None, "2000萬以下"), (2, None, "3000萬以上"), (None, genre, "")]
+    it = iter(range(1 << 62))
+
+    def op():
+        room, g, budget = queries[next(it) % len(queries)]
+        lo, hi = parse_budget(budget)
+        index.search(room=room, genre=g, min_price=lo, max_price=hi, limit=MAX_RESULTS)
+    return op
+
+
+# -------------------- 快取 --------------------
+@case("cache.swr_contention", number=1)
+def _swr_contention():
+    from cache import SWRCache
+    threads, per_thread, keys = 8, 5000, 100
+    cache = SWRCache(loader=lambda k: {"id": k}, maxsize=keys * 2, ttl=60, stale_ttl=300, name="bench")
+    for k in range(keys):
+        cache.get(k)
+
+    def worker(seed):
+        rnd = random.Random(seed)
+        get = cache.get
+        for _ in range(per_thread):
+            get(rnd.randrange(keys))
+
+    def op():
+        ts = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+        return threads * per_thread
+    return op
+
+
+# -------------------- 匯入 --------------------
+@case("import.normalize_rows", number=20)
+def _normalize_rows():
+    from listing_normalizer import ListingNormalizer
+    raw = _read_listing_csv()
+    items = [dict(raw[i % len(raw)], id=f"bench-{i}") for i in range(1000)]
+    normalizer = ListingNormalizer()
+
+    def op():
+        for _ in normalizer.iter_rows(items):
+            pass
+        return len(items)
+    return op
+
+
+# -------------------- Webhook --------------------
+def _webhook_body(n_events: int = 5) -> str:
+    events = []
+    for i in range(n_events):
+        events.append({
+            "type": "message", "mode": "active", "timestamp": int(time.time() * 1000),
+            "webhookEventId": f"bench{i}", "deliveryContext": {"isRedelivery": False},
+            "replyToken": f"bench-reply-{i}",
+            "source": {"type": "user", "userId": f"Ubench{i % 3:031d}"},
+            "message": {"type": "text", "id": str(10_000 + i), "quoteToken": "q", "text": "立即找房"},
+        })
+    return json.dumps({"destination": "Ubench", "events": events})
+
+
+def _sign(body: str, secret: str) -> str:
+    digest = hmac.new(secret.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+
+@case("webhook.callback", number=50)
+def _callback():
+    # 沒有另外指定時使用離線後端（記憶體 Firestore + 本機假的 LINE API）
+    os.environ.setdefault("FIRESTORE_BACKEND", "memory")
+    os.environ.setdefault("LINE_API_BACKEND", "fake")
+    os.environ.setdefault("FAKE_FIRESTORE_SEED", os.path.join(ROOT, "listings.csv"))
+    try:
+        import app as app_module
+    except Exception as e:  # 缺 Flask / line-bot-sdk 等套件
+        raise Skip(f"無法載入 app: {type(e).__name__}: {e}")
+
+    client = app_module.app.test_client()
+    dispatcher = app_module.dispatcher
+    body = _webhook_body()
+    headers = {"X-Line-Signature": _sign(body, app_module.LINE_CHANNEL_SECRET), "Content-Type": "application/json"}
+
+    def _done():
+        s = dispatcher.stats()
+        return s["handled"] + s["errors"] + s["unhandled"] >= s["events"]
+
+    def op():
+        resp = client.post("/callback", data=body, headers=headers)
+        assert resp.status_code == 200, resp.status_code
+        # 端到端：等背景 worker 把事件處理完
+        while not _done():
+            time.sleep(0.0005)
+        return 1
+    return op
+
+
+# -------------------- 執行 --------------------
+def run_case(c: Case, rounds: int, warmup: int = 1) -> Dict[str, float]:
+    op = c.setup()
+    for _ in range(warmup):
+        op()
+    per_op = []
+    for _ in range(rounds):
+        ops = 0
+        started = time.perf_counter()
+        for _ in range(c.number):
+            ops += op() or 1
+        per_op.append((time.perf_counter() - started) / ops)
+    per_op.sort()
+    median = statistics.median(per_op)
+    return {
+        "median_us": round(median * 1e6, 3),
+        "p95_us": round(per_op[min(len(per_op) - 1, int(len(per_op) * 0.95))] * 1e6, 3),
+        "min_us": round(per_op[0] * 1e6, 3),
+        "ops_per_sec": round(1 / median, 1) if median else None,
+    }
+
+
+def load_baseline(path: str) -> Dict[str, dict]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("results", {})
+
+
+def save_baseline(path: str, results: Dict[str, dict]):
+    merged = load_baseline(path)
+    merged.update(results)
+    doc = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "saved_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": dict(sorted(merged.items())),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="熱路徑效能基準")
+    parser.add_argument("-k", "--filter", default="", help="只跑名稱包含此字串的項目")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--threshold", type=float, default=0.25, help="中位數變慢超過此比例視為退步")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="把這次結果寫入 baseline")
+    parser.add_argument("--json", default=None, help="另外把結果輸出成 JSON 檔")
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.baseline)
+    results: Dict[str, dict] = {}
+    regressions = []
+
+    print(f"{'benchmark':<28} {'median':>12} {'p95':>12} {'ops/s':>12}  vs baseline")
+    for c in CASES:
+        if args.filter and args.filter not in c.name:
+            continue
+        try:
+            r = run_case(c, args.rounds)
+        except Skip as e:
+            print(f"{c.name:<28} {'SKIP':>12}  {e}")
+            continue
+        results[c.name] = r
+
+        note = ""
+        base = baseline.get(c.name)
+        if base and base.get("median_us"):
+            ratio = r["median_us"] / base["median_us"]
+            note = f"{ratio:6.2f}x"
+            if ratio > 1 + args.threshold:
+                note += "  REGRESSION"
+                regressions.append(c.name)
+        print(f"{c.name:<28} {r['median_us']:>10.2f}us {r['p95_us']:>10.2f}us {r['ops_per_sec']:>12,.0f}  {note}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.save:
+        save_baseline(args.baseline, results)
+        print(f"💾 baseline 已更新：{args.baseline}")
+        return 0
+    if regressions:
+        print(f"❌ 效能退步：{', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
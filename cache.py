@@ -0,0 +1,221 @@
+# cache.py
+"""
+SWRCache：single-flight + stale-while-revalidate 快取
+
+  - fresh（ttl 內）       → 直接回傳
+  - stale（stale_ttl 內） → 先回傳舊值，背景重新載入（同一個 key 只會有一個載入）
+  - 過期 / 沒有資料       → 同步載入；同時間的其他請求等同一次載入結果，不會一起打 Firestore
+  - loader 回傳 None      → 視為不存在，以 negative_ttl 快取，避免不存在的 ID 一直查
+  - 依 key 分成多個 shard，各自一把鎖與 LRU
+  - 載入途中被 invalidate / set 的 key，該次載入結果不寫回快取（不會把失效前讀到的舊值存回去）
+"""
+
+import concurrent.futures
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from startup import Lazy
+
+log = logging.getLogger("cache")
+
+_MISSING = object()
+
+# 所有 SWRCache 共用的背景重新載入執行緒池；第一次 stale 更新時才建立，fork 後由 reset_all() 重建
+_refresh_executor = Lazy(lambda: concurrent.futures.ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix="cache-refresh"), "cache_refresh_executor")
+
+
+class _Entry:
+    __slots__ = ("value", "fresh_until", "stale_until")
+
+    def __init__(self, value, fresh_until: float, stale_until: float):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+class _Flight:
+    """一次進行中的載入；其他執行緒等 event 後讀取結果。superseded：載入途中 key 被 invalidate / set"""
+    __slots__ = ("event", "value", "error", "superseded")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        self.superseded = False
+
+
+_COUNTERS = ("hits", "stale_hits", "negative_hits", "misses", "loads", "load_errors",
+             "coalesced", "refreshes", "evictions", "invalidations", "discarded_loads")
+
+
+class _Shard:
+    """每個 shard 各自一把鎖、LRU 與計數器，避免全域鎖競爭"""
+    __slots__ = ("lock", "data", "flights", "counters")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self.flights: Dict[Hashable, _Flight] = {}
+        self.counters = dict.fromkeys(_COUNTERS, 0)
+
+
+class SWRCache:
+    def __init__(self, loader: Optional[Callable[[Any], Any]] = None, maxsize: int = 1024,
+                 ttl: float = 30, stale_ttl: float = 300, negative_ttl: float = 10,
+                 shards: int = 16, load_timeout: float = 10, name: str = "cache"):
+        """
+        loader:       key -> value，回傳 None 代表不存在
+        ttl:          新鮮時間（秒）
+        stale_ttl:    過了 ttl 之後還能先回傳舊值的時間（秒），0 代表不使用
+        negative_ttl: 「不存在」結果的快取時間（秒）
+        """
+        self.loader = loader
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.load_timeout = load_timeout
+        self.name = name
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        self._per_shard = max(1, maxsize // len(self._shards))
+
+    # -------------------- 對外介面 --------------------
+    def get(self, key: Hashable, loader: Optional[Callable[[Any], Any]] = None):
+        """回傳快取值；不存在回傳 None。沒有 loader 時只查快取"""
+        loader = loader or self.loader
+        shard = self._shard(key)
+        now = time.monotonic()
+
+        with shard.lock:
+            entry = shard.data.get(key)
+            if entry is not None:
+                if now < entry.fresh_until:
+                    shard.data.move_to_end(key)
+                    shard.counters["negative_hits" if entry.value is None else "hits"] += 1
+                    return entry.value
+                if now < entry.stale_until and loader is not None:
+                    shard.data.move_to_end(key)
+                    shard.counters["stale_hits"] += 1
+                    refresh = None
+                    if key not in shard.flights:
+                        refresh = shard.flights[key] = _Flight()
+                    value = entry.value
+                else:
+                    shard.data.pop(key, None)
+                    entry = None
+            if entry is None:
+                shard.counters["misses"] += 1
+                if loader is None:
+                    return None
+                flight = shard.flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = shard.flights[key] = _Flight()
+                else:
+                    shard.counters["coalesced"] += 1
+
+        if entry is not None:
+            # stale：先回舊值，背景更新
+            if refresh is not None:
+                self._incr(shard, "refreshes")
+                _refresh_executor.submit(self._load, key, loader, refresh)
+            return value
+
+        if not leader:
+            if not flight.event.wait(self.load_timeout):
+                raise TimeoutError(f"[{self.name}] 等待載入逾時 key={key}")
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        self._load(key, loader, flight)
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def set(self, key: Hashable, value):
+        shard = self._shard(key)
+        with shard.lock:
+            self._supersede(shard, key)
+            self._store(shard, key, value)
+
+    def invalidate(self, key: Hashable = _MISSING):
+        """不帶 key 代表全部清除；進行中的載入結果也會作廢"""
+        shards = self._shards if key is _MISSING else [self._shard(key)]
+        for shard in shards:
+            with shard.lock:
+                if key is _MISSING:
+                    n = len(shard.data)
+                    shard.data.clear()
+                    for flight in shard.flights.values():
+                        flight.superseded = True
+                    shard.flights.clear()
+                else:
+                    n = 1 if shard.data.pop(key, None) is not None else 0
+                    self._supersede(shard, key)
+                shard.counters["invalidations"] += n
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = dict.fromkeys(_COUNTERS, 0)
+        for shard in self._shards:
+            with shard.lock:
+                for k, v in shard.counters.items():
+                    stats[k] += v
+        stats["size"] = len(self)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["negative_hits"] + stats["misses"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else None
+        return stats
+
+    def __len__(self):
+        return sum(len(s.data) for s in self._shards)
+
+    # -------------------- 內部 --------------------
+    def _shard(self, key) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    @staticmethod
+    def _supersede(shard: _Shard, key):
+        """作廢 key 進行中的載入：結果不寫回快取，之後的 get 會重新載入（呼叫端持有 shard.lock）"""
+        flight = shard.flights.pop(key, None)
+        if flight is not None:
+            flight.superseded = True
+
+    @staticmethod
+    def _incr(shard: _Shard, key: str, n: int = 1):
+        with shard.lock:
+            shard.counters[key] += n
+
+    def _store(self, shard: _Shard, key, value):
+        now = time.monotonic()
+        if value is None:
+            entry = _Entry(None, now + self.negative_ttl, now + self.negative_ttl)
+        else:
+            entry = _Entry(value, now + self.ttl, now + self.ttl + self.stale_ttl)
+        shard.data[key] = entry
+        shard.data.move_to_end(key)
+        while len(shard.data) > self._per_shard:
+            shard.data.popitem(last=False)
+            shard.counters["evictions"] += 1
+
+    def _load(self, key, loader, flight: _Flight):
+        shard = self._shard(key)
+        try:
+            self._incr(shard, "loads")
+            flight.value = loader(key)
+            with shard.lock:
+                if flight.superseded:
+                    shard.counters["discarded_loads"] += 1
+                else:
+                    self._store(shard, key, flight.value)
+        except Exception as e:
+            flight.error = e
+            self._incr(shard, "load_errors")
+            log.warning("[%s] 載入失敗 key=%s: %s", self.name, key, e)
+        finally:
+            with shard.lock:
+                if shard.flights.get(key) is flight:
+                    del shard.flights[key]
+            flight.event.set()
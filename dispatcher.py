@@ -0,0 +1,207 @@
+# dispatcher.py
+"""
+Webhook 事件分派器
+
+/callback 驗證簽章、拆出事件後立即回 200 給 LINE，
+事件交給背景 worker 執行：
+  - 同一個來源（user / group / room）固定分到同一個 worker → 依序處理
+  - 不同來源分散到不同 worker → 平行處理
+  - 佇列滿時整個 /callback 最多等 put_timeout 秒，還排不進去的事件直接丟棄（shed）：
+    LINE 已經收到 200 不會重送，所以每一筆都記 ERROR log 並計入 webhook_events_shed_total
+  - stats() 回報各事件類型從收到到處理完成的延遲（排隊 + 處理）
+handler 註冊在 HandlerRegistry（@handlers.add("MessageEvent", message="TextMessage")），
+以事件類別名稱查找，不依賴 SDK WebhookHandler 的私有屬性，註冊時也不必先 import SDK 的 model。
+"""
+
+import atexit
+import inspect
+import logging
+import queue
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from logs import get_request_id, request_context
+from metrics import WEBHOOK_EVENT_ERRORS, WEBHOOK_EVENT_SECONDS, WEBHOOK_EVENTS_SHED
+
+log = logging.getLogger("dispatcher")
+
+_STOP = object()
+
+
+def source_key(event) -> str:
+    """事件的排序 key：同一個 user / group / room 的事件不會同時執行"""
+    source = getattr(event, "source", None)
+    for attr in ("user_id", "group_id", "room_id"):
+        value = getattr(source, attr, None)
+        if value:
+            return value
+    return ""
+
+
+class HandlerRegistry:
+    """事件類別名稱 → handler；查找順序與 WebhookHandler 相同：Event_Message → Event → default"""
+
+    def __init__(self):
+        self._funcs: Dict[str, Callable] = {}
+        self._default: Optional[Callable] = None
+
+    def add(self, event: str, message: Optional[str] = None):
+        """event / message 是 SDK 類別名稱，例如 add("MessageEvent", message="TextMessage")"""
+        key = f"{event}_{message}" if message else event
+
+        def decorator(func):
+            self._funcs[key] = func
+            return func
+        return decorator
+
+    def default(self):
+        def decorator(func):
+            self._default = func
+            return func
+        return decorator
+
+    def find(self, event) -> Optional[Callable]:
+        func = None
+        message = getattr(event, "message", None)
+        if message is not None:
+            func = self._funcs.get(f"{type(event).__name__}_{type(message).__name__}")
+        if func is None:
+            func = self._funcs.get(type(event).__name__)
+        return func or self._default
+
+
+class WebhookDispatcher:
+    def __init__(self, parser, handlers: HandlerRegistry, workers: int = 8, maxsize: int = 1000,
+                 put_timeout: float = 0.2):
+        """
+        parser:      linebot.WebhookParser（驗證簽章、拆出事件）
+        handlers:    HandlerRegistry
+        maxsize:     所有 worker 佇列的總容量
+        put_timeout: 佇列滿時一次 dispatch 最多等幾秒，超過的事件丟棄（計入 shed）
+        """
+        self.parser = parser
+        self.handlers = handlers
+        self.put_timeout = put_timeout
+        per_shard = max(1, maxsize // max(1, workers))
+        self._queues = [queue.Queue(maxsize=per_shard) for _ in range(workers)]
+        self._threads = []
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, deque] = {}
+        self._counters = {"events": 0, "handled": 0, "errors": 0, "shed": 0, "unhandled": 0}
+
+        for i, q in enumerate(self._queues):
+            t = threading.Thread(target=self._worker, args=(q,), name=f"webhook-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        atexit.register(self.stop)
+
+    # -------------------- 對外介面 --------------------
+    def dispatch(self, body: str, signature: str) -> int:
+        """驗證簽章並排入事件，回傳排入的事件數；簽章錯誤時拋出 InvalidSignatureError"""
+        payload = self.parser.parse(body, signature, as_payload=True)
+        destination = getattr(payload, "destination", None)
+        deadline = None
+        queued = 0
+        for event in payload.events:
+            # worker 處理時沿用 /callback 的 request_id，事件的 log 才串得起來
+            item = (event, destination, time.monotonic(), get_request_id())
+            q = self._queues[zlib.crc32(source_key(event).encode("utf-8")) % len(self._queues)]
+            self._incr("events")
+            try:
+                q.put_nowait(item)
+            except queue.Full:
+                if deadline is None:
+                    deadline = time.monotonic() + self.put_timeout
+                try:
+                    q.put(item, timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Full:
+                    kind = type(event).__name__
+                    self._incr("shed")
+                    WEBHOOK_EVENTS_SHED.labels(kind).inc()
+                    log.error("[dispatcher] ❌ 佇列已滿，丟棄 %s source=%s", kind, source_key(event))
+                    continue
+            queued += 1
+        return queued
+
+    def shed(self) -> int:
+        with self._lock:
+            return self._counters["shed"]
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters)
+            latencies = {k: sorted(v) for k, v in self._latencies.items()}
+        stats["depth"] = self.depth()
+        stats["workers"] = len(self._threads)
+
+        per_type = {}
+        for kind, lat in latencies.items():
+            if not lat:
+                continue
+            per_type[kind] = {
+                "count": len(lat),
+                "latency_ms_p50": round(lat[int(len(lat) * 0.50)] * 1000, 1),
+                "latency_ms_p95": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))] * 1000, 1),
+                "latency_ms_max": round(lat[-1] * 1000, 1),
+            }
+        stats["event_types"] = per_type
+        return stats
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        for q in self._queues:
+            try:
+                q.put(_STOP, timeout=timeout)
+            except queue.Full:
+                pass
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    # -------------------- worker --------------------
+    def _incr(self, key: str, n: int = 1):
+        with self._lock:
+            self._counters[key] += n
+
+    def _worker(self, q: "queue.Queue"):
+        while True:
+            item = q.get()
+            if item is _STOP:
+                return
+            self._run(*item)
+
+    def _run(self, event, destination, received_at: float, request_id: Optional[str] = None):
+        with request_context(request_id):
+            self._handle(event, destination, received_at)
+
+    def _handle(self, event, destination, received_at: float):
+        kind = type(event).__name__
+        func = self.handlers.find(event)
+        if func is None:
+            self._incr("unhandled")
+            log.info("[dispatcher] 沒有 %s 的 handler", kind)
+            return
+
+        started = time.monotonic()
+        try:
+            if len(inspect.signature(func).parameters) >= 2:
+                func(event, destination)
+            else:
+                func(event)
+            self._incr("handled")
+        except Exception:
+            self._incr("errors")
+            WEBHOOK_EVENT_ERRORS.labels(kind).inc()
+            log.exception("[dispatcher] ❌ %s 處理失敗", kind)
+        finally:
+            done = time.monotonic()
+            WEBHOOK_EVENT_SECONDS.labels(kind).observe(done - started)
+            with self._lock:
+                self._latencies.setdefault(kind, deque(maxlen=512)).append(done - received_at)
+            log.info("[dispatcher] %s wait=%.0fms handle=%.0fms",
+                     kind, (started - received_at) * 1000, (done - started) * 1000)
@@ -0,0 +1,252 @@
+# fake_line.py
+"""
+本機假的 LINE Messaging API（離線壓測用）
+
+實作本專案會呼叫的端點，收到的請求全部記錄下來，可以注入延遲與錯誤：
+  POST /v2/bot/message/reply | push | multicast | broadcast | narrowcast
+  POST /v2/bot/chat/loading/start
+  GET  /v2/bot/profile/{userId}
+訊息格式不對（messages 不是 1～5 個含 type 的 JSON 物件、缺少 to / replyToken）與正式 API 一樣回 400。
+查詢 / 清除紀錄：
+  GET    /__calls          → {"counts": {...}, "calls": [...]}（calls 只保留最近 max_records 筆）
+  DELETE /__calls
+
+兩種用法：
+  - LINE_API_BACKEND=fake：app.py 在行程內啟動（start_fake_line_server），LINE_API_ENDPOINT 自動指過來
+  - 獨立執行：python fake_line.py --port 9000 --latency-ms 80，再把 LINE_API_ENDPOINT 設成 http://127.0.0.1:9000
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+log = logging.getLogger("fake_line")
+
+_MESSAGE_PATHS = ("reply", "push", "multicast", "broadcast", "narrowcast")
+MAX_MESSAGES = 5
+
+
+def validate_message_request(kind: str, body: Any) -> List[Dict[str, str]]:
+    """檢查訊息 API 的 request body，回傳 LINE 格式的錯誤明細（空 list 代表沒問題）"""
+    if not isinstance(body, dict):
+        return [{"message": "must be a JSON object", "property": ""}]
+    errors = []
+    if kind == "reply" and not isinstance(body.get("replyToken"), str):
+        errors.append({"message": "must be specified", "property": "replyToken"})
+    if kind == "push" and not isinstance(body.get("to"), str):
+        errors.append({"message": "must be specified", "property": "to"})
+    if kind == "multicast":
+        to = body.get("to")
+        if not isinstance(to, list) or not to or not all(isinstance(u, str) for u in to):
+            errors.append({"message": "must be a non-empty array of user IDs", "property": "to"})
+    messages = body.get("messages")
+    if not isinstance(messages, list) or not 1 <= len(messages) <= MAX_MESSAGES:
+        errors.append({"message": f"size must be between 1 and {MAX_MESSAGES}", "property": "messages"})
+        return errors
+    for i, message in enumerate(messages):
+        if not isinstance(message, dict):
+            errors.append({"message": "must be a JSON object", "property": f"messages[{i}]"})
+        elif not isinstance(message.get("type"), str):
+            errors.append({"message": "must be specified", "property": f"messages[{i}].type"})
+    return errors
+
+
+class CallLog:
+    def __init__(self, max_records: int = 10000):
+        self._lock = threading.Lock()
+        self._calls: deque = deque(maxlen=max_records)
+        self._counts: Counter = Counter()
+
+    def record(self, kind: str, body: Any, headers: Dict[str, str]):
+        entry = {"kind": kind, "at": time.time(), "body": body,
+                 "retry_key": headers.get("X-Line-Retry-Key")}
+        with self._lock:
+            self._calls.append(entry)
+            self._counts[kind] += 1
+            if kind in ("push", "multicast") and isinstance(body, dict):
+                to = body.get("to")
+                self._counts["recipients"] += len(to) if isinstance(to, list) else 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"counts": dict(self._counts), "calls": list(self._calls)}
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def clear(self):
+        with self._lock:
+            self._calls.clear()
+            self._counts.clear()
+
+
+class FakeLineServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 500, max_records: int = 10000,
+                 max_retry_keys: int = 100_000):
+        """max_retry_keys：記住最近幾個 X-Line-Retry-Key（LRU），長時間壓測記憶體不會一直長"""
+        super().__init__(address, _Handler)
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.calls = CallLog(max_records)
+        self._seen_retry_keys: "OrderedDict[str, None]" = OrderedDict()
+        self.max_retry_keys = max_retry_keys
+        self._retry_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeLineServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-line", daemon=True)
+        self._thread.start()
+        log.info("[fake_line] 🧪 假的 LINE API 啟動於 %s", self.endpoint)
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def _delay(self):
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _is_duplicate(self, retry_key: Optional[str]) -> bool:
+        """與 LINE 相同：同一個 X-Line-Retry-Key 已接受過就回 409"""
+        if not retry_key:
+            return False
+        with self._retry_lock:
+            if retry_key in self._seen_retry_keys:
+                self._seen_retry_keys.move_to_end(retry_key)
+                return True
+            self._seen_retry_keys[retry_key] = None
+            while len(self._seen_retry_keys) > self.max_retry_keys:
+                self._seen_retry_keys.popitem(last=False)
+            return False
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeLineServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):  # 不要每個請求都印到 stderr
+        pass
+
+    def _send(self, status: int, payload: Any = None):
+        body = json.dumps(payload if payload is not None else {}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw.decode("utf-8")) if raw else {}
+        except ValueError:
+            return None
+
+    def do_GET(self):
+        if self.path == "/__calls":
+            return self._send(200, self.server.calls.snapshot())
+        if self.path.startswith("/v2/bot/profile/"):
+            user_id = self.path.rsplit("/", 1)[-1]
+            self.server._delay()
+            self.server.calls.record("profile", {"userId": user_id}, dict(self.headers))
+            return self._send(200, {"userId": user_id, "displayName": f"測試用戶{user_id[-4:]}",
+                                    "pictureUrl": "", "statusMessage": "", "language": "zh-TW"})
+        return self._send(404, {"message": "Not found"})
+
+    def do_DELETE(self):
+        if self.path == "/__calls":
+            self.server.calls.clear()
+            return self._send(200)
+        return self._send(404, {"message": "Not found"})
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        body = self._read_json()
+        if body is None:
+            return self._send(400, {"message": "The request body has 1 error(s)"})
+
+        if path == "/v2/bot/chat/loading/start":
+            kind = "loading"
+        elif path.startswith("/v2/bot/message/") and path.rsplit("/", 1)[-1] in _MESSAGE_PATHS:
+            kind = path.rsplit("/", 1)[-1]
+        else:
+            return self._send(404, {"message": "Not found"})
+
+        if not (self.headers.get("Authorization") or "").startswith("Bearer "):
+            return self._send(401, {"message": "Authentication failed"})
+
+        if kind != "loading":
+            errors = validate_message_request(kind, body)
+            if errors:
+                self.server.calls.record(f"{kind}_invalid", body, dict(self.headers))
+                return self._send(400, {"message": f"The request body has {len(errors)} error(s)",
+                                        "details": errors})
+
+        self.server._delay()
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            self.server.calls.record(f"{kind}_error", body, dict(self.headers))
+            return self._send(self.server.error_status, {"message": "injected error"})
+        if self.server._is_duplicate(self.headers.get("X-Line-Retry-Key")):
+            return self._send(409, {"message": "The retry key is already accepted"})
+
+        self.server.calls.record(kind, body, dict(self.headers))
+        status = 202 if kind in ("broadcast", "narrowcast", "loading") else 200
+        if kind in ("reply", "push"):
+            # 與正式 API 一樣每則訊息回一個 id（line-bot-sdk v3 會檢查 sentMessages 不可為空）
+            sent = [{"id": uuid.uuid4().hex[:18], "quoteToken": uuid.uuid4().hex}
+                    for _ in body["messages"]]
+            return self._send(status, {"sentMessages": sent})
+        return self._send(status, {})
+
+
+def start_fake_line_server(host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0,
+                           jitter_ms: float = 0.0, error_rate: float = 0.0) -> FakeLineServer:
+    """在背景執行緒啟動；port=0 代表隨機可用的 port"""
+    return FakeLineServer((host, port), latency_ms=latency_ms, jitter_ms=jitter_ms,
+                          error_rate=error_rate).start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本機假的 LINE Messaging API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="回傳 5xx 的比例（0~1）")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    server = FakeLineServer((args.host, args.port), latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                            error_rate=args.error_rate)
+    log.info("[fake_line] 🧪 假的 LINE API 啟動於 %s（GET /__calls 查看紀錄）", server.endpoint)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
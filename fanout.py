@@ -0,0 +1,177 @@
+# fanout.py
+"""
+相同訊息合併成 multicast
+
+很多人要收到同一則訊息（新物件通知、精選更新）時，
+依序列化後的 JSON 分組，每組每 500 人一次 multicast，而不是每人一次 push：
+  - 429 / 5xx / 網路錯誤：同一個 retry_key 指數退避重試
+  - 400 且錯誤明細指向 to（名單裡有無效的 user_id）：把名單切半再送，直到找出失敗的那幾個；
+    指向 messages（訊息本身有問題）時整批直接失敗，切幾次都一樣；沒有明細時最多切 max_split_depth 層
+  - 只有一個收件人的訊息交給 outbox 走一般 push（保持個人訊息順序）
+stats() 回報 API 呼叫數、收件人數與相對於逐一 push 省下的呼叫數；
+recipients_per_sec 只算花在 API 呼叫上的時間（不含退避等待）。
+"""
+
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+log = logging.getLogger("fanout")
+
+MULTICAST_LIMIT = 500
+
+
+def _status(e: Exception) -> Optional[int]:
+    return getattr(e, "status_code", None)
+
+
+def _fault(e: Exception) -> Optional[str]:
+    """400 的錯誤明細指向誰："messages"（訊息本身）、"to"（收件人）或 None（沒有明細）"""
+    properties = [str(d.get("property") or "") for d in getattr(e, "details", None) or []]
+    if any(p.startswith("messages") for p in properties):
+        return "messages"
+    if any(p.startswith("to") for p in properties):
+        return "to"
+    return None
+
+
+class Fanout:
+    def __init__(self, client, push_one: Optional[Callable[[str, Any], Any]] = None,
+                 max_retries: int = 3, backoff: float = 0.5, max_backoff: float = 8.0,
+                 max_split_depth: int = 4):
+        """
+        client:          line_raw.RawMessagingClient
+        push_one:        只有一個收件人時使用，例如 outbox.push；None 代表也用 multicast
+        max_split_depth: 400 沒有錯誤明細時最多切幾層（4 層 = 最多 31 次呼叫）；明細指向 to 時不受限制
+        """
+        self._client = client
+        self._push_one = push_one
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_split_depth = max_split_depth
+        self._lock = threading.Lock()
+        self._counters = {
+            "recipients": 0, "delivered": 0, "failed_recipients": 0,
+            "api_calls": 0, "batches": 0, "splits": 0, "retries": 0, "message_errors": 0,
+            "single_pushes": 0, "broadcasts": 0, "narrowcasts": 0,
+        }
+        self._busy_seconds = 0.0
+
+    # -------------------- 對外介面 --------------------
+    def deliver(self, pairs: Iterable[Tuple[str, Any]],
+                on_failed: Optional[Callable[[List[str]], Any]] = None) -> Dict[str, int]:
+        """
+        pairs: [(user_id, FrozenMessage)]；內容完全相同的訊息會合併成 multicast。
+        on_failed: 送不出去的 user_id 會以 on_failed([user_id, ...]) 回報（每個失敗的批次一次）
+        回傳 {"delivered": n, "failed": n}
+        """
+        groups: Dict[str, Tuple[Any, List[str]]] = {}
+        seen = set()
+        for user_id, message in pairs:
+            if not user_id or (message.json, user_id) in seen:
+                continue
+            seen.add((message.json, user_id))
+            groups.setdefault(message.json, (message, []))[1].append(user_id)
+
+        delivered = failed = 0
+        for message, user_ids in groups.values():
+            self._incr("recipients", len(user_ids))
+            if len(user_ids) == 1 and self._push_one is not None:
+                self._push_one(user_ids[0], message)
+                self._incr("single_pushes")
+                delivered += 1
+                continue
+            for i in range(0, len(user_ids), MULTICAST_LIMIT):
+                ok, bad = self._send_batch(message, user_ids[i:i + MULTICAST_LIMIT])
+                delivered += ok
+                failed += len(bad)
+                if bad and on_failed is not None:
+                    on_failed(bad)
+        self._incr("delivered", delivered)
+        self._incr("failed_recipients", failed)
+        if groups:
+            log.info("[fanout] 📣 groups=%s delivered=%s failed=%s", len(groups), delivered, failed)
+        return {"delivered": delivered, "failed": failed}
+
+    def broadcast(self, message):
+        """送給所有好友"""
+        self._call(self._client.broadcast, message, retry_key=str(uuid.uuid4()))
+        self._incr("broadcasts")
+
+    def narrowcast(self, message, recipient: Optional[dict] = None, filter: Optional[dict] = None,
+                   limit: Optional[dict] = None):
+        """依 audience / 屬性篩選送出（LINE narrowcast 為非同步處理）"""
+        self._call(self._client.narrowcast, message, recipient=recipient, filter=filter, limit=limit,
+                   retry_key=str(uuid.uuid4()))
+        self._incr("narrowcasts")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters)
+            busy = self._busy_seconds
+        # 逐一 push 需要的呼叫數 = 收件人數；省下的就是兩者差距
+        stats["push_calls_saved"] = stats["recipients"] - stats["api_calls"] - stats["single_pushes"]
+        stats["recipients_per_call"] = (
+            round(stats["delivered"] / (stats["api_calls"] + stats["single_pushes"]), 1)
+            if stats["api_calls"] + stats["single_pushes"] else None
+        )
+        stats["recipients_per_sec"] = round(stats["delivered"] / busy, 1) if busy else None
+        return stats
+
+    # -------------------- 內部 --------------------
+    def _incr(self, key: str, n: int = 1):
+        with self._lock:
+            self._counters[key] += n
+
+    def _call(self, func, *args, **kwargs):
+        """429 / 5xx / 網路錯誤重試；其他錯誤直接拋出"""
+        delay = self.backoff
+        attempt = 0
+        while True:
+            attempt += 1
+            started = time.monotonic()
+            self._incr("api_calls")
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self._add_busy(started)
+                status = _status(e)
+                if status == 409:
+                    # 同一個 retry_key 已被接受
+                    return None
+                retryable = status is None or status == 429 or status >= 500
+                if not retryable or attempt > self.max_retries:
+                    raise
+                self._incr("retries")
+                log.warning("[fanout] 呼叫失敗，%.1fs 後重試 status=%s error=%s", delay, status, e)
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+                continue
+            self._add_busy(started)
+            return result
+
+    def _add_busy(self, started: float):
+        with self._lock:
+            self._busy_seconds += time.monotonic() - started
+
+    def _send_batch(self, message, user_ids: List[str], depth: int = 0) -> Tuple[int, List[str]]:
+        """回傳 (成功人數, 失敗的 user_id)；收件人造成的 400 切半找出有問題的 user_id"""
+        self._incr("batches")
+        try:
+            self._call(self._client.multicast, user_ids, message, retry_key=str(uuid.uuid4()))
+            return len(user_ids), []
+        except Exception as e:
+            fault = _fault(e) if _status(e) == 400 else None
+            if fault == "messages":
+                self._incr("message_errors")
+            elif _status(e) == 400 and len(user_ids) > 1 and (fault == "to" or depth < self.max_split_depth):
+                self._incr("splits")
+                mid = len(user_ids) // 2
+                left = self._send_batch(message, user_ids[:mid], depth + 1)
+                right = self._send_batch(message, user_ids[mid:], depth + 1)
+                return left[0] + right[0], left[1] + right[1]
+            log.error("[fanout] ❌ multicast 失敗 recipients=%s error=%s", len(user_ids), e)
+            return 0, list(user_ids)
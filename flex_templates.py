@@ -3,7 +3,9 @@
 集中管理 Flex Message 模板
 """
 
-from typing import Dict, Any
+import json
+from functools import lru_cache
+from typing import Dict, Any, NamedTuple
 
 # -------------------- no_result_flex (沒有符合條件的物件) --------------------
 def no_result_card(liff_url: str) -> Dict[str, Any]:
@@ -1181,6 +1183,104 @@ def property_flex(doc_id: str, data: dict) -> dict:
     }
 
 
+# -------------------- Entrust (委託賣房回覆 / 房仲通知) --------------------
+def entrust_received_card() -> dict:
+    return {
+        "type": "bubble",
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {"type": "text", "text": "收到你的資料囉！", "weight": "bold", "size": "lg", "color": "#EB941E"},
+                {"type": "text", "text": "我們會盡快提供初估行情，協助你了解市場價位 💬", "wrap": True, "margin": "md"},
+            ]
+        }
+    }
+
+
+def entrust_agent_card(display_name: str, phone: str, area: str, layout: str, size: str) -> dict:
+    return {
+        "type": "bubble",
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                {"type": "text", "text": "🏡 新的屋主委託！", "weight": "bold", "size": "lg", "color": "#EB941E"},
+                {"type": "text", "text": f"👤 姓名：{display_name}", "wrap": True, "margin": "sm"},
+                {"type": "text", "text": f"📞 電話：{phone}", "wrap": True, "margin": "sm"},
+                {"type": "text", "text": f"📍 區域 / 社區：{area}", "wrap": True, "margin": "sm"},
+                {"type": "text", "text": f"🏠 格局 / 類型：{layout}", "wrap": True, "margin": "sm"},
+                {"type": "text", "text": f"📐 坪數：{size} 坪", "wrap": True, "margin": "sm"},
+                {"type": "separator", "margin": "md"},
+                {"type": "text", "text": "請儘快聯繫屋主，提供初估行情 🙌", "size": "sm", "color": "#555", "margin": "md"}
+            ]
+        }
+    }
+
+
+# -------------------- Booking (預約賞屋成功) --------------------
+def booking_success_card(house_title: str, name: str, phone: str, timeslot_cn: str) -> dict:
+    return {
+        "type": "bubble",
+        "size": "mega",
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "spacing": "md",
+            "contents": [
+                {"type": "text", "text": "✅ 預約成功！", "weight": "bold", "size": "lg", "color": "#EB941E"},
+                {"type": "text", "text": f"物件：{house_title}", "wrap": True},
+                {"type": "text", "text": f"姓名：{name}", "wrap": True},
+                {"type": "text", "text": f"電話：{phone}", "wrap": True},
+                {"type": "text", "text": f"時段：{timeslot_cn}", "wrap": True},
+                {"type": "separator", "margin": "md"},
+                {"type": "text", "text": "我們將盡快與您聯繫 🙏", "align": "center", "color": "#555555", "size": "sm"}
+            ]
+        }
+    }
+
+
+def booking_agent_text(house_title: str, name: str, phone: str, timeslot_cn: str) -> str:
+    return (
+        f"📢 有人預約囉！\n\n"
+        f"🏠 物件：{house_title}\n"
+        f"👤 姓名：{name}\n"
+        f"📞 電話：{phone}\n"
+        f"🕒 時段：{timeslot_cn}"
+    )
+
+
+# -------------------- Frozen (預先序列化的固定卡片) --------------------
+class FrozenMessage(NamedTuple):
+    """已序列化的 Flex 訊息物件（不可變），可直接拼進 reply / push 的 messages"""
+    alt_text: str
+    json: str
+
+
+def freeze_flex(alt_text: str, contents: dict) -> FrozenMessage:
+    message = {"type": "flex", "altText": alt_text, "contents": contents}
+    return FrozenMessage(alt_text, json.dumps(message, ensure_ascii=False, separators=(",", ":")))
+
+
+# 內容固定（或只跟 LIFF URL 有關）的卡片才能凍結
+_FREEZABLE = {
+    "seller_card": seller_card,
+    "search_card": search_card,
+    "intro_card": intro_card,
+    "buyer_card": buyer_card,
+    "no_result_card": no_result_card,
+}
+
+
+@lru_cache(maxsize=64)
+def frozen_flex(card: str, alt_text: str, *args) -> FrozenMessage:
+    """
+    回傳凍結後的卡片，每種 (card, alt_text, LIFF URL) 只會建立一次。
+    例：frozen_flex("buyer_card", "需求條件", liff_url)
+    """
+    return freeze_flex(alt_text, _FREEZABLE[card](*args))
+
+
 # -------------------- Export --------------------
 __all__ = [
     "buyer_card",
@@ -1190,5 +1290,12 @@ __all__ = [
     "listing_card",
     "search_card",
     "listings_to_carousel",
+    "entrust_received_card",
+    "entrust_agent_card",
+    "booking_success_card",
+    "booking_agent_text",
+    "FrozenMessage",
+    "freeze_flex",
+    "frozen_flex",
 ]
 
@@ -0,0 +1,88 @@
+# gunicorn.conf.py
+"""
+正式環境的 gunicorn 設定（Procfile: web: gunicorn -c gunicorn.conf.py app:app）
+
+Bot 的請求幾乎都在等 LINE API / Firestore（I/O-bound），預設用 gthread：
+少量行程 × 每個行程多條執行緒，webhook 事件本來就交給 dispatcher 的背景 worker 處理。
+
+環境變數：
+  GUNICORN_WORKER_CLASS         gthread（預設）| gevent | sync
+  WEB_CONCURRENCY               worker 行程數；沒設定時取 CPU 數，介於 2 ～ GUNICORN_MAX_WORKERS
+  GUNICORN_MAX_WORKERS          沒設 WEB_CONCURRENCY 時的上限，預設 4（每個 worker 各自有 Firestore 監聽與快取）
+  GUNICORN_THREADS              gthread 每個 worker 的執行緒數，預設 8
+  GUNICORN_WORKER_CONNECTIONS   gevent 每個 worker 同時處理的連線數，預設 200
+  GUNICORN_PRELOAD=1            master 先 import app 再 fork（模組程式碼 copy-on-write 共用，省記憶體）
+  GUNICORN_WARMUP               worker 啟動後的預熱：background（預設）| eager | off
+  GUNICORN_TIMEOUT              預設 30 秒
+  GUNICORN_MAX_REQUESTS         每個 worker 處理多少請求後重啟（0 = 不重啟），附 10% 抖動
+
+fork 安全：
+  gRPC channel、requests 連線池、執行緒池都不能跨 fork 共用。app.py 全部改成 Lazy（第一次使用才建立），
+  這裡預設 master 不預熱（WARMUP_MODE=off，運維明確設定時以環境變數為準）；--preload 時 post_fork 再呼叫 app.reset_after_fork() 把 master 建過的東西丟掉，
+  最後在 post_worker_init 於 worker 內預熱。
+
+gevent 需要另外安裝（pip install gevent），並在 worker 內呼叫 grpc 的 gevent 相容設定。
+ASGI 模式（asgi.py，需要另外 pip install uvicorn）：
+  GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:app
+  預熱改由 asgi.py 的 lifespan startup 負責。
+比較各 worker 模式：python benchmarks/bench_workers.py
+"""
+
+import multiprocessing
+import os
+import sys
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+# 每個 worker 都有自己的 listings / forms 監聽、快取與執行緒池：CPU 很多的機器上不要自動開到 CPU 數
+workers = int(os.getenv("WEB_CONCURRENCY") or
+              min(max(2, multiprocessing.cpu_count()), int(os.getenv("GUNICORN_MAX_WORKERS", 4))))
+threads = int(os.getenv("GUNICORN_THREADS", 8)) if worker_class == "gthread" else 1
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 200))
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "0") == "1"
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = 20
+# 前面有反向代理 / 平台 router 會重用連線
+keepalive = 5
+
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+errorlog = "-"
+
+# app.py import 時不要自己預熱：master 不能建立 gRPC channel / 執行緒，預熱改在 post_worker_init 做。
+# 運維明確設定 WARMUP_MODE 時不覆寫（--preload 搭配 eager 時 reset_after_fork 會記錄警告）
+os.environ.setdefault("WARMUP_MODE", "off")
+
+
+def post_fork(server, worker):
+    app_module = sys.modules.get("app")
+    if app_module is not None:
+        # --preload：app 已在 master import 過，丟掉繼承來的 client / 執行緒池
+        app_module.reset_after_fork()
+
+
+def post_worker_init(worker):
+    if worker_class == "gevent":
+        try:
+            from grpc.experimental import gevent as grpc_gevent
+            grpc_gevent.init_gevent()
+        except ImportError:
+            worker.log.warning("grpc 沒有 gevent 支援，Firestore 呼叫會阻塞整個 worker")
+
+    app_module = sys.modules.get("app")
+    if app_module is None or "asgi" in sys.modules:
+        return
+    mode = os.getenv("GUNICORN_WARMUP", "background")
+    if mode == "eager":
+        app_module.warmup()
+    elif mode == "background":
+        app_module.start_background_warmup()
+
+
+def worker_abort(worker):
+    worker.log.warning("worker %s 逾時被中止（timeout=%ss）", worker.pid, timeout)
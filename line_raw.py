@@ -0,0 +1,119 @@
+# line_raw.py
+"""
+直接送出預先序列化的訊息 JSON 到 LINE Messaging API
+
+LINE SDK 每次都會把 dict 轉成 model 再序列化一次；
+固定不變的 Flex 卡片已經先轉好 JSON 字串（flex_templates.FrozenMessage），
+這裡只負責把字串拼進 request body 直接送出。
+"""
+
+import json
+import logging
+import time
+from typing import List, Optional
+
+from metrics import LINE_API_ERRORS, observe_line_api
+
+log = logging.getLogger("line_raw")
+
+LINE_API_ENDPOINT = "https://api.line.me"
+
+
+class LineApiError(Exception):
+    """
+    LINE API 回傳非 2xx；status_code 供 outbox 判斷是否重試，
+    details 是錯誤回應裡的 details（[{"message": ..., "property": "to[3]"}]），fanout 用來判斷是誰的錯
+    """
+
+    def __init__(self, status_code: int, message: str = "", details: Optional[List[dict]] = None):
+        super().__init__(f"{status_code} {message}".strip())
+        self.status_code = status_code
+        self.details = details or []
+
+
+def error_details(text: str) -> List[dict]:
+    """LINE 錯誤回應 {"message": ..., "details": [...]} → details；不是 JSON 時回傳空 list"""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return []
+    details = data.get("details") if isinstance(data, dict) else None
+    return [d for d in details if isinstance(d, dict)] if isinstance(details, list) else []
+
+
+def _message_json(message) -> str:
+    if isinstance(message, str):
+        return message
+    if isinstance(message, dict):
+        return json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+    if hasattr(message, "as_json_dict"):
+        # line-bot-sdk v2 的 SendMessage model
+        return json.dumps(message.as_json_dict(), ensure_ascii=False, separators=(",", ":"))
+    return message.json
+
+
+def _messages_body(messages) -> str:
+    """
+    FrozenMessage / JSON 字串 / dict / SDK model（或它們的 list）→ JSON array 字串。
+    FrozenMessage 是 NamedTuple，要先當成單一訊息判斷，不能被當成 tuple 展開
+    """
+    if isinstance(messages, (str, dict)) or hasattr(messages, "json") or hasattr(messages, "as_json_dict"):
+        messages = [messages]
+    return "[" + ",".join(_message_json(m) for m in messages) + "]"
+
+
+class RawMessagingClient:
+    def __init__(self, session, access_token: str, endpoint: str = LINE_API_ENDPOINT,
+                 timeout=(1, 5)):
+        self._session = session
+        self._token = access_token
+        self.endpoint = endpoint.rstrip("/")
+        self.timeout = timeout
+
+    def _post(self, path: str, body: str, api: str, retry_key: Optional[str] = None):
+        """api：metrics 的標籤，與 metrics.instrument_line_api 相同（SDK 的方法名稱，例如 push_message）"""
+        headers = {
+            "Authorization": f"Bearer {self._token}",
+            "Content-Type": "application/json",
+        }
+        if retry_key:
+            headers["X-Line-Retry-Key"] = retry_key
+        started = time.perf_counter()
+        try:
+            r = self._session.post(self.endpoint + path, data=body.encode("utf-8"),
+                                   headers=headers, timeout=self.timeout)
+        except Exception as e:
+            observe_line_api(api, time.perf_counter() - started)
+            LINE_API_ERRORS.labels(api, type(e).__name__).inc()
+            raise
+        observe_line_api(api, time.perf_counter() - started, r.status_code)
+        if r.status_code // 100 != 2:
+            raise LineApiError(r.status_code, r.text[:200], error_details(r.text))
+        return r
+
+    def reply(self, reply_token: str, messages):
+        body = '{"replyToken":' + json.dumps(reply_token) + ',"messages":' + _messages_body(messages) + "}"
+        return self._post("/v2/bot/message/reply", body, "reply_message")
+
+    def push(self, to: str, messages, retry_key: Optional[str] = None):
+        body = '{"to":' + json.dumps(to) + ',"messages":' + _messages_body(messages) + "}"
+        return self._post("/v2/bot/message/push", body, "push_message", retry_key=retry_key)
+
+    def multicast(self, to: List[str], messages, retry_key: Optional[str] = None):
+        """一次送給最多 500 個 user_id"""
+        body = '{"to":' + json.dumps(list(to)) + ',"messages":' + _messages_body(messages) + "}"
+        return self._post("/v2/bot/message/multicast", body, "multicast", retry_key=retry_key)
+
+    def broadcast(self, messages, retry_key: Optional[str] = None):
+        body = '{"messages":' + _messages_body(messages) + "}"
+        return self._post("/v2/bot/message/broadcast", body, "broadcast", retry_key=retry_key)
+
+    def narrowcast(self, messages, recipient: Optional[dict] = None, filter: Optional[dict] = None,
+                   limit: Optional[dict] = None, retry_key: Optional[str] = None):
+        """recipient / filter / limit 依 LINE narrowcast API 的 JSON 結構傳入"""
+        extra = ""
+        for name, value in (("recipient", recipient), ("filter", filter), ("limit", limit)):
+            if value is not None:
+                extra += f',"{name}":' + json.dumps(value, ensure_ascii=False)
+        body = '{"messages":' + _messages_body(messages) + extra + "}"
+        return self._post("/v2/bot/message/narrowcast", body, "narrowcast", retry_key=retry_key)
@@ -0,0 +1,251 @@
+# listing_index.py
+"""
+物件記憶體索引（listings）
+
+啟動時以 Firestore on_snapshot 監聽 listings 集合，
+第一次同步完成後所有查詢（搜尋 / 精選 / 物件詳情）都直接從記憶體回答。
+下架（status == "inactive"）的物件不進索引，變成 inactive 時當成 REMOVED 通知 listener。
+"""
+
+import bisect
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from search_query import is_active
+
+log = logging.getLogger("listing_index")
+
+
+def _room_key(value) -> Optional[int]:
+    """room 可能是 int / float / 字串，統一成 int 當索引 key"""
+    if value is None or value == "":
+        return None
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _price_key(value) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ListingIndex:
+    """
+    listings 的行程內索引：
+      - docs:      doc_id -> data
+      - by_genre:  genre  -> {doc_id}
+      - by_room:   room   -> {doc_id}
+      - prices:    依價格排序的 [(price, doc_id)]，用 bisect 取區間
+    每套用一次 snapshot，version 就 +1，方便上層判斷資料是否變動。
+    """
+
+    def __init__(self, collection_ref):
+        self._col = collection_ref
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._watch = None
+        self._listeners = []
+        self._resyncing = False
+        self._reset()
+
+        self.version = 0
+        self.read_time = None
+
+    def _reset(self):
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._by_genre: Dict[str, set] = {}
+        self._by_room: Dict[int, set] = {}
+        self._prices: List[Tuple[float, str]] = []
+        self._no_price: set = set()
+        self._top: set = set()
+
+    # -------------------- 生命週期 --------------------
+    def start(self):
+        if self._watch is None:
+            self._watch = self._col.on_snapshot(self._on_snapshot)
+            log.info("[listing_index] 🔄 開始監聽 listings")
+        return self
+
+    def stop(self):
+        if self._watch is not None:
+            try:
+                self._watch.unsubscribe()
+            except Exception as e:
+                log.warning("[listing_index] unsubscribe 失敗: %s", e)
+            self._watch = None
+
+    @property
+    def ready(self) -> bool:
+        """第一次 snapshot 同步完成前為 False，呼叫端應退回即時查詢"""
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def _resubscribe(self):
+        """首次同步失敗後重新訂閱，讓 Firestore 再送一次完整的 snapshot"""
+        self.stop()
+        with self._lock:
+            self._resyncing = False
+        self.start()
+
+    def add_listener(self, func):
+        """註冊變動回呼 func(changes, version)，changes 為 [(type, doc_id, old, new)]"""
+        self._listeners.append(func)
+        return func
+
+    # -------------------- snapshot 套用 --------------------
+    def _on_snapshot(self, col_snapshot, changes, read_time):
+        applied = []
+        # 首次同步是整個集合：價格先全部 append，最後排序一次（逐筆 insort 是 O(n²)）
+        bulk = not self._ready.is_set()
+        try:
+            with self._lock:
+                if self._resyncing:
+                    # 舊的監聽還沒停掉前送來的差異，不能當成完整集合
+                    return
+                if bulk:
+                    self._reset()
+                for change in changes:
+                    doc = change.document
+                    kind = change.type.name  # ADDED / MODIFIED / REMOVED
+                    old = self._remove(doc.id)
+                    new = None
+                    if kind != "REMOVED":
+                        new = doc.to_dict() or {}
+                        if not is_active(new):
+                            kind, new = "REMOVED", None
+                    if new is not None:
+                        self._insert(doc.id, new, keep_sorted=not bulk)
+                    applied.append((kind, doc.id, old, new))
+                if bulk:
+                    self._prices.sort()
+                self.version += 1
+                self.read_time = read_time
+                version = self.version
+        except Exception:
+            log.exception("[listing_index] 套用 snapshot 失敗")
+            if bulk:
+                # 套用到一半的索引（價格也還沒排序）整個丟掉，維持未就緒讓查詢退回 Firestore；
+                # 之後的 snapshot 只有差異，所以要重新訂閱拿完整集合（不能在監聽執行緒裡 unsubscribe）
+                with self._lock:
+                    self._reset()
+                    self._resyncing = True
+                threading.Thread(target=self._resubscribe, name="listing-index-resync", daemon=True).start()
+            return
+
+        if not self._ready.is_set():
+            self._ready.set()
+            log.info("[listing_index] ✅ 首次同步完成 docs=%s version=%s", len(self._docs), version)
+        else:
+            log.info("[listing_index] 套用 %s 筆變動 version=%s", len(applied), version)
+
+        for func in list(self._listeners):
+            try:
+                func(applied, version)
+            except Exception:
+                log.exception("[listing_index] listener 執行失敗")
+
+    def _insert(self, doc_id: str, data: Dict[str, Any], keep_sorted: bool = True):
+        """keep_sorted=False 時價格只 append，呼叫端負責之後排序 _prices"""
+        self._docs[doc_id] = data
+
+        genre = data.get("genre")
+        if genre:
+            self._by_genre.setdefault(genre, set()).add(doc_id)
+
+        room = _room_key(data.get("room"))
+        if room is not None:
+            self._by_room.setdefault(room, set()).add(doc_id)
+
+        price = _price_key(data.get("price"))
+        if price is None:
+            self._no_price.add(doc_id)
+        elif keep_sorted:
+            bisect.insort(self._prices, (price, doc_id))
+        else:
+            self._prices.append((price, doc_id))
+
+        if data.get("top") is True:
+            self._top.add(doc_id)
+
+    def _remove(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        data = self._docs.pop(doc_id, None)
+        if data is None:
+            return None
+
+        genre = data.get("genre")
+        if genre and genre in self._by_genre:
+            self._by_genre[genre].discard(doc_id)
+
+        room = _room_key(data.get("room"))
+        if room is not None and room in self._by_room:
+            self._by_room[room].discard(doc_id)
+
+        price = _price_key(data.get("price"))
+        if price is None:
+            self._no_price.discard(doc_id)
+        else:
+            i = bisect.bisect_left(self._prices, (price, doc_id))
+            if i < len(self._prices) and self._prices[i] == (price, doc_id):
+                del self._prices[i]
+
+        self._top.discard(doc_id)
+        return data
+
+    # -------------------- 查詢 --------------------
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """回傳物件資料（唯讀，請勿修改）；不存在回傳 None"""
+        with self._lock:
+            return self._docs.get(doc_id)
+
+    def search(self, room: Optional[int] = None, genre: Optional[str] = None,
+               min_price=None, max_price=None,
+               limit: Optional[int] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        依 room / genre / 價格區間篩選，結果依價格由低到高排序。
+        與舊版行為一致：沒有價格的物件不受預算限制，排在最後。
+        """
+        with self._lock:
+            allowed = None
+            if genre:
+                allowed = self._by_genre.get(genre, set())
+            if room:
+                room_ids = self._by_room.get(room, set())
+                allowed = room_ids if allowed is None else (allowed & room_ids)
+
+            lo = 0
+            hi = len(self._prices)
+            if min_price:
+                lo = bisect.bisect_left(self._prices, (float(min_price), ""))
+            if max_price:
+                hi = bisect.bisect_right(self._prices, (float(max_price), "\uffff"))
+
+            results = []
+            for _, doc_id in self._prices[lo:hi]:
+                if allowed is None or doc_id in allowed:
+                    results.append((doc_id, self._docs[doc_id]))
+                    if limit and len(results) >= limit:
+                        return results
+
+            for doc_id in sorted(self._no_price):
+                if allowed is None or doc_id in allowed:
+                    results.append((doc_id, self._docs[doc_id]))
+                    if limit and len(results) >= limit:
+                        break
+            return results
+
+    def top(self, limit: int = 5) -> List[Tuple[str, Dict[str, Any]]]:
+        """精選物件（top == True），依 doc_id 排序，與 Firestore 預設順序一致"""
+        with self._lock:
+            return [(doc_id, self._docs[doc_id]) for doc_id in sorted(self._top)[:limit]]
+
+    def __len__(self):
+        return len(self._docs)
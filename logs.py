@@ -0,0 +1,268 @@
+# logs.py
+"""
+非阻塞的結構化 log
+
+  setup_logging()        root logger 只掛一個 QueueHandler：呼叫端只把 record 放進佇列，
+                         格式化、JSON 序列化、遮罩、寫 stderr 都在 QueueListener 的背景執行緒
+  request_context(rid)   目前 request / webhook 事件的 request_id（contextvars），每一行 log 都會帶上
+  payload(obj)           大型 payload（webhook body、表單 dict）：真的要輸出時才序列化，過長就截斷並抽樣
+
+log 一律用 %-style 參數（log.info("[x] id=%s", doc_id)）：等級沒開時完全不格式化；
+參數都是不可變的簡單型別時，連 getMessage() 都留到背景執行緒做。
+電話號碼、email 在輸出前遮罩（0912***678、a***@example.com）。
+
+環境變數：
+  LOG_LEVEL                 預設 INFO
+  LOG_FORMAT                json（預設）| text（本機開發好讀）
+  LOG_QUEUE_SIZE            佇列上限，預設 10000；滿了直接丟棄並計數，不阻塞 request
+  LOG_PAYLOAD_MAX_CHARS     payload 超過這個長度就截斷，預設 512
+  LOG_PAYLOAD_SAMPLE_RATE   超過長度的 payload 有多少比例會輸出（截斷後），預設 0.01；沒抽中的只記長度
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", 512))
+PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", 0.01))
+
+
+# -------------------- request_id --------------------
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def get_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def set_request_id(request_id: Optional[str] = None):
+    """設定目前 context 的 request_id（沒給就產生一個；外部帶進來的最多取 64 字）；回傳 token 給 reset_request_id"""
+    return _request_id.set(request_id[:64] if request_id else new_request_id())
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+@contextmanager
+def request_context(request_id: Optional[str] = None):
+    """背景 worker 處理某個 request 排入的工作時，沿用那個 request 的 request_id"""
+    token = set_request_id(request_id)
+    try:
+        yield _request_id.get()
+    finally:
+        _request_id.reset(token)
+
+
+# -------------------- PII 遮罩 --------------------
+# 手機 0912345678 / 0912-345-678 / +886 912 345 678、市話 03-1234567；
+# 前後不能接英數字，避免誤遮 reply token、user_id 之類的 hex 字串
+_PHONE_RE = re.compile(r"(?<![0-9A-Za-z])(?:\+886[-\s]?|0)\d(?:[-\s]?\d){7,9}(?![0-9A-Za-z])")
+_EMAIL_RE = re.compile(r"(?<![\w.+-])([\w.+-])[\w.+-]*@([\w-]+(?:\.[\w-]+)+)")
+
+
+def _mask_phone(m: "re.Match") -> str:
+    s = m.group(0)
+    return f"{s[:4]}***{s[-3:]}"
+
+
+def mask_pii(text: str) -> str:
+    if not text:
+        return text
+    text = _PHONE_RE.sub(_mask_phone, text)
+    return _EMAIL_RE.sub(r"\1***@\2", text)
+
+
+# -------------------- payload 截斷 / 抽樣 --------------------
+class Payload:
+    """
+    延後序列化的 payload。建立時就決定是否抽中（只花一次 random()），
+    輸出時才 json.dumps：不超過 max_chars 全部輸出，超過時抽中的截斷輸出、沒抽中的只記長度。
+    """
+
+    __slots__ = ("obj", "max_chars", "sampled")
+
+    def __init__(self, obj: Any, max_chars: Optional[int] = None, sample_rate: Optional[float] = None):
+        self.obj = obj
+        self.max_chars = PAYLOAD_MAX_CHARS if max_chars is None else max_chars
+        rate = PAYLOAD_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.sampled = rate >= 1 or random.random() < rate
+
+    def __str__(self) -> str:
+        obj = self.obj
+        if isinstance(obj, bytes):
+            obj = obj.decode("utf-8", "replace")
+        text = obj if isinstance(obj, str) else json.dumps(obj, ensure_ascii=False, default=str)
+        n = len(text)
+        if n <= self.max_chars:
+            return text
+        if not self.sampled:
+            return f"<{n} chars, 未抽樣>"
+        return f"{text[:self.max_chars]}…(+{n - self.max_chars} chars)"
+
+    __repr__ = __str__
+
+
+def payload(obj: Any, max_chars: Optional[int] = None, sample_rate: Optional[float] = None) -> Payload:
+    return Payload(obj, max_chars, sample_rate)
+
+
+# -------------------- formatter（在背景執行緒執行） --------------------
+# LogRecord 本身的屬性；其他的（extra=...）才當成額外欄位輸出
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": mask_pii(record.getMessage()),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        entry["thread"] = record.threadName
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = mask_pii(value) if isinstance(value, str) else value
+        if record.exc_text:
+            entry["exc"] = mask_pii(record.exc_text)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        if getattr(record, "request_id", None) is None:
+            record.request_id = "-"
+        return mask_pii(super().format(record))
+
+
+# -------------------- queue handler / listener --------------------
+_SAFE_ARG_TYPES = (str, int, float, bool, type(None))
+
+
+def _deferrable(args) -> bool:
+    """參數都不會在 log 之後被改動 → getMessage() 可以留到背景執行緒"""
+    values = args.values() if isinstance(args, dict) else args
+    for v in values:
+        if isinstance(v, Payload):
+            if not isinstance(v.obj, (str, bytes)):
+                return False
+        elif not isinstance(v, _SAFE_ARG_TYPES):
+            return False
+    return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """呼叫端只做最少的事：記下 request_id、必要時先格式化，put_nowait；佇列滿了丟棄並計數"""
+
+    def __init__(self, q: "queue.Queue"):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # contextvars 只在呼叫端的執行緒 / task 裡看得到
+        record.request_id = _request_id.get()
+        if record.exc_info:
+            # traceback 會抓住整串 frame（含區域變數），先轉成文字再跨執行緒
+            record.exc_text = _EXC_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        if record.args and not _deferrable(record.args):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # 佇列滿時 put_nowait 會丟例外；停止時可以等一下讓背景執行緒消化
+        try:
+            self.queue.put(self._sentinel, timeout=2)
+        except queue.Full:
+            pass
+
+
+_EXC_FORMATTER = logging.Formatter()
+_handler: Optional[_NonBlockingQueueHandler] = None
+_listener: Optional[_Listener] = None
+
+
+def _start_listener(q: "queue.Queue") -> _Listener:
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+    listener = _Listener(q, stream, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def setup_logging(level: Optional[str] = None):
+    """取代 logging.basicConfig：root logger 改成只掛 QueueHandler；重複呼叫不會重複安裝"""
+    global _handler, _listener
+    root = logging.getLogger()
+    root.setLevel(level or LOG_LEVEL)
+    if _handler is not None:
+        return
+    q: "queue.Queue" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _handler = _NonBlockingQueueHandler(q)
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(_handler)
+    _listener = _start_listener(q)
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """寫完佇列裡剩下的 log（程式結束時自動呼叫）"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def after_fork():
+    """
+    fork 之後在子行程呼叫：listener 執行緒沒有跟著過來，繼承的佇列鎖也可能停在被拿走的狀態，
+    換一個新佇列重新啟動 listener。
+    """
+    global _listener
+    if _handler is None:
+        return
+    q: "queue.Queue" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _handler.queue = q
+    _listener = _start_listener(q)
+
+
+def stats() -> Dict[str, Any]:
+    if _handler is None:
+        return {"installed": False}
+    return {"installed": True, "format": LOG_FORMAT, "queued": _handler.queue.qsize(),
+            "capacity": LOG_QUEUE_SIZE, "dropped": _handler.dropped}
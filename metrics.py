@@ -0,0 +1,285 @@
+# metrics.py
+"""
+Prometheus 格式的指標（/metrics）
+
+不依賴 prometheus_client：Counter / Histogram 只在記憶體裡累加，
+observe() 是一次 bisect 加上一把鎖，放在熱路徑上的成本很低。
+指標以行程為單位；gunicorn 多個 worker 時 Prometheus 會把每個 worker 當成不同的 instance 抓取。
+
+  FIRESTORE_SECONDS.labels("forms.get").observe(dt)
+  with LINE_API_SECONDS.labels("push_message").time(): ...
+
+主要指標：
+  http_request_duration_seconds{route,method,status}
+  webhook_event_duration_seconds{event}
+  firestore_call_duration_seconds{op}        / firestore_errors_total{op}
+  line_api_call_duration_seconds{api}        / line_api_errors_total{api,status}
+  flex_render_duration_seconds{template}
+"""
+
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 秒；涵蓋本機快取命中（< 1ms）到外部 API 逾時（數秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要 labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def expose(self) -> str:
+        head = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return head + "".join(line + "\n" for line in self._samples())
+
+
+class _CounterChild:
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        """沒有 label 的 counter"""
+        self.labels().inc(amount)
+
+    def _samples(self):
+        items = sorted(self._children.items())
+        return [f"{self.name}{_label_str(self.labelnames, k)} {_fmt(c.value)}" for k, c in items]
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "_counts", "_sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._bounds = bounds
+        self._counts = [0] * (len(bounds) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self._counts), self._sum
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(float(b) for b in buckets if b != float("inf")))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _samples(self):
+        lines = []
+        for key, child in sorted(self._children.items()):
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = f'le="{_fmt(bound)}"'
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class GaugeFunc(_Metric):
+    """抓取時才呼叫 func() 取值，用來輸出佇列深度等既有統計"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, func: Callable[[], float], registry=None):
+        self._func = func
+        super().__init__(name, documentation, (), registry)
+
+    def _samples(self):
+        try:
+            value = self._func()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        return [f"{self.name} {_fmt(value)}"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指標名稱重複: {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def unregister(self, name: str):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def expose(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "".join(m.expose() for m in metrics)
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def gauge(name: str, documentation: str, func: Callable[[], float]) -> GaugeFunc:
+    """重複註冊同名 gauge 時以新的取代（例如測試中重建元件）"""
+    REGISTRY.unregister(name)
+    return GaugeFunc(name, documentation, func)
+
+
+# -------------------- 共用指標 --------------------
+HTTP_SECONDS = Histogram("http_request_duration_seconds", "Flask route 處理時間",
+                         ("route", "method", "status"))
+WEBHOOK_EVENT_SECONDS = Histogram("webhook_event_duration_seconds", "webhook 事件 handler 執行時間",
+                                  ("event",))
+WEBHOOK_EVENT_ERRORS = Counter("webhook_event_errors_total", "webhook 事件 handler 例外次數", ("event",))
+WEBHOOK_EVENTS_SHED = Counter("webhook_events_shed_total", "webhook 佇列已滿而丟棄的事件數（LINE 已收到 200，不會重送）",
+                              ("event",))
+FIRESTORE_SECONDS = Histogram("firestore_call_duration_seconds", "Firestore 呼叫時間（每次往返）", ("op",))
+FIRESTORE_ERRORS = Counter("firestore_errors_total", "Firestore 呼叫失敗次數", ("op",))
+LINE_API_SECONDS = Histogram("line_api_call_duration_seconds", "LINE Messaging API 呼叫時間", ("api",))
+LINE_API_ERRORS = Counter("line_api_errors_total", "LINE Messaging API 失敗次數", ("api", "status"))
+FLEX_RENDER_SECONDS = Histogram("flex_render_duration_seconds", "Flex 模板產生時間（快取未命中）",
+                                ("template",))
+
+
+@contextmanager
+def firestore_call(op: str):
+    """Firestore 往返計時；create() 撞到已存在（409）是預期中的結果，不算錯誤"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        if getattr(e, "code", None) != 409 and type(e).__name__ not in ("Conflict", "AlreadyExists"):
+            FIRESTORE_ERRORS.labels(op).inc()
+        raise
+    finally:
+        FIRESTORE_SECONDS.labels(op).observe(time.perf_counter() - started)
+
+
+def _status_of(e: Exception) -> str:
+    status = getattr(e, "status_code", None) or getattr(e, "status", None)
+    return str(status) if status else type(e).__name__
+
+
+def instrument_line_api(client, names: Iterable[str] = ("reply_message", "push_message", "multicast",
+                                                         "get_profile", "broadcast", "narrowcast")):
+    """把 LineBotApi 實例上的方法包成有計時的版本（就地替換，回傳同一個物件）"""
+    for name in names:
+        func = getattr(client, name, None)
+        if func is None:
+            continue
+
+        def wrap(func=func, api=name):
+            hist = LINE_API_SECONDS.labels(api)
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    LINE_API_ERRORS.labels(api, _status_of(e)).inc()
+                    raise
+                finally:
+                    hist.observe(time.perf_counter() - started)
+            return wrapper
+
+        setattr(client, name, wrap())
+    return client
+
+
+def observe_line_api(api: str, seconds: float, status: Optional[int] = None):
+    LINE_API_SECONDS.labels(api).observe(seconds)
+    if status is not None and status // 100 != 2:
+        LINE_API_ERRORS.labels(api, str(status)).inc()
+
+
+def render() -> str:
+    return REGISTRY.expose()
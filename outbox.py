@@ -0,0 +1,176 @@
+# outbox.py
+"""
+非同步推播佇列（push_message）
+
+表單 API 只負責把訊息排進佇列，由背景 worker 實際呼叫 LINE API：
+  - 同一個使用者固定分到同一個 worker → 保持訊息順序
+  - 429 / 5xx / 網路錯誤以指數退避重試，並帶 retry_key 確保不重複送達
+  - 佇列滿時最多等 put_timeout 秒，還是滿的就丟棄並計數（不在 request 執行緒上同步送出、重試）
+  - stats() 回報佇列深度與送達延遲
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from logs import get_request_id, request_context
+
+log = logging.getLogger("outbox")
+
+_STOP = object()
+
+
+def _is_retryable(e: Exception) -> bool:
+    """429 / 5xx / 沒有 status_code 的網路錯誤才重試"""
+    status = getattr(e, "status_code", None)
+    if status is None:
+        return True
+    return status == 429 or status >= 500
+
+
+class _Job:
+    __slots__ = ("to", "messages", "tag", "retry_key", "enqueued_at", "attempts", "request_id")
+
+    def __init__(self, to, messages, tag):
+        self.to = to
+        self.messages = messages
+        self.tag = tag
+        self.retry_key = str(uuid.uuid4())
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+        self.request_id = get_request_id()
+
+
+class Outbox:
+    def __init__(self, send_func: Callable[..., Any], workers: int = 4, maxsize: int = 1000,
+                 max_retries: int = 3, backoff: float = 0.5, max_backoff: float = 8.0,
+                 put_timeout: float = 0.2):
+        """
+        send_func:   例如 line_bot_api.push_message，呼叫方式為 send_func(to, messages, retry_key=...)
+        maxsize:     所有 worker 佇列的總容量
+        put_timeout: 佇列滿時呼叫端最多等幾秒，超過就丟棄這則推播（計入 dropped）
+        """
+        self._send = send_func
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        per_shard = max(1, maxsize // max(1, workers))
+        self._queues = [queue.Queue(maxsize=per_shard) for _ in range(workers)]
+        self._threads = []
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1024)
+        self._counters = {"enqueued": 0, "sent": 0, "failed": 0, "retried": 0, "dropped": 0}
+
+        for i, q in enumerate(self._queues):
+            t = threading.Thread(target=self._worker, args=(q,), name=f"outbox-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        atexit.register(self.stop)
+
+    # -------------------- 對外介面 --------------------
+    def push(self, to: str, messages, tag: str = "") -> bool:
+        """排入推播；回傳 True 代表已進佇列，False 代表佇列持續滿載、這則推播已丟棄"""
+        if not to:
+            return False
+        job = _Job(to, messages, tag)
+        q = self._queues[zlib.crc32(to.encode("utf-8")) % len(self._queues)]
+        try:
+            q.put_nowait(job)
+        except queue.Full:
+            try:
+                q.put(job, timeout=self.put_timeout)
+            except queue.Full:
+                self._incr("dropped")
+                log.error("[outbox] ❌ 佇列已滿 %.1fs，丟棄推播 tag=%s to=%s", self.put_timeout, tag, to)
+                return False
+        self._incr("enqueued")
+        return True
+
+    def dropped(self) -> int:
+        with self._lock:
+            return self._counters["dropped"]
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lat = sorted(self._latencies)
+            counters = dict(self._counters)
+
+        def pct(p):
+            if not lat:
+                return None
+            return round(lat[min(len(lat) - 1, int(len(lat) * p))] * 1000, 1)
+
+        counters.update({
+            "depth": self.depth(),
+            "workers": len(self._threads),
+            "latency_ms_p50": pct(0.50),
+            "latency_ms_p95": pct(0.95),
+            "latency_ms_p99": pct(0.99),
+        })
+        return counters
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        """送出剩餘訊息後停止 worker（程式結束時自動呼叫）"""
+        for q in self._queues:
+            try:
+                q.put(_STOP, timeout=timeout)
+            except queue.Full:
+                pass
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    # -------------------- worker --------------------
+    def _incr(self, key: str, n: int = 1):
+        with self._lock:
+            self._counters[key] += n
+
+    def _worker(self, q: "queue.Queue"):
+        while True:
+            job = q.get()
+            if job is _STOP:
+                return
+            try:
+                with request_context(job.request_id):
+                    self._deliver(job)
+            except Exception:
+                log.exception("[outbox] worker 例外")
+
+    def _deliver(self, job: _Job):
+        delay = self.backoff
+        while True:
+            job.attempts += 1
+            try:
+                self._send(job.to, job.messages, retry_key=job.retry_key)
+            except Exception as e:
+                status = getattr(e, "status_code", None)
+                if status == 409:
+                    # 同一個 retry_key 已被 LINE 接受過 → 視為成功
+                    break
+                if job.attempts > self.max_retries or not _is_retryable(e):
+                    self._incr("failed")
+                    log.error("[outbox] ❌ 推播失敗 tag=%s to=%s attempts=%s error=%s", job.tag, job.to, job.attempts, e)
+                    return
+                self._incr("retried")
+                log.warning("[outbox] 推播失敗，%.1fs 後重試 tag=%s to=%s error=%s", delay, job.tag, job.to, e)
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+                continue
+            break
+
+        elapsed = time.monotonic() - job.enqueued_at
+        with self._lock:
+            self._counters["sent"] += 1
+            self._latencies.append(elapsed)
+        log.info("[outbox] ✅ 推播成功 tag=%s to=%s latency=%.0fms", job.tag, job.to, elapsed * 1000)
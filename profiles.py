@@ -0,0 +1,237 @@
+# profiles.py
+"""
+使用者名稱快取（display_name）
+
+查詢順序：記憶體 LRU+TTL → Firestore users 集合 → 呼叫 LINE get_profile。
+快取與 users 都沒有資料時最多同步等 fetch_timeout 秒，避免把「未知使用者」寫進表單；
+逾時才回傳預設名稱，抓取繼續在背景完成。
+FollowEvent / MessageEvent 會預先暖機；背景執行緒只更新最近被讀過、快過期的名稱。
+"""
+
+import concurrent.futures
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Optional, Tuple
+
+log = logging.getLogger("profiles")
+
+DEFAULT_NAME = "未知使用者"
+
+
+def user_doc(user_id: str, display_name: str, picture_url: Optional[str] = None) -> dict:
+    """users/{user_id} 的內容（set merge=True）"""
+    payload = {
+        "user_id": user_id,
+        "display_name": display_name,
+        "profile_fetched_at": datetime.now(timezone.utc),
+    }
+    if picture_url:
+        payload["picture_url"] = picture_url
+    return payload
+
+
+class ProfileResolver:
+    def __init__(self, fetch_profile: Callable, users=None, maxsize: int = 4096,
+                 ttl: float = 6 * 3600, refresh_interval: float = 300, workers: int = 2,
+                 fetch_timeout: float = 1.5, active_window: float = 3600):
+        """
+        fetch_profile: line_bot_api.get_profile
+        users:         repo.users（repository.Users，讀寫都計入該 request 的 Firestore 往返次數），None 代表不寫入 Firestore
+        ttl:           超過 ttl 的名稱仍會回傳，但會排入背景更新
+        fetch_timeout: 完全沒有資料時同步等 get_profile 的上限（秒）；0 代表不等
+        active_window: 背景更新只處理這段時間內被讀過的名稱，其餘等下次讀取時再更新
+        """
+        self._fetch = fetch_profile
+        self._users = users
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.fetch_timeout = fetch_timeout
+        self.active_window = active_window
+
+        self._cache = OrderedDict()  # user_id -> (display_name, fetched_at, read_at)
+        self._lock = threading.Lock()
+        self._inflight = {}          # user_id -> Future
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="profiles")
+        self._counters = {"hit": 0, "stale": 0, "store_hit": 0, "miss": 0, "fetched": 0, "fetch_failed": 0,
+                          "fetch_timeout": 0}
+
+        self._stopped = threading.Event()
+        if refresh_interval:
+            threading.Thread(target=self._refresh_loop, name="profiles-refresh", daemon=True).start()
+
+    # -------------------- 對外介面 --------------------
+    def display_name(self, user_id: str, default: str = DEFAULT_NAME) -> str:
+        """回傳快取中的名稱；完全沒有資料時最多等 fetch_timeout 秒抓取，逾時回傳 default"""
+        if not user_id:
+            return default
+        name = self.cached(user_id)
+        if name is not None:
+            return name
+        name = self._load_from_store(user_id)
+        with self._lock:
+            self._counters["store_hit" if name else "miss"] += 1
+        if name:
+            return name
+        future = self.warm(user_id, force=True)
+        if future is not None and self.fetch_timeout > 0:
+            try:
+                future.result(timeout=self.fetch_timeout)
+            except concurrent.futures.TimeoutError:
+                with self._lock:
+                    self._counters["fetch_timeout"] += 1
+                log.warning("[profiles] get_profile 超過 %.1fs，先用預設名稱 user_id=%s", self.fetch_timeout, user_id)
+            name = self.cached(user_id)
+        return name or default
+
+    def cached(self, user_id: str) -> Optional[str]:
+        """只查記憶體（不碰 Firestore）；過期的名稱照樣回傳並排入背景更新，沒有資料回傳 None"""
+        name, fresh = self.lookup(user_id)
+        if name is not None and not fresh:
+            self.warm(user_id, force=True)
+        return name
+
+    def lookup(self, user_id: str) -> Tuple[Optional[str], bool]:
+        """同 cached()，但過期時不排入背景更新：回傳 (名稱, 是否還在 ttl 內)，由呼叫端自己更新"""
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if entry is None:
+                return None, False
+            self._cache.move_to_end(user_id)
+            name, fetched_at, _ = entry
+            self._cache[user_id] = (name, fetched_at, now)
+            fresh = now - fetched_at < self.ttl
+            self._counters["hit" if fresh else "stale"] += 1
+        return name, fresh
+
+    def accept_stored(self, user_id: str, data: Optional[dict], refresh: bool = True) -> Optional[str]:
+        """
+        呼叫端自己讀了 users/{user_id}（例如 asgi.py 用 AsyncClient）之後交給這裡：
+        寫入快取並回傳名稱；沒有資料回傳 None（不等待，由呼叫端自己抓 profile）。
+        refresh=False：名稱過期時不排入背景更新（呼叫端用 lookup() 判斷後自己抓）
+        """
+        name = self._accept_doc(user_id, data, refresh)
+        with self._lock:
+            self._counters["store_hit" if name else "miss"] += 1
+        return name
+
+    def warm(self, user_id: Optional[str], force: bool = False) -> Optional[concurrent.futures.Future]:
+        """背景抓取 profile，回傳該次抓取的 Future；force=False 時快取仍新鮮就略過（回傳 None）"""
+        if not user_id:
+            return None
+        with self._lock:
+            if not force:
+                entry = self._cache.get(user_id)
+                if entry is not None and time.time() - entry[1] < self.ttl:
+                    return None
+            future = self._inflight.get(user_id)
+            if future is not None:
+                return future
+            try:
+                future = self._executor.submit(self._refresh, user_id)
+            except RuntimeError:
+                # executor 已關閉（程式結束中）
+                return None
+            self._inflight[user_id] = future
+        return future
+
+    def put(self, user_id: str, display_name: str, write_through: bool = True):
+        """
+        已經拿到名稱（例如 LIFF 前端送來）時直接寫入快取；
+        write_through=False 代表 users 由呼叫端自己寫（例如和其他寫入合併成一次 batch）
+        """
+        if not user_id or not display_name:
+            return
+        self._set(user_id, display_name)
+        if write_through:
+            self._write_store(user_id, display_name)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._cache)
+            stats["inflight"] = len(self._inflight)
+        return stats
+
+    def stop(self):
+        self._stopped.set()
+        self._executor.shutdown(wait=False)
+
+    # -------------------- 內部 --------------------
+    def _set(self, user_id: str, display_name: str, fetched_at: Optional[float] = None):
+        with self._lock:
+            entry = self._cache.get(user_id)
+            read_at = entry[2] if entry is not None else time.time()
+            self._cache[user_id] = (display_name, time.time() if fetched_at is None else fetched_at, read_at)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def _load_from_store(self, user_id: str) -> Optional[str]:
+        if self._users is None:
+            return None
+        try:
+            data = self._users.get(user_id)
+        except Exception as e:
+            log.warning("[profiles] 讀取 users 失敗 user_id=%s: %s", user_id, e)
+            return None
+        return self._accept_doc(user_id, data)
+
+    def _accept_doc(self, user_id: str, data: Optional[dict], refresh: bool = True) -> Optional[str]:
+        if not data:
+            return None
+        name = data.get("display_name")
+        if not name:
+            return None
+        updated_at = data.get("profile_fetched_at")
+        fetched_at = updated_at.timestamp() if hasattr(updated_at, "timestamp") else 0
+        self._set(user_id, name, fetched_at)
+        if refresh and time.time() - fetched_at >= self.ttl:
+            self.warm(user_id, force=True)
+        return name
+
+    def _write_store(self, user_id: str, display_name: str, picture_url: Optional[str] = None):
+        if self._users is None:
+            return
+        try:
+            self._users.set(user_id, user_doc(user_id, display_name, picture_url), merge=True)
+        except Exception as e:
+            log.warning("[profiles] 寫入 users 失敗 user_id=%s: %s", user_id, e)
+
+    def _refresh(self, user_id: str):
+        try:
+            profile = self._fetch(user_id)
+            name = profile.display_name
+            self._set(user_id, name)
+            self._write_store(user_id, name, getattr(profile, "picture_url", None))
+            with self._lock:
+                self._counters["fetched"] += 1
+            log.info("[profiles] 更新名稱 user_id=%s name=%s", user_id, name)
+        except Exception as e:
+            with self._lock:
+                self._counters["fetch_failed"] += 1
+            log.warning("[profiles] get_profile 失敗 user_id=%s: %s", user_id, e)
+        finally:
+            with self._lock:
+                self._inflight.pop(user_id, None)
+
+    def _refresh_loop(self):
+        """
+        定期把快過期（超過 ttl 的 80%）、且 active_window 內被讀過的名稱排入背景更新；
+        很久沒人讀的名稱不主動打 LINE API，下次讀到時會走過期更新
+        """
+        while not self._stopped.wait(self.refresh_interval):
+            now = time.time()
+            cutoff = now - self.ttl * 0.8
+            active = now - self.active_window
+            with self._lock:
+                due = [uid for uid, (_, fetched_at, read_at) in self._cache.items()
+                       if fetched_at < cutoff and read_at >= active]
+            for uid in due:
+                self.warm(uid, force=True)
+            if due:
+                log.info("[profiles] 背景更新 %s 筆名稱", len(due))
@@ -0,0 +1,106 @@
+# render_cache.py
+"""
+物件 Flex 卡片快取
+
+以 (doc_id, updated_at) 為版本：同一個版本的物件只 render 一次，
+物件更新後 updated_at 改變就會自動重畫；listings 監聽器也會主動 invalidate。
+有 shared（SharedCache）時，行程內沒命中會先查同機器其他 worker 畫好的卡片。
+回傳的 dict 會被多個 carousel 共用，呼叫端請勿修改。
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from metrics import FLEX_RENDER_SECONDS
+from startup import Lazy
+
+log = logging.getLogger("render_cache")
+
+
+class RenderCache:
+    def __init__(self, render: Callable[[str, dict], Any], maxsize: int = 2048, name: str = "render",
+                 shared=None):
+        """
+        render: 例如 flex_templates.listing_card(doc_id, data)
+        shared: SharedCache（或包著它的 Lazy，第一次用到才開 SQLite），None 代表只用行程內快取
+        """
+        self._render_func = render
+        self._render_seconds = FLEX_RENDER_SECONDS.labels(name)
+        self._shared = shared
+        self.maxsize = maxsize
+        self.name = name
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()  # doc_id -> (version, card)
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "shared_hits": 0, "evictions": 0, "invalidations": 0,
+                          "uncacheable": 0}
+
+    def get(self, doc_id: str, data: dict):
+        version = data.get("updated_at")
+        if version is None:
+            # 沒有版本就無法判斷是否過期，直接 render 不快取
+            with self._lock:
+                self._counters["uncacheable"] += 1
+            return self._render(doc_id, data)
+
+        with self._lock:
+            entry = self._cache.get(doc_id)
+            if entry is not None and entry[0] == version:
+                self._cache.move_to_end(doc_id)
+                self._counters["hits"] += 1
+                return entry[1]
+            self._counters["misses"] += 1
+
+        card = self._render_shared(doc_id, data, version)
+        with self._lock:
+            self._cache[doc_id] = (version, card)
+            self._cache.move_to_end(doc_id)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+                self._counters["evictions"] += 1
+        return card
+
+    def _render(self, doc_id: str, data: dict):
+        with self._render_seconds.time():
+            return self._render_func(doc_id, data)
+
+    def _shared_cache(self):
+        return self._shared.get() if isinstance(self._shared, Lazy) else self._shared
+
+    def _render_shared(self, doc_id: str, data: dict, version):
+        shared = self._shared_cache()
+        if shared is None:
+            return self._render(doc_id, data)
+        # 版本已經在 key 裡，物件更新後自然換 key，不需要跨行程 invalidate
+        key = f"card:{self.name}:{doc_id}:{version}"
+        card = shared.get(key, None)
+        if card is not None:
+            with self._lock:
+                self._counters["shared_hits"] += 1
+            return card
+        card = self._render(doc_id, data)
+        shared.set(key, card)
+        return card
+
+    def invalidate(self, doc_id: Optional[str] = None):
+        """doc_id=None 代表全部清除"""
+        with self._lock:
+            if doc_id is None:
+                self._counters["invalidations"] += len(self._cache)
+                self._cache.clear()
+            elif self._cache.pop(doc_id, None) is not None:
+                self._counters["invalidations"] += 1
+
+    def on_listing_changes(self, changes, version):
+        """給 ListingIndex.add_listener 使用"""
+        for _kind, doc_id, _old, _new in changes:
+            self.invalidate(doc_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters)
+            stats["size"] = len(self._cache)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else None
+        return stats
@@ -0,0 +1,318 @@
+# repository.py
+"""
+Firestore 存取層
+
+把散落在 app.py 的 Firestore 呼叫集中到這裡：
+  - create_or_update：已知存在就直接 set(merge)；不確定就先 create()（前置條件：文件不存在），
+    新使用者只需一次往返，不必再先 get() 確認
+  - pipeline()：同一個 request 裡的多筆寫入合併成一個 batch commit（例如 /api/booking 的 bookings + users）
+  - 每次往返都記錄在目前 request 的計數器上（begin_request / end_request），方便觀察省下多少次
+  - AsyncRepository：同樣的操作，搭配 firestore AsyncClient（asgi.py）
+"""
+
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import firestore_call
+from search_query import afetch_listings, afetch_top, fetch_listings, fetch_top, is_active, MAX_RESULTS
+
+log = logging.getLogger("repository")
+
+_round_trips: ContextVar[Optional[Counter]] = ContextVar("firestore_round_trips", default=None)
+_totals = Counter()
+_totals_lock = threading.Lock()
+
+
+# -------------------- 往返次數計數 --------------------
+def begin_request():
+    """開始計數；回傳 token 給 end_request"""
+    return _round_trips.set(Counter())
+
+
+def end_request(token) -> Dict[str, int]:
+    """結束計數並回傳這個 request 的 {操作: 次數}"""
+    counts = _round_trips.get() or Counter()
+    _round_trips.reset(token)
+    return dict(counts)
+
+
+def count_round_trip(op: str, n: int = 1):
+    counts = _round_trips.get()
+    if counts is not None:
+        counts[op] += n
+    with _totals_lock:
+        _totals[op] += n
+
+
+@contextmanager
+def round_trip(op: str):
+    """計數並計時一次 Firestore 往返（/metrics 的 firestore_call_duration_seconds）"""
+    count_round_trip(op)
+    with firestore_call(op):
+        yield
+
+
+def round_trip_totals() -> Dict[str, int]:
+    with _totals_lock:
+        return dict(_totals)
+
+
+def _is_conflict(e: Exception) -> bool:
+    return getattr(e, "code", None) == 409 or type(e).__name__ in ("Conflict", "AlreadyExists")
+
+
+# -------------------- 寫入 pipeline --------------------
+class WritePipeline:
+    """收集多筆寫入，離開 with 區塊時一次 batch commit"""
+
+    def __init__(self, db):
+        self._db = db
+        self._batch = db.batch()
+        self._size = 0
+
+    def set(self, doc_ref, data: Dict[str, Any], merge: bool = False):
+        self._batch.set(doc_ref, data, merge=merge)
+        self._size += 1
+
+    def create(self, doc_ref, data: Dict[str, Any]):
+        self._batch.create(doc_ref, data)
+        self._size += 1
+
+    def update(self, doc_ref, data: Dict[str, Any]):
+        self._batch.update(doc_ref, data)
+        self._size += 1
+
+    def commit(self):
+        if not self._size:
+            return []
+        with round_trip("batch_commit"):
+            results = self._batch.commit()
+        self._batch = self._db.batch()
+        self._size = 0
+        return results
+
+
+# -------------------- Repository --------------------
+class _Collection:
+    name = ""
+
+    def __init__(self, repo: "Repository"):
+        self.repo = repo
+
+    @property
+    def col(self):
+        # 每次取用才建立 CollectionReference（很便宜），db 可以是延遲初始化的 Lazy
+        return self.repo.db.collection(self.name)
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        with round_trip(f"{self.name}.get"):
+            doc = self.col.document(doc_id).get()
+        if not doc.exists:
+            return None
+        return doc.to_dict() or {}
+
+    def add(self, data: Dict[str, Any], pipeline: Optional[WritePipeline] = None) -> str:
+        """新增一筆（自動產生 ID）；有 pipeline 時只排入，不立即寫入"""
+        doc_ref = self.col.document()
+        if pipeline is not None:
+            pipeline.set(doc_ref, data)
+        else:
+            with round_trip(f"{self.name}.set"):
+                doc_ref.set(data)
+        return doc_ref.id
+
+    def set(self, doc_id: str, data: Dict[str, Any], merge: bool = False,
+            pipeline: Optional[WritePipeline] = None):
+        """寫入指定 ID；有 pipeline 時只排入，不立即寫入"""
+        doc_ref = self.col.document(doc_id)
+        if pipeline is not None:
+            pipeline.set(doc_ref, data, merge=merge)
+            return
+        with round_trip(f"{self.name}.set"):
+            doc_ref.set(data, merge=merge)
+
+    def create_or_update(self, doc_id: str, data: Dict[str, Any], on_create: Optional[Dict[str, Any]] = None,
+                         exists_hint: Optional[bool] = None) -> bool:
+        """
+        建立或合併更新，回傳 True 代表這次是新建立。
+        exists_hint=True  → 直接 set(merge=True)，一次往返
+        exists_hint=False/None → 先 create()，文件已存在（409）才改成 set(merge=True)
+        on_create: 只在新建立時寫入的欄位（例如 created_at）
+        """
+        doc_ref = self.col.document(doc_id)
+        if not exists_hint:
+            try:
+                with round_trip(f"{self.name}.create"):
+                    doc_ref.create({**data, **(on_create or {})})
+                return True
+            except Exception as e:
+                if not _is_conflict(e):
+                    raise
+        with round_trip(f"{self.name}.set"):
+            doc_ref.set(data, merge=True)
+        return False
+
+
+class Listings(_Collection):
+    name = "listings"
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """下架（inactive）的物件視為不存在"""
+        data = super().get(doc_id)
+        return data if is_active(data) else None
+
+    def top(self, limit: int = 5) -> List[Tuple[str, Dict[str, Any]]]:
+        with firestore_call("listings.top"):
+            return fetch_top(self.col, limit, on_round_trip=lambda: count_round_trip("listings.query"))
+
+    def search(self, room=None, genre=None, min_budget=None, max_budget=None,
+               limit: int = MAX_RESULTS) -> List[Tuple[str, Dict[str, Any]]]:
+        # 分頁次數逐頁計數；計時以整個搜尋為單位（stream 是惰性的，拆不出單頁時間）
+        with firestore_call("listings.search"):
+            return fetch_listings(self.col, room=room, genre=genre, min_budget=min_budget, max_budget=max_budget,
+                                  limit=limit, on_round_trip=lambda: count_round_trip("listings.query"))
+
+
+class Forms(_Collection):
+    name = "forms"
+
+
+class Bookings(_Collection):
+    name = "bookings"
+
+
+class EntrustForms(_Collection):
+    name = "entrust_forms"
+
+
+class Users(_Collection):
+    name = "users"
+
+
+class SearchLogs(_Collection):
+    name = "search_logs"
+
+    def __init__(self, repo: "Repository", buffer=None):
+        super().__init__(repo)
+        self.buffer = buffer
+
+    def append(self, record: Dict[str, Any]) -> bool:
+        """有 write-behind buffer 時交給背景批次寫入（不算在 request 的往返次數）"""
+        if self.buffer is not None:
+            return self.buffer.add(record, collection=self.name)
+        self.add(record)
+        return True
+
+
+class Repository:
+    def __init__(self, db, search_log_buffer=None):
+        self.db = db
+        self.listings = Listings(self)
+        self.forms = Forms(self)
+        self.bookings = Bookings(self)
+        self.entrust_forms = EntrustForms(self)
+        self.users = Users(self)
+        self.search_logs = SearchLogs(self, buffer=search_log_buffer)
+
+    @contextmanager
+    def pipeline(self):
+        """with repo.pipeline() as p: ... → 區塊內的寫入合併成一次 commit"""
+        p = WritePipeline(self.db)
+        yield p
+        p.commit()
+
+
+# -------------------- AsyncRepository (firestore AsyncClient) --------------------
+class _AsyncCollection:
+    name = ""
+
+    def __init__(self, repo: "AsyncRepository"):
+        self.repo = repo
+
+    @property
+    def col(self):
+        return self.repo.db.collection(self.name)
+
+    async def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        with round_trip(f"{self.name}.get"):
+            doc = await self.col.document(doc_id).get()
+        if not doc.exists:
+            return None
+        return doc.to_dict() or {}
+
+    async def add(self, data: Dict[str, Any]) -> str:
+        doc_ref = self.col.document()
+        with round_trip(f"{self.name}.set"):
+            await doc_ref.set(data)
+        return doc_ref.id
+
+    async def set(self, doc_id: str, data: Dict[str, Any], merge: bool = False):
+        with round_trip(f"{self.name}.set"):
+            await self.col.document(doc_id).set(data, merge=merge)
+
+    async def create_or_update(self, doc_id: str, data: Dict[str, Any], on_create: Optional[Dict[str, Any]] = None,
+                               exists_hint: Optional[bool] = None) -> bool:
+        """與 _Collection.create_or_update 相同"""
+        doc_ref = self.col.document(doc_id)
+        if not exists_hint:
+            try:
+                with round_trip(f"{self.name}.create"):
+                    await doc_ref.create({**data, **(on_create or {})})
+                return True
+            except Exception as e:
+                if not _is_conflict(e):
+                    raise
+        with round_trip(f"{self.name}.set"):
+            await doc_ref.set(data, merge=True)
+        return False
+
+
+class AsyncListings(_AsyncCollection):
+    name = "listings"
+
+    async def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        data = await super().get(doc_id)
+        return data if is_active(data) else None
+
+    async def top(self, limit: int = 5) -> List[Tuple[str, Dict[str, Any]]]:
+        with firestore_call("listings.top"):
+            return await afetch_top(self.col, limit, on_round_trip=lambda: count_round_trip("listings.query"))
+
+    async def search(self, room=None, genre=None, min_budget=None, max_budget=None,
+                     limit: int = MAX_RESULTS) -> List[Tuple[str, Dict[str, Any]]]:
+        with firestore_call("listings.search"):
+            return await afetch_listings(self.col, room=room, genre=genre, min_budget=min_budget,
+                                         max_budget=max_budget, limit=limit,
+                                         on_round_trip=lambda: count_round_trip("listings.query"))
+
+
+class AsyncForms(_AsyncCollection):
+    name = "forms"
+
+
+class AsyncBookings(_AsyncCollection):
+    name = "bookings"
+
+
+class AsyncEntrustForms(_AsyncCollection):
+    name = "entrust_forms"
+
+
+class AsyncUsers(_AsyncCollection):
+    name = "users"
+
+
+class AsyncRepository:
+    """search_logs 不在這裡：asgi.py 在執行緒裡呼叫同步 Repository 的 append()（write-behind 只放進記憶體）"""
+
+    def __init__(self, db):
+        self.db = db
+        self.listings = AsyncListings(self)
+        self.forms = AsyncForms(self)
+        self.bookings = AsyncBookings(self)
+        self.entrust_forms = AsyncEntrustForms(self)
+        self.users = AsyncUsers(self)
@@ -0,0 +1,222 @@
+# search_query.py
+"""
+搜尋條件 → Firestore 查詢
+
+把預算轉成 price 範圍條件（>= / <=；沒有下限時用 >= 0）並以 order_by("price") 排序，
+再用 start_after 游標分頁，只讀取實際會顯示的筆數；沒有預算時同樣是最便宜的 MAX_RESULTS 筆，與 ListingIndex 一致。
+price 是 null 的物件不受預算限制，另外查一次補在最後。
+seed_listings --mark-inactive 標成 status="inactive" 的物件讀回來後在記憶體略過（is_active），
+不加 status != "inactive" 條件：不等式會排除沒有 status 欄位的舊文件，也得先 order_by("status")。
+需要的複合索引定義在 firestore.indexes.json。
+"""
+
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+log = logging.getLogger("search_query")
+
+# LINE carousel 最多 50 個 bubble
+MAX_RESULTS = 50
+PAGE_SIZE = 25
+INACTIVE = "inactive"
+
+
+def is_active(data: Optional[Dict[str, Any]]) -> bool:
+    """下架（status == "inactive"）的物件不出現在搜尋、精選與物件詳情"""
+    return (data or {}).get("status") != INACTIVE
+
+
+def parse_budget(budget: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """
+    解析預算字串，回傳 (min_budget, max_budget)，單位：萬
+      "1000-1500" / "1001-1500萬" → (1000, 1500)
+      "1000萬以下"                 → (None, 1000)
+      "3000萬以上"                 → (3000, None)
+    解析失敗回傳 (None, None)
+    """
+    min_budget, max_budget = None, None
+    if not budget:
+        return min_budget, max_budget
+    try:
+        if "-" in budget:
+            parts = budget.replace("萬", "").split("-")
+            min_budget, max_budget = int(parts[0]), int(parts[1])
+        elif "以下" in budget:
+            max_budget = int(budget.replace("萬以下", ""))
+        elif "以上" in budget:
+            min_budget = int(budget.replace("萬以上", ""))
+    except Exception as e:
+        log.warning("[parse_budget] 預算解析失敗: %s (%s)", budget, e)
+        return None, None
+    return min_budget, max_budget
+
+
+def parse_room(room) -> Optional[int]:
+    """room 轉 int；空值、非數字或 <= 0 回傳 None"""
+    if not room:
+        return None
+    try:
+        room_int = int(str(room).replace("房", ""))
+    except ValueError:
+        log.warning("[parse_room] room 不是有效數字: %s", room)
+        return None
+    return room_int if room_int > 0 else None
+
+
+def build_listing_query(collection_ref, room: Optional[int] = None, genre: Optional[str] = None,
+                        min_budget: Optional[int] = None, max_budget: Optional[int] = None):
+    """
+    組出 listings 查詢：
+      room / genre → 等值條件
+      預算         → price >= min_budget（沒有下限時 >= 0）、price <= max_budget，並 order_by("price")
+    一律加上 price 範圍：只 order_by 的話 price 是 null 的文件會排在最前面（Firestore 的 null 排序最小）
+    """
+    query = collection_ref
+    if room:
+        query = query.where("room", "==", room)
+    if genre:
+        query = query.where("genre", "==", genre)
+    query = query.where("price", ">=", min_budget or 0)
+    if max_budget:
+        query = query.where("price", "<=", max_budget)
+    return query.order_by("price")
+
+
+def build_unpriced_query(collection_ref, room: Optional[int] = None, genre: Optional[str] = None):
+    """
+    沒有價格（price == null）的物件不會出現在範圍查詢裡，
+    舊版行為是不受預算限制一併顯示，所以另外查一次補在最後。
+    完全沒有 price 欄位的文件 Firestore 查不到；匯入程式（seed_listings）一律會寫入 price 欄位。
+    """
+    query = collection_ref
+    if room:
+        query = query.where("room", "==", room)
+    if genre:
+        query = query.where("genre", "==", genre)
+    return query.where("price", "==", None)
+
+
+def _active_items(docs) -> List[Tuple[str, Dict[str, Any]]]:
+    items = []
+    for d in docs:
+        data = d.to_dict() or {}
+        if is_active(data):
+            items.append((d.id, data))
+    return items
+
+
+def iter_pages(query, page_size: int = PAGE_SIZE, max_results: Optional[int] = None,
+               on_round_trip: Optional[Callable[[], None]] = None) -> Iterator[List[Tuple[str, Dict[str, Any]]]]:
+    """
+    以 start_after 游標逐頁讀取，每頁最多 page_size 筆，產出 [(doc_id, data)]（已略過 inactive），
+    總數不超過 max_results（略過的不算，會再往後讀補足）
+    on_round_trip: 每讀一頁呼叫一次，用來統計 Firestore 往返次數
+    """
+    cursor = None
+    fetched = 0
+    while True:
+        size = page_size
+        if max_results is not None:
+            size = min(size, max_results - fetched)
+            if size <= 0:
+                return
+        page_query = query.limit(size)
+        if cursor is not None:
+            page_query = page_query.start_after(cursor)
+        if on_round_trip is not None:
+            on_round_trip()
+        docs = list(page_query.stream())
+        if not docs:
+            return
+        items = _active_items(docs)
+        if items:
+            yield items
+        fetched += len(items)
+        if len(docs) < size:
+            return
+        cursor = docs[-1]
+
+
+def fetch_listings(collection_ref, room: Optional[int] = None, genre: Optional[str] = None,
+                   min_budget: Optional[int] = None, max_budget: Optional[int] = None,
+                   limit: int = MAX_RESULTS, page_size: int = PAGE_SIZE,
+                   on_round_trip: Optional[Callable[[], None]] = None) -> List[Tuple[str, Dict[str, Any]]]:
+    """依條件讀取 listings，回傳 [(doc_id, data)]，最多 limit 筆（依價格由低到高，沒有價格的排最後）"""
+    items: List[Tuple[str, Dict[str, Any]]] = []
+    query = build_listing_query(collection_ref, room, genre, min_budget, max_budget)
+    for page in iter_pages(query, page_size=page_size, max_results=limit, on_round_trip=on_round_trip):
+        items.extend(page)
+
+    if len(items) < limit:
+        query = build_unpriced_query(collection_ref, room, genre)
+        for page in iter_pages(query, page_size=page_size, max_results=limit - len(items),
+                               on_round_trip=on_round_trip):
+            items.extend(page)
+    return items
+
+
+def fetch_top(collection_ref, limit: int = 5,
+              on_round_trip: Optional[Callable[[], None]] = None) -> List[Tuple[str, Dict[str, Any]]]:
+    """精選物件（top == True，略過 inactive），依 doc_id 排序，最多 limit 筆"""
+    items: List[Tuple[str, Dict[str, Any]]] = []
+    for page in iter_pages(collection_ref.where("top", "==", True), page_size=limit, max_results=limit,
+                           on_round_trip=on_round_trip):
+        items.extend(page)
+    return items
+
+
+# -------------------- AsyncClient 版本（asgi.py） --------------------
+async def aiter_pages(query, page_size: int = PAGE_SIZE, max_results: Optional[int] = None,
+                      on_round_trip: Optional[Callable[[], None]] = None) -> AsyncIterator[List[Any]]:
+    """iter_pages 的 async 版本，query 來自 firestore AsyncClient"""
+    cursor = None
+    fetched = 0
+    while True:
+        size = page_size
+        if max_results is not None:
+            size = min(size, max_results - fetched)
+            if size <= 0:
+                return
+        page_query = query.limit(size)
+        if cursor is not None:
+            page_query = page_query.start_after(cursor)
+        if on_round_trip is not None:
+            on_round_trip()
+        docs = [d async for d in page_query.stream()]
+        if not docs:
+            return
+        items = _active_items(docs)
+        if items:
+            yield items
+        fetched += len(items)
+        if len(docs) < size:
+            return
+        cursor = docs[-1]
+
+
+async def afetch_listings(collection_ref, room: Optional[int] = None, genre: Optional[str] = None,
+                          min_budget: Optional[int] = None, max_budget: Optional[int] = None,
+                          limit: int = MAX_RESULTS, page_size: int = PAGE_SIZE,
+                          on_round_trip: Optional[Callable[[], None]] = None) -> List[Tuple[str, Dict[str, Any]]]:
+    """fetch_listings 的 async 版本"""
+    items: List[Tuple[str, Dict[str, Any]]] = []
+    query = build_listing_query(collection_ref, room, genre, min_budget, max_budget)
+    async for page in aiter_pages(query, page_size=page_size, max_results=limit, on_round_trip=on_round_trip):
+        items.extend(page)
+
+    if len(items) < limit:
+        query = build_unpriced_query(collection_ref, room, genre)
+        async for page in aiter_pages(query, page_size=page_size, max_results=limit - len(items),
+                                      on_round_trip=on_round_trip):
+            items.extend(page)
+    return items
+
+
+async def afetch_top(collection_ref, limit: int = 5,
+                     on_round_trip: Optional[Callable[[], None]] = None) -> List[Tuple[str, Dict[str, Any]]]:
+    """fetch_top 的 async 版本"""
+    items: List[Tuple[str, Dict[str, Any]]] = []
+    async for page in aiter_pages(collection_ref.where("top", "==", True), page_size=limit, max_results=limit,
+                                  on_round_trip=on_round_trip):
+        items.extend(page)
+    return items
@@ -1,6 +1,8 @@
-import os, json, csv, re, firebase_admin
+import os, json, csv, time, hashlib, argparse, threading, concurrent.futures, firebase_admin
 from firebase_admin import credentials, firestore
 
+from listing_normalizer import ListingNormalizer
+
 # -------------------- 初始化 Firestore --------------------
 def init_firebase():
     if firebase_admin._apps:
@@ -21,43 +23,6 @@ def init_firebase():
 
 
 # -------------------- 工具函式 --------------------
-def chinese_to_number(text: str) -> str:
-    """將中文字數字轉成阿拉伯數字（僅支援 1~10，用於數字欄位）"""
-    mapping = {"一": "1", "二": "2", "三": "3", "四": "4", "五": "5",
-               "六": "6", "七": "7", "八": "8", "九": "9", "十": "10"}
-    for k, v in mapping.items():
-        text = text.replace(k, v)
-    return text
-
-
-def to_number(x, default=None):
-    """把字串安全轉成 int/float，只保留數字與小數點，支援中文字數字"""
-    if x is None:
-        return default
-    try:
-        s = str(x).strip()
-        if s == "":
-            return default
-        # 僅在數字欄位處理中文字數字
-        s = chinese_to_number(s)
-        # 移除非數字與小數點（萬、元、房、逗號）
-        cleaned = re.sub(r"[^0-9.]", "", s)
-        if cleaned == "":
-            return default
-        return float(cleaned) if "." in cleaned else int(cleaned)
-    except Exception:
-        return default
-
-
-def to_bool(x):
-    """把字串轉成布林值"""
-    if isinstance(x, bool):
-        return x
-    if x is None:
-        return False
-    return str(x).strip().lower() in ["true", "1", "yes", "y"]
-
-
 def load_items(path: str):
     """讀取 CSV 或 JSON"""
     if path.endswith(".json"):
@@ -74,66 +39,321 @@ def load_items(path: str):
         raise ValueError("僅支援 JSON 或 CSV")
 
 
-# -------------------- 主程式 --------------------
-def main():
-    db = init_firebase()
-    path = "./listings.csv"  # ⚡ 預設讀 CSV，可改成 ./listings.json
+# -------------------- 串流讀取 --------------------
+def iter_items(path: str):
+    """逐筆讀取 CSV / JSON Lines，不把整個檔案載入記憶體（.json 仍需整份解析）"""
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            yield from csv.DictReader(f)
+    elif path.endswith(".jsonl"):
+        with open(path, encoding="utf-8-sig") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        yield from load_items(path)
 
-    items = load_items(path)
-    batch = db.batch()
-    count = 0
 
-    for item in items:
-        doc_id = item.get("id")  # ⚠️ 必須在 CSV/JSON 有 `id` 欄位
-        if not doc_id:
-            print(f"⚠️ 跳過：缺少 id -> {item}")
+# 欄位轉換表只建一次（見 listing_normalizer.py）
+NORMALIZER = ListingNormalizer(extra={"updated_at": firestore.SERVER_TIMESTAMP})
+
+
+def to_listing(item):
+    """CSV/JSON 一列 → (doc_id, Firestore 文件)；缺少 id 回傳 None"""
+    return NORMALIZER.row(item)
+
+
+def iter_chunks(rows, size: int):
+    """依序切成 (batch_no, [row, ...])"""
+    batch, batch_no = [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch_no, batch
+            batch, batch_no = [], batch_no + 1
+    if batch:
+        yield batch_no, batch
+
+
+def iter_rows(items, counts=None):
+    """逐列正規化，依來源順序產出 (doc_id, data)；缺 id 的列略過"""
+    for doc_id, data in NORMALIZER.iter_rows(items):
+        if doc_id is None:
+            print(f"⚠️ 跳過：缺少 id -> {data}")
+            if counts is not None:
+                counts["invalid"] += 1
             continue
+        yield doc_id, data
 
-        data = {
-            # 純文字欄位（不做數字轉換）
-            "title": item.get("title", "").strip(),
-            "genre": item.get("genre", "").strip(),
-            "address": item.get("address", "").strip(),
-            "image_url": item.get("image_url", "").strip(),
-            "detail1": item.get("detail1", "").strip(),
-            "detail2": item.get("detail2", "").strip(),
-            "status": item.get("status", "active"),
-            "project_name": item.get("project_name", "").strip(),
-            "exclusive": item.get("exclusive", "").strip(),
-            "pattern": item.get("pattern", "").strip(),
-            "old": item.get("old", "").strip(),
-            "height": item.get("height", "").strip(),
-            "pattern_url": item.get("pattern_url", "").strip(),
-            "video_uri": item.get("video_uri", "").strip(),
-            "map_uri": item.get("map_uri", "").strip(),
-            "text": item.get("text", "").strip(),
-
-            # 數字欄位（才用 to_number）
-            "price": to_number(item.get("price")),   
-            "room": to_number(item.get("room")),     
-            "square_meters": to_number(item.get("square_meters")),
-            "square_meters2": to_number(item.get("square_meters2")),
-
-            # 布林欄位
-            "top": to_bool(item.get("top")),
-            "parking_space": to_bool(item.get("parking_space")),
-
-            # 系統欄位
-            "updated_at": firestore.SERVER_TIMESTAMP,
-        }
-
-        # ✅ 用 id 當 Firestore 文件 ID，保證不會重複新增
-        doc_ref = db.collection("listings").document(doc_id)
-        batch.set(doc_ref, data, merge=True)
-        count += 1
-
-        if count % 450 == 0:  # Firestore batch 限制
-            batch.commit()
-            print(f"✅ committed {count} docs...")
+
+def iter_batches(items, size: int):
+    """缺 id 的列不佔批次位置，同一個來源檔每次切出的批次都相同（進度檔依賴這點）"""
+    return iter_chunks(iter_rows(items), size)
+
+
+# -------------------- 進度檔（中斷後續傳） --------------------
+class Checkpoint:
+    """
+    記錄已 commit 的批次編號。
+    平行 commit 完成順序不固定，所以存「連續完成到第幾批」加上之後零散完成的批次；
+    來源檔大小 / 修改時間 / 批次大小不同時視為新的匯入，從頭開始。
+    """
+
+    def __init__(self, path: str, source: str, batch_size: int):
+        self.path = path
+        st = os.stat(source)
+        self.signature = {"source": os.path.abspath(source), "size": st.st_size,
+                          "mtime": int(st.st_mtime), "batch_size": batch_size}
+        self.done_through = -1
+        self.done = set()
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return self
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 進度檔讀取失敗，從頭匯入: {e}")
+            return self
+        if saved.get("signature") != self.signature:
+            print("ℹ️ 來源檔已變更，忽略舊的進度檔")
+            return self
+        self.done_through = saved.get("done_through", -1)
+        self.done = set(saved.get("done", []))
+        self.rows = saved.get("rows", 0)
+        return self
+
+    def is_done(self, batch_no: int) -> bool:
+        return batch_no <= self.done_through or batch_no in self.done
+
+    def mark(self, batch_no: int, rows: int):
+        with self._lock:
+            self.done.add(batch_no)
+            self.rows += rows
+            while self.done_through + 1 in self.done:
+                self.done_through += 1
+                self.done.discard(self.done_through)
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"signature": self.signature, "done_through": self.done_through,
+                       "done": sorted(self.done), "rows": self.rows}, f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# -------------------- 匯入 --------------------
+FIRESTORE_BATCH_LIMIT = 500
+
+
+def commit_batch(db, rows, collection: str = "listings", max_retries: int = 3):
+    """一批寫入；暫時性錯誤指數退避重試"""
+    col = db.collection(collection)
+    for attempt in range(1, max_retries + 2):
+        try:
             batch = db.batch()
+            for doc_id, data in rows:
+                # ✅ 用 id 當 Firestore 文件 ID，保證不會重複新增
+                batch.set(col.document(doc_id), data, merge=True)
+            batch.commit()
+            return
+        except Exception as e:
+            if attempt > max_retries:
+                raise
+            print(f"⚠️ batch commit 失敗，重試 attempt={attempt}: {e}")
+            time.sleep(min(0.5 * 2 ** (attempt - 1), 8))
+
 
-    batch.commit()
-    print(f"🎉 done, wrote/updated {count} docs")
+def commit_parallel(db, batches, workers: int = 8, checkpoint: "Checkpoint" = None,
+                    report_every: float = 2.0):
+    """
+    batches: 可迭代的 (batch_no, [(doc_id, data)])，逐批以最多 workers 個執行緒平行 commit。
+    同時在途的批次最多 workers * 2 個，讀檔速度不會超前太多而吃光記憶體。
+    任一批最終失敗時停止排入新批次並拋出例外；有 checkpoint 時已完成的批次會記下來。
+    回傳 (寫入筆數, 因 checkpoint 略過的筆數, 秒數)
+    """
+    slots = threading.BoundedSemaphore(workers * 2)
+    lock = threading.Lock()
+    errors = []
+    written = skipped = 0
+    started = last_report = time.monotonic()
+
+    def _run(batch_no, rows):
+        nonlocal written
+        try:
+            commit_batch(db, rows)
+            if checkpoint is not None:
+                checkpoint.mark(batch_no, len(rows))
+            with lock:
+                written += len(rows)
+        except Exception as e:
+            errors.append((batch_no, e))
+        finally:
+            slots.release()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="seed") as pool:
+        for batch_no, rows in batches:
+            if errors:
+                break
+            if checkpoint is not None and checkpoint.is_done(batch_no):
+                skipped += len(rows)
+                continue
+            slots.acquire()
+            pool.submit(_run, batch_no, rows)
+
+            now = time.monotonic()
+            if now - last_report >= report_every:
+                print(f"✅ committed {written} docs ({written / (now - started):.0f} rows/s)")
+                last_report = now
+
+    elapsed = time.monotonic() - started
+    if errors:
+        batch_no, e = errors[0]
+        done = checkpoint.rows if checkpoint is not None else written
+        print(f"❌ 第 {batch_no} 批寫入失敗，已完成 {done} 筆"
+              + ("；重新執行會從中斷處繼續" if checkpoint is not None else ""))
+        raise e
+    return written, skipped, elapsed
+
+
+def import_listings(db, path: str, batch_size: int = 450, workers: int = 8,
+                    checkpoint_path: str = None, report_every: float = 2.0):
+    """串流讀取 path 全量寫入（merge）；進度記在 checkpoint_path，重跑會從中斷處繼續"""
+    batch_size = max(1, min(batch_size, FIRESTORE_BATCH_LIMIT))
+    checkpoint = Checkpoint(checkpoint_path, path, batch_size).load()
+    if checkpoint.done_through >= 0 or checkpoint.done:
+        print(f"⏩ 從進度檔續傳：已完成 {checkpoint.rows} 筆")
+
+    written, skipped, elapsed = commit_parallel(db, iter_batches(iter_items(path), batch_size),
+                                                workers=workers, checkpoint=checkpoint,
+                                                report_every=report_every)
+    rate = written / elapsed if elapsed > 0 else 0.0
+    checkpoint.clear()
+    print(f"🎉 done, wrote/updated {written} docs in {elapsed:.1f}s ({rate:.0f} rows/s)"
+          + (f", skipped {skipped} already imported" if skipped else ""))
+    return {"written": written, "skipped": skipped, "seconds": round(elapsed, 3), "rows_per_sec": round(rate, 1)}
+
+
+# -------------------- 差異同步 --------------------
+# 不列入雜湊的欄位：系統欄位每次都會變
+HASH_EXCLUDE = ("updated_at", "content_hash")
+
+
+def content_hash(data) -> str:
+    """正規化後內容的雜湊；欄位順序、系統欄位不影響結果"""
+    body = {k: v for k, v in data.items() if k not in HASH_EXCLUDE}
+    raw = json.dumps(body, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def fetch_existing(db, collection: str = "listings"):
+    """
+    一次串流讀回現有文件的 {doc_id: (content_hash, status)}。
+    只投影這兩個欄位，不下載整份文件。
+    """
+    existing = {}
+    for doc in db.collection(collection).select(["content_hash", "status"]).stream():
+        data = doc.to_dict() or {}
+        existing[doc.id] = (data.get("content_hash"), data.get("status", "active"))
+    return existing
+
+
+def diff_rows(items, existing, counts):
+    """逐列比對，只產出新增或內容有變的 (doc_id, data)；會從 existing 移除看過的 id"""
+    for doc_id, data in iter_rows(items, counts):
+        digest = content_hash(data)
+        old = existing.pop(doc_id, None)
+        if old is None:
+            counts["inserted"] += 1
+        elif old[0] == digest and old[1] == data["status"]:
+            counts["unchanged"] += 1
+            continue
+        else:
+            counts["changed"] += 1
+        data["content_hash"] = digest
+        yield doc_id, data
+
+
+def sync_listings(db, path: str, batch_size: int = 450, workers: int = 8,
+                  mark_inactive: bool = False, dry_run: bool = False):
+    """
+    差異同步：只寫入新增或內容雜湊不同的物件，沒變的物件不動（updated_at 也不變，
+    下游以版本為 key 的快取不會被清掉）。
+    mark_inactive=True 時，來源檔裡沒有的物件標成 status=inactive（不刪除）。
+    同步本身就是冪等的，中斷後重跑只會寫入尚未寫入的差異，不需要進度檔。
+    """
+    batch_size = max(1, min(batch_size, FIRESTORE_BATCH_LIMIT))
+    started = time.monotonic()
+    existing = fetch_existing(db)
+    print(f"🔎 現有 {len(existing)} 筆 listings（{time.monotonic() - started:.1f}s）")
+
+    counts = {"inserted": 0, "changed": 0, "unchanged": 0, "deactivated": 0, "invalid": 0}
+    rows = diff_rows(iter_items(path), existing, counts)
+
+    def _with_missing():
+        yield from rows
+        # rows 讀完後 existing 只剩來源檔沒有的物件
+        if not mark_inactive:
+            return
+        for doc_id, (_, status) in list(existing.items()):
+            if status == "inactive":
+                continue
+            counts["deactivated"] += 1
+            yield doc_id, {"status": "inactive", "updated_at": firestore.SERVER_TIMESTAMP}
+
+    if dry_run:
+        for _ in _with_missing():
+            pass
+        written, elapsed = 0, time.monotonic() - started
+    else:
+        written, _, _ = commit_parallel(db, iter_chunks(_with_missing(), batch_size), workers=workers)
+        elapsed = time.monotonic() - started
+
+    missing = len(existing)
+    print(f"🎉 sync done in {elapsed:.1f}s{' (dry run)' if dry_run else ''}: "
+          f"+{counts['inserted']} inserted, ~{counts['changed']} changed, "
+          f"={counts['unchanged']} unchanged, -{counts['deactivated']} deactivated"
+          + (f" ({missing} missing from source)" if missing and not mark_inactive else "")
+          + f", wrote {written} docs")
+    return dict(counts, written=written, missing=missing, seconds=round(elapsed, 3))
+
+
+# -------------------- 主程式 --------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="匯入物件資料到 Firestore listings")
+    parser.add_argument("path", nargs="?", default="./listings.csv", help="CSV / JSON / JSON Lines 檔案")
+    parser.add_argument("--batch-size", type=int, default=450)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--checkpoint", default=None, help="進度檔路徑（預設 <path>.checkpoint）")
+    parser.add_argument("--restart", action="store_true", help="忽略進度檔，從頭匯入")
+    parser.add_argument("--sync", action="store_true", help="差異同步：只寫入新增 / 有變動的物件")
+    parser.add_argument("--mark-inactive", action="store_true", help="（--sync）來源檔沒有的物件標成 inactive")
+    parser.add_argument("--dry-run", action="store_true", help="（--sync）只計算差異，不寫入")
+    args = parser.parse_args(argv)
+
+    if args.sync:
+        db = init_firebase()
+        sync_listings(db, args.path, batch_size=args.batch_size, workers=args.workers,
+                      mark_inactive=args.mark_inactive, dry_run=args.dry_run)
+        return
+
+    checkpoint_path = args.checkpoint or f"{args.path}.checkpoint"
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    db = init_firebase()
+    import_listings(db, args.path, batch_size=args.batch_size, workers=args.workers,
+                    checkpoint_path=checkpoint_path)
 
 
 if __name__ == "__main__":
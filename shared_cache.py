@@ -0,0 +1,279 @@
+# shared_cache.py
+"""
+同一台機器上所有 gunicorn worker 共用的快取層（SQLite WAL）
+
+位置在行程內快取（SWRCache / RenderCache）之後、Firestore 之前：
+  - 一個 worker 讀過的物件 / 畫好的卡片，其他 worker 直接拿，不必再打 Firestore
+  - 存在磁碟上，worker 重啟（max_requests 回收）後仍然有效
+  - invalidate() 會寫入 invalidations 表，其他 worker 的輪詢執行緒看到後清掉自己的行程內快取；
+    帶版本的 invalidation 以 (key, version) 去重：每個 worker 都看到同一筆變動時只記一筆
+值以 JSON 儲存（datetime / bytes 另外標記還原），不用 pickle：讀回來的資料不會被當成程式執行。
+檔案放在只有本使用者能存取（0700）的目錄；所在目錄可被其他使用者寫入（例如 /tmp）時拒絕使用。
+"""
+
+import base64
+import json
+import logging
+import os
+import sqlite3
+import stat
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Iterable, List, Optional, Tuple, Union
+
+log = logging.getLogger("shared_cache")
+
+MISSING = object()
+
+
+def default_path() -> str:
+    """$XDG_CACHE_HOME（預設 ~/.cache）/real-estate-bot/shared-cache.sqlite3"""
+    base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "real-estate-bot", "shared-cache.sqlite3")
+
+
+def _ensure_private_dir(directory: str):
+    """建立 0700 目錄；已存在時必須是自己的、且其他人不能寫入，否則拋出 PermissionError"""
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.stat(directory)
+    if st.st_uid != os.getuid() or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"共用快取目錄必須屬於目前使用者且其他人不可寫入: {directory}")
+
+
+# -------------------- 序列化 --------------------
+def _encode_default(value):
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    if isinstance(value, bytes):
+        return {"$b64": base64.b64encode(value).decode("ascii")}
+    raise TypeError(f"無法存入共用快取的型別: {type(value).__name__}")
+
+
+def _decode_hook(obj: dict):
+    if len(obj) == 1:
+        if "$dt" in obj:
+            return datetime.fromisoformat(obj["$dt"])
+        if "$b64" in obj:
+            return base64.b64decode(obj["$b64"])
+    return obj
+
+
+def dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_encode_default)
+
+
+def loads(text: str) -> Any:
+    return json.loads(text, object_hook=_decode_hook)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key        TEXT PRIMARY KEY,
+    value      TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS invalidations (
+    seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+    key     TEXT NOT NULL,
+    version TEXT,
+    at      REAL NOT NULL
+);
+"""
+# version 是 NULL 的不去重（SQLite 的 UNIQUE 允許多個 NULL）
+_INVALIDATION_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS invalidations_key_version ON invalidations (key, version)"
+
+
+class SharedCache:
+    def __init__(self, path: Optional[str] = None, ttl: float = 300, poll_interval: float = 1.0,
+                 retention: float = 3600):
+        """
+        path:          SQLite 檔案位置，None 代表 default_path()；所在目錄必須只有自己能寫入
+        ttl:           預設存活時間（秒）
+        poll_interval: 多久檢查一次其他 worker 的 invalidation（秒），0 代表不輪詢
+        retention:     invalidation 紀錄保留多久（秒）
+        """
+        path = path or default_path()
+        _ensure_private_dir(os.path.dirname(os.path.abspath(path)))
+        self.path = path
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.retention = retention
+
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._listeners: List[Callable[[List[str]], None]] = []
+        self._counters = {"hits": 0, "misses": 0, "sets": 0, "invalidations": 0, "errors": 0, "remote_invalidations": 0}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._poller = None
+
+        conn = self._conn()
+        os.chmod(path, 0o600)
+        if conn.execute("SELECT type FROM pragma_table_info('entries') WHERE name = 'value'").fetchone() == ("BLOB",):
+            # 舊版以 pickle 存的 BLOB 不再讀取，整張表重建
+            conn.execute("DROP TABLE entries")
+        conn.executescript(_SCHEMA)
+        if conn.execute("SELECT 1 FROM pragma_table_info('invalidations') WHERE name = 'version'").fetchone() is None:
+            conn.execute("ALTER TABLE invalidations ADD COLUMN version TEXT")
+        conn.execute(_INVALIDATION_INDEX)
+        row = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM invalidations").fetchone()
+        self._last_seq = row[0]
+        log.info("[shared_cache] ✅ 使用 %s last_seq=%s", path, self._last_seq)
+
+    # -------------------- 連線 --------------------
+    def _conn(self) -> sqlite3.Connection:
+        """每個執行緒一條連線；fork 後（pid 改變）重新建立"""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._local = threading.local()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=1000")
+            self._local.conn = conn
+        return conn
+
+    def _incr(self, key: str, n: int = 1):
+        with self._lock:
+            self._counters[key] += n
+
+    # -------------------- 對外介面 --------------------
+    def get(self, key: str, default=MISSING):
+        """回傳快取值（可能是 None 代表「不存在」的負快取）；沒有或過期回傳 default"""
+        try:
+            row = self._conn().execute(
+                "SELECT value FROM entries WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._incr("errors")
+            log.warning("[shared_cache] get 失敗 key=%s: %s", key, e)
+            return default
+        if row is None:
+            self._incr("misses")
+            return default
+        try:
+            value = loads(row[0])
+        except ValueError as e:
+            self._incr("errors")
+            log.warning("[shared_cache] 無法解析 key=%s: %s", key, e)
+            return default
+        self._incr("hits")
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        try:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, dumps(value), expires_at),
+            )
+            self._incr("sets")
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            self._incr("errors")
+            log.warning("[shared_cache] set 失敗 key=%s: %s", key, e)
+
+    def invalidate(self, keys: Iterable[Union[str, Tuple[str, Optional[str]]]], prefix: bool = False):
+        """
+        刪除 key（prefix=True 時刪除所有以 key 開頭的項目），並通知其他 worker。
+        keys 的元素可以是 (key, version)：同一個 (key, version) 已經有人記過就不再通知
+        """
+        if isinstance(keys, str):
+            keys = [keys]
+        items = [k if isinstance(k, tuple) else (k, None) for k in keys]
+        if not items:
+            return
+        keys = [key for key, _ in items]
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            for key, version in items:
+                if prefix:
+                    conn.execute("DELETE FROM entries WHERE key >= ? AND key < ?", (key, key + "\uffff"))
+                else:
+                    conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                conn.execute("INSERT OR IGNORE INTO invalidations (key, version, at) VALUES (?, ?, ?)",
+                             (key, version, now))
+            conn.execute("COMMIT")
+            self._incr("invalidations", len(items))
+        except sqlite3.Error as e:
+            self._incr("errors")
+            log.warning("[shared_cache] invalidate 失敗 keys=%s: %s", keys, e)
+            try:
+                self._conn().execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+
+    def add_invalidation_listener(self, func: Callable[[List[str]], None]):
+        """註冊 func(keys)：其他 worker invalidate 時呼叫，用來清掉本行程的快取"""
+        self._listeners.append(func)
+        self._start_poller()
+        return func
+
+    def _start_poller(self):
+        if self.poll_interval and self._listeners and self._poller is None:
+            self._poller = threading.Thread(target=self._poll_loop, name="shared-cache-poll", daemon=True)
+            self._poller.start()
+
+    def after_fork(self):
+        """
+        fork 之後在子行程呼叫：輪詢執行緒不會跟著 fork，重新啟動一條。
+        SQLite 連線不用處理，_conn() 發現 pid 改變會自己重開。
+        """
+        self._poller = None
+        self._start_poller()
+
+    def poll_invalidations(self) -> List[str]:
+        """取出上次輪詢之後的 invalidation key，並分送給 listener"""
+        try:
+            rows = self._conn().execute(
+                "SELECT seq, key FROM invalidations WHERE seq > ? ORDER BY seq", (self._last_seq,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            self._incr("errors")
+            log.warning("[shared_cache] 讀取 invalidations 失敗: %s", e)
+            return []
+        if not rows:
+            return []
+        self._last_seq = rows[-1][0]
+        keys = [key for _, key in rows]
+        self._incr("remote_invalidations", len(keys))
+        for func in list(self._listeners):
+            try:
+                func(keys)
+            except Exception:
+                log.exception("[shared_cache] invalidation listener 失敗")
+        return keys
+
+    def prune(self):
+        """清除過期項目與過舊的 invalidation 紀錄"""
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+            conn.execute("DELETE FROM invalidations WHERE at < ?", (now - self.retention,))
+        except sqlite3.Error as e:
+            log.warning("[shared_cache] prune 失敗: %s", e)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        try:
+            stats["size"] = self._conn().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        except sqlite3.Error:
+            stats["size"] = None
+        stats["path"] = self.path
+        return stats
+
+    def stop(self):
+        self._stopped.set()
+
+    def _poll_loop(self):
+        last_prune = time.monotonic()
+        while not self._stopped.wait(self.poll_interval):
+            self.poll_invalidations()
+            if time.monotonic() - last_prune > 60:
+                self.prune()
+                last_prune = time.monotonic()
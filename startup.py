@@ -0,0 +1,153 @@
+# startup.py
+"""
+延遲初始化與啟動時間紀錄
+
+scale-to-zero 的主機每次冷啟動都要重新 import app.py；
+Firestore client（firebase_admin → gRPC）、LINE client、執行緒池改成第一次用到才建立，
+/healthz 不需要等這些東西準備好就能回應。
+
+  db = Lazy(_init_firestore, "firestore")
+  db.collection("forms")      # 第一次存取屬性時才呼叫 _init_firestore()，之後直接轉給實體
+
+STARTUP 記錄每個階段花的時間（/debug/startup）：
+  mark(name)   從行程啟動到此刻的時間（import 完成、app 可以接請求…）
+  phase(name)  區塊本身的耗時（Lazy 初始化、warmup）
+
+gunicorn --preload 時 master import 完才 fork：reset_all() 讓 worker 丟掉繼承來的實體自己重建。
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+log = logging.getLogger("startup")
+
+_IMPORTED_AT = time.time()
+
+
+def process_started_at() -> float:
+    """行程啟動的 epoch 秒數；讀不到 /proc（非 Linux）時退回本模組被 import 的時間"""
+    try:
+        with open("/proc/self/stat") as f:
+            # comm 欄位可能含空白，從最後一個 ')' 之後開始切
+            fields = f.read().rsplit(")", 1)[1].split()
+        start_ticks = int(fields[19])
+        with open("/proc/stat") as f:
+            btime = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        started = btime + start_ticks / os.sysconf("SC_CLK_TCK")
+        # btime 只有秒的精度；算出來比 import 時間還晚就不可信
+        return min(started, _IMPORTED_AT)
+    except Exception:
+        return _IMPORTED_AT
+
+
+class StartupReport:
+    def __init__(self):
+        self.started_at = process_started_at()
+        self._lock = threading.Lock()
+        self._marks: List[Dict[str, Any]] = []
+        self._phases: List[Dict[str, Any]] = []
+
+    def uptime_ms(self) -> float:
+        return (time.time() - self.started_at) * 1000
+
+    def mark(self, name: str) -> float:
+        at = self.uptime_ms()
+        with self._lock:
+            self._marks.append({"name": name, "at_ms": round(at, 1)})
+        log.info("[startup] %s @ %.0fms", name, at)
+        return at
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._phases.append({"name": name, "ms": round(ms, 1), "ok": ok,
+                                     "thread": threading.current_thread().name})
+            log.info("[startup] %s %.0fms%s", name, ms, "" if ok else " (失敗)")
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "uptime_ms": round(self.uptime_ms(), 1),
+                "marks": list(self._marks),
+                "phases": list(self._phases),
+            }
+
+
+STARTUP = StartupReport()
+
+_instances: List["Lazy"] = []
+_instances_lock = threading.Lock()
+
+
+class Lazy:
+    """
+    第一次使用時才呼叫 factory() 建立實體；多個執行緒同時第一次使用也只會建立一次。
+    factory 失敗時不快取例外，下一次使用會重試。
+    reset() 丟掉實體（例如 fork 之後重建 gRPC channel / 執行緒池）。
+    """
+
+    def __init__(self, factory: Callable[[], Any], name: str):
+        self._factory = factory
+        self._name = name
+        self._instance: Any = None
+        self._ready = False
+        self._lock = threading.Lock()
+        with _instances_lock:
+            _instances.append(self)
+
+    def get(self) -> Any:
+        if self._ready:
+            return self._instance
+        with self._lock:
+            if not self._ready:
+                with STARTUP.phase(f"init:{self._name}"):
+                    self._instance = self._factory()
+                self._ready = True
+        return self._instance
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def reset(self) -> Optional[Any]:
+        """回傳被丟掉的舊實體（呼叫端自行決定要不要關閉）"""
+        with self._lock:
+            old, self._instance, self._ready = self._instance, None, False
+        return old
+
+    def __getattr__(self, attr):
+        # 只有 Lazy 本身沒有的屬性才會走到這裡
+        return getattr(self.get(), attr)
+
+    def __repr__(self):
+        state = "ready" if self._ready else "pending"
+        return f"<Lazy {self._name} {state}>"
+
+
+def reset_all() -> List[str]:
+    """
+    fork 之後在子行程呼叫：丟掉所有已建立的 Lazy 實體（gRPC channel、HTTP 連線池、執行緒池都不能跨 fork 共用）。
+    舊實體不關閉 ── 它們的背景執行緒在子行程裡本來就不存在，關閉反而可能動到 master 的連線。
+    回傳被重設的名稱。
+    """
+    with _instances_lock:
+        instances = list(_instances)
+    names = []
+    for lazy in instances:
+        # fork 當下別的執行緒可能正拿著鎖，子行程裡不會有人釋放它
+        lazy._lock = threading.Lock()
+        if lazy.ready:
+            lazy.reset()
+            names.append(lazy._name)
+    return names
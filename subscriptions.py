@@ -0,0 +1,377 @@
+# subscriptions.py
+"""
+追蹤條件比對（新上架物件搶先通知）
+
+SubscriptionIndex 以 on_snapshot 監聽 forms，把每位使用者的條件索引成：
+    (genre | "*", room | "*") → 預算桶（每 BUCKET_WIDTH 萬一桶）→ {user_id}
+新物件進來時只查 4 個 key 各 1 個桶，再精確比對預算區間，不必掃描所有表單。
+MAX_BUCKETS 之後的價格都落在最後一個桶；「3000萬以上」這種沒有上限的條件放在 lo 到最後一個桶。
+
+SubscriptionNotifier 掛在 ListingIndex 上：物件新增（或修改後才符合）時找出符合的使用者，
+每人組一個只含自己符合物件的 carousel 交給 deliver（內容相同的會合併成 multicast）。
+同一個 (物件, 使用者) 只通知一次：以 Firestore notifications 文件 create() 搶占，多個 worker 不會重複推播；
+沒送出去的（卡片產生失敗、超過 max_cards、推播失敗）刪除搶占紀錄，之後物件再有變動時還能通知。
+forms 還沒完成首次同步時進來的物件先暫存（最多 pending_max 筆），同步完成後再比對。
+"""
+
+import concurrent.futures
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from listing_index import _price_key
+from metrics import firestore_call
+from search_query import parse_budget, parse_room
+
+log = logging.getLogger("subscriptions")
+
+ANY = "*"
+BUCKET_WIDTH = 500      # 萬
+MAX_BUCKETS = 100       # 50000 萬以上共用最後一個桶（編號 MAX_BUCKETS）
+
+
+def bucket_of(price) -> int:
+    return min(int(price // BUCKET_WIDTH), MAX_BUCKETS)
+
+
+class _Sub:
+    __slots__ = ("user_id", "genre", "room", "lo", "hi")
+
+    def __init__(self, user_id: str, genre: str, room, lo: Optional[int], hi: Optional[int]):
+        self.user_id = user_id
+        self.genre = genre
+        self.room = room
+        self.lo = lo
+        self.hi = hi
+
+    @classmethod
+    def from_form(cls, user_id: str, data: Dict[str, Any]) -> "_Sub":
+        lo, hi = parse_budget(data.get("budget"))
+        room = parse_room(data.get("room"))
+        return cls(user_id, data.get("genre") or ANY, room if room else ANY, lo, hi)
+
+    @property
+    def key(self) -> Tuple[str, Any]:
+        return (self.genre, self.room)
+
+    @property
+    def has_budget(self) -> bool:
+        return bool(self.lo) or bool(self.hi)
+
+    def price_ok(self, price) -> bool:
+        # 與搜尋一致：沒有價格的物件不受預算限制
+        if price is None:
+            return True
+        if self.lo and price < self.lo:
+            return False
+        if self.hi and price > self.hi:
+            return False
+        return True
+
+    def buckets(self) -> range:
+        """涵蓋的預算桶；沒有上限（「3000萬以上」）或上限超過 MAX_BUCKETS 時到最後一個桶為止"""
+        last = bucket_of(self.hi) if self.hi else MAX_BUCKETS
+        return range(bucket_of(self.lo or 0), last + 1)
+
+
+class _KeyIndex:
+    """同一個 (genre, room) 底下的預算桶"""
+    __slots__ = ("any_budget", "buckets")
+
+    def __init__(self):
+        self.any_budget: Set[str] = set()
+        self.buckets: Dict[int, Set[str]] = {}
+
+    def add(self, sub: _Sub):
+        if not sub.has_budget:
+            self.any_budget.add(sub.user_id)
+            return
+        for b in sub.buckets():
+            self.buckets.setdefault(b, set()).add(sub.user_id)
+
+    def remove(self, sub: _Sub):
+        self.any_budget.discard(sub.user_id)
+        if not sub.has_budget:
+            return
+        for b in sub.buckets():
+            users = self.buckets.get(b)
+            if users is not None:
+                users.discard(sub.user_id)
+                if not users:
+                    del self.buckets[b]
+
+    def candidates(self, price) -> Iterable[str]:
+        yield from self.any_budget
+        if price is None:
+            for users in self.buckets.values():
+                yield from users
+        else:
+            yield from self.buckets.get(bucket_of(price), ())
+
+
+class SubscriptionIndex:
+    def __init__(self, collection_ref=None):
+        self._col = collection_ref
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._watch = None
+        self._subs: Dict[str, _Sub] = {}
+        self._keys: Dict[Tuple[str, Any], _KeyIndex] = {}
+        self._ready_listeners: List[Callable[[], None]] = []
+        self.version = 0
+
+    # -------------------- 生命週期 --------------------
+    def start(self):
+        if self._watch is None and self._col is not None:
+            self._watch = self._col.on_snapshot(self._on_snapshot)
+            log.info("[subscriptions] 🔄 開始監聽 forms")
+        return self
+
+    def stop(self):
+        if self._watch is not None:
+            try:
+                self._watch.unsubscribe()
+            except Exception as e:
+                log.warning("[subscriptions] unsubscribe 失敗: %s", e)
+            self._watch = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def add_ready_listener(self, func: Callable[[], None]):
+        """首次同步完成後呼叫 func()（在監聽執行緒上）；已經完成時立即呼叫"""
+        with self._lock:
+            if not self._ready.is_set():
+                self._ready_listeners.append(func)
+                return func
+        func()
+        return func
+
+    def _on_snapshot(self, col_snapshot, changes, read_time):
+        try:
+            with self._lock:
+                for change in changes:
+                    doc = change.document
+                    if change.type.name == "REMOVED":
+                        self._remove(doc.id)
+                    else:
+                        self._upsert(doc.id, doc.to_dict() or {})
+                self.version += 1
+        except Exception:
+            log.exception("[subscriptions] 套用 snapshot 失敗")
+            return
+        if not self._ready.is_set():
+            with self._lock:
+                self._ready.set()
+                listeners, self._ready_listeners = self._ready_listeners, []
+            log.info("[subscriptions] ✅ 首次同步完成 subs=%s", len(self._subs))
+            for func in listeners:
+                try:
+                    func()
+                except Exception:
+                    log.exception("[subscriptions] ready listener 失敗")
+
+    # -------------------- 索引維護 --------------------
+    def upsert(self, user_id: str, data: Dict[str, Any]):
+        with self._lock:
+            self._upsert(user_id, data)
+
+    def remove(self, user_id: str):
+        with self._lock:
+            self._remove(user_id)
+
+    def _upsert(self, user_id: str, data: Dict[str, Any]):
+        self._remove(user_id)
+        sub = _Sub.from_form(user_id, data)
+        self._subs[user_id] = sub
+        self._keys.setdefault(sub.key, _KeyIndex()).add(sub)
+
+    def _remove(self, user_id: str):
+        sub = self._subs.pop(user_id, None)
+        if sub is not None and sub.key in self._keys:
+            self._keys[sub.key].remove(sub)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._subs
+
+    def __len__(self):
+        return len(self._subs)
+
+    # -------------------- 比對 --------------------
+    def match(self, listing: Dict[str, Any]) -> Set[str]:
+        """回傳條件符合此物件的 user_id"""
+        genre = listing.get("genre") or None
+        room = parse_room(listing.get("room"))
+        # 與 ListingIndex 相同：字串價格轉成數字，轉不了的視為沒有價格
+        price = _price_key(listing.get("price"))
+
+        keys = [(ANY, ANY)]
+        if genre:
+            keys.append((genre, ANY))
+        if room:
+            keys.append((ANY, room))
+        if genre and room:
+            keys.append((genre, room))
+
+        matched = set()
+        with self._lock:
+            for key in keys:
+                idx = self._keys.get(key)
+                if idx is None:
+                    continue
+                for user_id in idx.candidates(price):
+                    if user_id in matched:
+                        continue
+                    sub = self._subs.get(user_id)
+                    if sub is not None and sub.price_ok(price):
+                        matched.add(sub.user_id)
+        return matched
+
+
+def _is_active(data: Optional[Dict[str, Any]]) -> bool:
+    return bool(data) and data.get("status", "active") == "active"
+
+
+class SubscriptionNotifier:
+    def __init__(self, index: SubscriptionIndex, render_card: Callable[[str, dict], dict],
+                 deliver: Callable[[List[Tuple[str, dict]]], Any], claims_col=None, max_cards: int = 10,
+                 pending_max: int = 1000):
+        """
+        render_card: (doc_id, data) -> bubble，例如 RenderCache.get
+        deliver:     deliver([(user_id, carousel)]) → 負責包成訊息送出，回傳送不出去的 user_id（可為 None）
+        claims_col:  db.collection("notifications")，用來確保同一個 (物件, 使用者) 只通知一次
+        pending_max: forms 首次同步完成前最多暫存幾筆物件變動，超過的丟棄最舊的並計數
+        """
+        self.index = index
+        self._render = render_card
+        self._deliver = deliver
+        self._claims = claims_col
+        self.max_cards = max_cards
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="notifier")
+        self._lock = threading.Lock()
+        self._pending: deque = deque(maxlen=pending_max)
+        self._counters = {"listings": 0, "matches": 0, "claimed": 0, "duplicates": 0, "pushed": 0,
+                          "released": 0, "failed": 0, "deferred": 0, "deferred_dropped": 0}
+        index.add_ready_listener(self._flush_pending)
+
+    def on_listing_changes(self, changes, version):
+        """給 ListingIndex.add_listener 使用；首次同步（全量載入）不通知"""
+        if version <= 1:
+            return
+        fresh = []
+        for kind, doc_id, old, new in changes:
+            if kind == "REMOVED" or not _is_active(new):
+                continue
+            fresh.append((doc_id, old, new))
+        if not fresh:
+            return
+        with self._lock:
+            if not self.index.ready:
+                # forms 還沒同步完，現在比對會漏掉使用者 → 暫存，ready 後由 _flush_pending 送出
+                dropped = max(0, len(self._pending) + len(fresh) - self._pending.maxlen)
+                self._pending.extend(fresh)
+                self._counters["deferred"] += len(fresh)
+                self._counters["deferred_dropped"] += dropped
+                if dropped:
+                    log.warning("[subscriptions] ⚠️ 暫存已滿，丟棄最舊的 %s 筆物件變動", dropped)
+                return
+        self._submit(fresh)
+
+    def _flush_pending(self):
+        with self._lock:
+            fresh, self._pending = list(self._pending), deque(maxlen=self._pending.maxlen)
+        if fresh:
+            log.info("[subscriptions] forms 同步完成，補比對暫存的 %s 筆物件", len(fresh))
+            self._submit(fresh)
+
+    def _submit(self, fresh):
+        self._executor.submit(self._notify, fresh).add_done_callback(self._log_failure)
+
+    def _log_failure(self, future: concurrent.futures.Future):
+        e = future.exception()
+        if e is not None:
+            self._incr("failed")
+            log.error("[subscriptions] ❌ 新物件通知失敗: %s", e, exc_info=e)
+
+    def _notify(self, fresh: List[Tuple[str, Optional[dict], dict]]):
+        per_user: Dict[str, List[Tuple[str, dict]]] = {}
+        for doc_id, old, new in fresh:
+            users = self.index.match(new)
+            if _is_active(old):
+                # 修改：只通知「原本不符合、現在才符合」的人
+                users -= self.index.match(old)
+            self._incr("listings")
+            self._incr("matches", len(users))
+            for user_id in users:
+                if self._claim(doc_id, user_id):
+                    per_user.setdefault(user_id, []).append((doc_id, new))
+
+        pairs = []
+        sent: Dict[str, List[str]] = {}
+        unsent: List[Tuple[str, str]] = []
+        for user_id, items in per_user.items():
+            bubbles = []
+            for doc_id, data in items[:self.max_cards]:
+                try:
+                    bubbles.append(self._render(doc_id, data))
+                    sent.setdefault(user_id, []).append(doc_id)
+                except Exception as e:
+                    log.error("[subscriptions] listing_card 失敗 doc_id=%s, error=%s", doc_id, e)
+                    unsent.append((doc_id, user_id))
+            unsent.extend((doc_id, user_id) for doc_id, _ in items[self.max_cards:])
+            if bubbles:
+                pairs.append((user_id, {"type": "carousel", "contents": bubbles}))
+        try:
+            if pairs:
+                failed = set(self._deliver(pairs) or ())
+                self._incr("pushed", len(pairs) - len(failed))
+                for user_id in failed:
+                    unsent.extend((doc_id, user_id) for doc_id in sent.get(user_id, ()))
+        except Exception:
+            unsent.extend((doc_id, user_id) for user_id, doc_ids in sent.items() for doc_id in doc_ids)
+            raise
+        finally:
+            for doc_id, user_id in unsent:
+                self._release(doc_id, user_id)
+        if per_user:
+            log.info("[subscriptions] 📣 新物件通知 listings=%s users=%s", len(fresh), len(per_user))
+
+    def _claim(self, doc_id: str, user_id: str) -> bool:
+        if self._claims is None:
+            return True
+        try:
+            with firestore_call("notifications.create"):
+                self._claims.document(f"{doc_id}_{user_id}").create({"listing_id": doc_id, "user_id": user_id})
+            self._incr("claimed")
+            return True
+        except Exception as e:
+            # AlreadyExists（409）→ 其他 worker 已經通知過
+            if getattr(e, "code", None) == 409 or type(e).__name__ in ("Conflict", "AlreadyExists"):
+                self._incr("duplicates")
+                return False
+            log.warning("[subscriptions] 通知紀錄寫入失敗 doc_id=%s user_id=%s: %s", doc_id, user_id, e)
+            return False
+
+    def _release(self, doc_id: str, user_id: str):
+        """沒送出去 → 刪除搶占紀錄，下次物件變動時可以再通知"""
+        if self._claims is None:
+            return
+        try:
+            with firestore_call("notifications.delete"):
+                self._claims.document(f"{doc_id}_{user_id}").delete()
+            self._incr("released")
+        except Exception as e:
+            log.warning("[subscriptions] 通知紀錄刪除失敗 doc_id=%s user_id=%s: %s", doc_id, user_id, e)
+
+    def _incr(self, key: str, n: int = 1):
+        with self._lock:
+            self._counters[key] += n
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["pending"] = len(self._pending)
+        stats["subscriptions"] = len(self.index)
+        return stats
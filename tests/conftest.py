@@ -0,0 +1,8 @@
+# tests/conftest.py
+import os
+import sys
+
+# 專案是平鋪的模組（沒有 package），測試直接 import 根目錄的檔案
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
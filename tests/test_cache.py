@@ -0,0 +1,94 @@
+# tests/test_cache.py
+import threading
+import time
+
+from cache import SWRCache
+
+
+class _BlockingLoader:
+    """第一次呼叫卡住直到 release；之後回傳目前的 version"""
+
+    def __init__(self):
+        self.version = 1
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def __call__(self, key):
+        self.calls += 1
+        value = f"{key}-v{self.version}"
+        if self.calls == 1:
+            self.started.set()
+            self.release.wait(5)
+        return value
+
+
+def test_concurrent_misses_share_one_load():
+    loader = _BlockingLoader()
+    cache = SWRCache(loader)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("h1"))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    loader.started.wait(5)
+    time.sleep(0.05)
+    loader.release.set()
+    for t in threads:
+        t.join()
+    assert results == ["h1-v1"] * 5
+    assert loader.calls == 1
+    assert cache.stats()["coalesced"] == 4
+
+
+def test_invalidate_during_load_discards_result():
+    loader = _BlockingLoader()
+    cache = SWRCache(loader)
+    t = threading.Thread(target=cache.get, args=("h1",))
+    t.start()
+    loader.started.wait(5)
+    # 載入已經讀到 v1，這時資料更新並失效
+    loader.version = 2
+    cache.invalidate("h1")
+    loader.release.set()
+    t.join()
+    assert cache.stats()["discarded_loads"] == 1
+    assert cache.get("h1") == "h1-v2"
+
+
+def test_invalidate_all_during_stale_refresh():
+    loader = _BlockingLoader()
+    loader.calls = 1              # 第一次載入不要卡住
+    cache = SWRCache(loader, ttl=0, stale_ttl=60)
+    assert cache.get("h1") == "h1-v1"
+
+    loader.calls = 0              # 背景更新卡住
+    assert cache.get("h1") == "h1-v1"
+    loader.started.wait(5)
+    loader.version = 2
+    cache.invalidate()
+    loader.release.set()
+    for _ in range(100):
+        if cache.stats()["discarded_loads"]:
+            break
+        time.sleep(0.01)
+    assert cache.get("h1") == "h1-v2"
+
+
+def test_set_during_load_wins():
+    loader = _BlockingLoader()
+    cache = SWRCache(loader)
+    t = threading.Thread(target=cache.get, args=("h1",))
+    t.start()
+    loader.started.wait(5)
+    cache.set("h1", "pushed")
+    loader.release.set()
+    t.join()
+    assert cache.get("h1") == "pushed"
+
+
+def test_none_is_negative_cached():
+    calls = []
+    cache = SWRCache(lambda key: calls.append(key), negative_ttl=60)
+    assert cache.get("missing") is None
+    assert cache.get("missing") is None
+    assert calls == ["missing"]
@@ -0,0 +1,77 @@
+# tests/test_dispatcher.py
+import threading
+import time
+from types import SimpleNamespace
+
+import metrics
+from dispatcher import HandlerRegistry, WebhookDispatcher
+
+
+class MessageEvent(SimpleNamespace):
+    pass
+
+
+class _Parser:
+    def __init__(self, events):
+        self.events = events
+
+    def parse(self, body, signature, as_payload=False):
+        return SimpleNamespace(events=self.events, destination="D")
+
+
+def _event(user_id, text):
+    return MessageEvent(source=SimpleNamespace(user_id=user_id), text=text)
+
+
+def _dispatcher(events, func, **kwargs):
+    handlers = HandlerRegistry()
+    handlers.add("MessageEvent")(func)
+    return WebhookDispatcher(_Parser(events), handlers, **kwargs)
+
+
+def test_same_source_handled_in_order():
+    seen = []
+    events = [_event("U1", str(i)) for i in range(20)]
+    d = _dispatcher(events, lambda e: seen.append(e.text), workers=4)
+    assert d.dispatch("{}", "sig") == 20
+    d.stop()
+    assert seen == [str(i) for i in range(20)]
+    assert d.stats()["handled"] == 20
+
+
+def test_full_queue_sheds_instead_of_running_inline():
+    release = threading.Event()
+    threads = []
+
+    def handle(event):
+        threads.append(threading.current_thread().name)
+        release.wait(5)
+
+    events = [_event("U1", str(i)) for i in range(4)]
+    d = _dispatcher(events[:1], handle, workers=1, maxsize=1, put_timeout=0.05)
+    d.dispatch("{}", "sig")
+    time.sleep(0.05)              # worker 卡在第一個事件
+    d.parser.events = events[1:]
+    started = time.monotonic()
+    # 只排得進一個；整批只等一次 put_timeout
+    assert d.dispatch("{}", "sig") == 1
+    assert time.monotonic() - started < 0.5
+    assert d.shed() == 2
+    assert 'webhook_events_shed_total{event="MessageEvent"} 2' in metrics.render()
+    release.set()
+    d.stop()
+    assert threads == ["webhook-0", "webhook-0"]
+
+
+class TextMessage(SimpleNamespace):
+    pass
+
+
+def test_registry_prefers_event_message_key_then_event_then_default():
+    handlers = HandlerRegistry()
+    handlers.add("MessageEvent", message="TextMessage")(lambda e: "text")
+    handlers.add("MessageEvent")(lambda e: "message")
+    handlers.default()(lambda e: "default")
+    assert handlers.find(MessageEvent(message=TextMessage()))(None) == "text"
+    assert handlers.find(MessageEvent(message=SimpleNamespace()))(None) == "message"
+    assert handlers.find(SimpleNamespace())(None) == "default"
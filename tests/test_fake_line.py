@@ -0,0 +1,56 @@
+# tests/test_fake_line.py
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from fake_line import FakeLineServer, validate_message_request
+
+
+@pytest.fixture
+def server():
+    server = FakeLineServer(("127.0.0.1", 0), max_retry_keys=2).start()
+    yield server
+    server.stop()
+
+
+def _post(server, path, body, retry_key=None):
+    headers = {"Authorization": "Bearer t", "Content-Type": "application/json"}
+    if retry_key:
+        headers["X-Line-Retry-Key"] = retry_key
+    req = urllib.request.Request(server.endpoint + path, json.dumps(body).encode(), headers)
+    try:
+        with urllib.request.urlopen(req) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_validate_message_request():
+    ok = {"to": "U1", "messages": [{"type": "text", "text": "hi"}]}
+    assert validate_message_request("push", ok) == []
+    # FrozenMessage 之類的 tuple 被當成 list 展開就會變成這樣
+    bad = {"to": "U1", "messages": ["flex", "alt", {"type": "bubble"}]}
+    assert [e["property"] for e in validate_message_request("push", bad)] == ["messages[0]", "messages[1]"]
+    assert validate_message_request("reply", {"messages": [{"type": "text"}]})[0]["property"] == "replyToken"
+    assert validate_message_request("multicast", {"to": [], "messages": [{"type": "text"}]})[0]["property"] == "to"
+    assert validate_message_request("push", {"to": "U1", "messages": [{"type": "text"}] * 6})[0]["property"] == "messages"
+
+
+def test_rejects_malformed_messages(server):
+    status, body = _post(server, "/v2/bot/message/push", {"to": "U1", "messages": ["text"]})
+    assert status == 400 and body["details"][0]["property"] == "messages[0]"
+    status, body = _post(server, "/v2/bot/message/push", {"to": "U1", "messages": [{"type": "text", "text": "hi"}]})
+    assert status == 200 and len(body["sentMessages"]) == 1
+
+
+def test_retry_keys_are_bounded(server):
+    message = {"to": "U1", "messages": [{"type": "text", "text": "hi"}]}
+    assert _post(server, "/v2/bot/message/push", message, "k1")[0] == 200
+    assert _post(server, "/v2/bot/message/push", message, "k1")[0] == 409
+    assert _post(server, "/v2/bot/message/push", message, "k2")[0] == 200
+    assert _post(server, "/v2/bot/message/push", message, "k3")[0] == 200
+    # 只記得最近 2 個
+    assert len(server._seen_retry_keys) == 2
+    assert _post(server, "/v2/bot/message/push", message, "k1")[0] == 200
@@ -0,0 +1,50 @@
+# tests/test_fanout.py
+import flex_templates as ft
+from fanout import Fanout
+from line_raw import LineApiError
+
+
+class _Client:
+    def __init__(self, error):
+        self.calls = []
+        self._error = error
+
+    def multicast(self, to, messages, retry_key=None):
+        self.calls.append(list(to))
+        error = self._error(to)
+        if error is not None:
+            raise error
+
+
+def _pairs(n):
+    message = ft.freeze_flex("alt", {"type": "bubble"})
+    return [(f"U{i}", message) for i in range(n)]
+
+
+def test_message_error_fails_batch_without_splitting():
+    error = LineApiError(400, "bad", [{"message": "invalid", "property": "messages[0].contents"}])
+    client = _Client(lambda to: error)
+    result = Fanout(client).deliver(_pairs(500))
+    assert result == {"delivered": 0, "failed": 500}
+    assert len(client.calls) == 1
+
+
+def test_recipient_error_splits_down_to_bad_user():
+    def error(to):
+        if "U7" in to:
+            return LineApiError(400, "bad", [{"message": "invalid", "property": "to[0]"}])
+        return None
+
+    client = _Client(error)
+    fanout = Fanout(client)
+    failed = []
+    assert fanout.deliver(_pairs(16), on_failed=failed.extend) == {"delivered": 15, "failed": 1}
+    assert failed == ["U7"]
+    assert fanout.stats()["splits"] == 4
+
+
+def test_unknown_400_split_depth_is_capped():
+    client = _Client(lambda to: LineApiError(400, "bad"))
+    fanout = Fanout(client, max_split_depth=2)
+    assert fanout.deliver(_pairs(100)) == {"delivered": 0, "failed": 100}
+    assert len(client.calls) == 1 + 2 + 4
@@ -0,0 +1,74 @@
+# tests/test_line_raw.py
+from types import SimpleNamespace
+
+import pytest
+
+import metrics
+from line_raw import RawMessagingClient
+
+
+class _Session:
+    def __init__(self):
+        self.posts = []
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        self.posts.append((url, data, headers))
+        return SimpleNamespace(status_code=200, text="{}")
+
+
+def _line_api_labels():
+    return {line.split('api="', 1)[1].split('"', 1)[0]
+            for line in metrics.render().splitlines() if line.startswith("line_api_call_duration_seconds_count")}
+
+
+def test_api_labels_match_sdk_method_names():
+    client = RawMessagingClient(_Session(), "token")
+    client.push("U1", '{"type":"text","text":"hi"}', retry_key="k")
+    client.reply("r", '{"type":"text","text":"hi"}')
+    client.multicast(["U1"], '{"type":"text","text":"hi"}')
+    labels = _line_api_labels()
+    assert {"push_message", "reply_message", "multicast"} <= labels
+    assert not {"push", "reply"} & labels
+
+
+def test_messages_body_keeps_frozen_message_whole():
+    import json
+
+    import flex_templates as ft
+    from line_raw import _messages_body
+
+    frozen = ft.freeze_flex("alt", {"type": "bubble"})
+    for messages in (frozen, [frozen, frozen], (frozen,)):
+        parsed = json.loads(_messages_body(messages))
+        assert all(isinstance(m, dict) and m["type"] == "flex" for m in parsed)
+    assert json.loads(_messages_body(frozen)) == [json.loads(frozen.json)]
+
+
+def test_messages_body_accepts_dicts_and_strings():
+    import json
+
+    from line_raw import _messages_body
+
+    text = {"type": "text", "text": "中文"}
+    assert json.loads(_messages_body(text)) == [text]
+    assert json.loads(_messages_body([text, '{"type":"text","text":"b"}'])) == [text, {"type": "text", "text": "b"}]
+    assert "中文" in _messages_body(text)
+
+
+def test_error_details_parsed_from_line_error_body():
+    from line_raw import error_details
+
+    body = '{"message":"The request body has 1 error(s)","details":[{"message":"invalid","property":"to[2]"}]}'
+    assert error_details(body) == [{"message": "invalid", "property": "to[2]"}]
+    assert error_details("<html>bad gateway</html>") == []
+    assert error_details('{"message":"x"}') == []
+
+
+@pytest.mark.filterwarnings("ignore::DeprecationWarning")
+def test_messages_body_serializes_sdk_models():
+    import json
+
+    from linebot.models import TextSendMessage
+    from line_raw import _messages_body
+
+    assert json.loads(_messages_body(TextSendMessage(text="嗨"))) == [{"type": "text", "text": "嗨"}]
@@ -0,0 +1,85 @@
+# tests/test_listing_index.py
+import random
+
+import fake_firestore
+from listing_index import ListingIndex
+
+
+def _index_with(docs):
+    db = fake_firestore.client()
+    col = db.collection("listings")
+    for doc_id, data in docs.items():
+        col.document(doc_id).set(data)
+    index = ListingIndex(col).start()
+    assert index.wait_ready(5)
+    return db, col, index
+
+
+def test_initial_snapshot_sorted_by_price():
+    ids = [f"h{i:03d}" for i in range(200)]
+    random.Random(1).shuffle(ids)
+    docs = {doc_id: {"price": (i * 37) % 200, "room": 2, "genre": "公寓"} for i, doc_id in enumerate(ids)}
+    docs["nop"] = {"room": 2, "genre": "公寓"}
+    _, _, index = _index_with(docs)
+
+    prices = [data["price"] for _, data in index.search()[:-1]]
+    assert prices == sorted(prices)
+    assert index.search()[-1][0] == "nop"
+    # 沒有價格的物件不受預算限制，排在最後
+    ranged = index.search(min_price=10, max_price=12)
+    assert [data.get("price") for _, data in ranged] == [10, 11, 12, None]
+
+
+def test_changes_after_initial_sync_keep_order():
+    db, col, index = _index_with({"a": {"price": 100}, "b": {"price": 300}})
+    col.document("c").set({"price": 200})
+    col.document("a").set({"price": 400})
+    col.document("b").delete()
+    db.flush_watches()
+
+    assert [doc_id for doc_id, _ in index.search()] == ["c", "a"]
+    assert index.get("b") is None
+
+
+def test_inactive_listing_leaves_search_top_and_get():
+    db, col, index = _index_with({
+        "a": {"price": 100, "top": True},
+        "b": {"price": 200, "top": True},
+        "gone": {"price": 150, "top": True, "status": "inactive"},
+    })
+    assert [doc_id for doc_id, _ in index.search()] == ["a", "b"]
+    assert index.get("gone") is None
+
+    changes = []
+    index.add_listener(lambda applied, version: changes.extend(applied))
+    col.document("a").set({"price": 100, "top": True, "status": "inactive"})
+    db.flush_watches()
+
+    assert [doc_id for doc_id, _ in index.search()] == ["b"]
+    assert [doc_id for doc_id, _ in index.top()] == ["b"]
+    assert index.get("a") is None
+    assert changes == [("REMOVED", "a", {"price": 100, "top": True}, None)]
+
+
+def test_failed_initial_sync_is_discarded_and_resubscribed(monkeypatch):
+    db = fake_firestore.client()
+    col = db.collection("listings")
+    for i, price in enumerate([500, 100, 400, 200, 300]):
+        col.document(f"h{i}").set({"price": price})
+
+    calls = []
+    insert = ListingIndex._insert
+
+    def flaky_insert(self, doc_id, data, keep_sorted=True):
+        calls.append(doc_id)
+        if len(calls) == 3:
+            raise RuntimeError("boom")
+        return insert(self, doc_id, data, keep_sorted)
+
+    monkeypatch.setattr(ListingIndex, "_insert", flaky_insert)
+    index = ListingIndex(col).start()
+    assert index.wait_ready(5)
+    # 第一次套用到一半失敗 → 丟掉重來，不會留下重複或沒排序的價格
+    assert [data["price"] for _, data in index.search()] == [100, 200, 300, 400, 500]
+    assert len(index) == 5
+    assert index.version == 1
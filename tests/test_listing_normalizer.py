@@ -0,0 +1,33 @@
+# tests/test_listing_normalizer.py
+from listing_normalizer import ListingNormalizer, parse_chinese_number, parse_number, parse_price
+
+
+def test_number_parsing():
+    assert parse_chinese_number("三千五百") == 3500
+    assert parse_chinese_number("一億二千萬") == 120_000_000
+    assert parse_number("3房2廳") == 3
+    assert parse_number("兩房") == 2
+    assert parse_number("35.5坪") == 35.5
+    assert parse_number("面議") is None
+    assert parse_price("1,280萬") == 1280
+    assert parse_price("１５００萬") == 1500
+    assert parse_price("1億2000萬") == 12000
+    assert parse_price("2200") == 2200
+
+
+def test_row_converts_plan_fields():
+    doc_id, data = ListingNormalizer(extra={"updated_at": "ts"}).row(
+        {"id": " h1 ", "title": " 中壢透天 ", "price": "三千五百萬", "room": "4房", "top": "TRUE", "status": ""})
+    assert doc_id == "h1"
+    assert data["title"] == "中壢透天"
+    assert (data["price"], data["room"], data["top"], data["status"]) == (3500, 4, True, "active")
+    assert data["parking_space"] is False and data["updated_at"] == "ts"
+
+
+def test_iter_rows_keeps_input_order():
+    items = [{"id": "a", "price": "100"}, {"price": "200"}, {"id": "b", "price": "300"}, {"id": " "}]
+    out = list(ListingNormalizer().iter_rows(items))
+    assert [doc_id for doc_id, _ in out] == ["a", None, "b", None]
+    # 缺 id 的列原樣交回，呼叫端可以印出來
+    assert out[1][1] is items[1]
+    assert out[2][1]["price"] == 300
@@ -0,0 +1,48 @@
+# tests/test_outbox.py
+import threading
+import time
+
+from outbox import Outbox
+
+
+class _Status(Exception):
+    def __init__(self, status_code):
+        super().__init__(status_code)
+        self.status_code = status_code
+
+
+def test_retries_with_same_retry_key():
+    calls = []
+
+    def send(to, messages, retry_key=None):
+        calls.append(retry_key)
+        if len(calls) < 3:
+            raise _Status(503)
+
+    box = Outbox(send, workers=1, backoff=0.001)
+    assert box.push("U1", ["hi"])
+    box.stop()
+    assert len(calls) == 3 and len(set(calls)) == 1
+    assert box.stats()["sent"] == 1 and box.stats()["retried"] == 2
+
+
+def test_full_queue_drops_after_bounded_wait():
+    release = threading.Event()
+    sent = []
+
+    def send(to, messages, retry_key=None):
+        release.wait(5)
+        sent.append(messages)
+
+    box = Outbox(send, workers=1, maxsize=1, put_timeout=0.05)
+    assert box.push("U1", "first")
+    time.sleep(0.05)              # worker 拿走第一則、卡在 send
+    assert box.push("U1", "second")
+    started = time.monotonic()
+    assert box.push("U1", "third") is False
+    # 只等 put_timeout，不在呼叫端同步送出
+    assert time.monotonic() - started < 1
+    assert box.dropped() == 1
+    release.set()
+    box.stop()
+    assert sent == ["first", "second"]
@@ -0,0 +1,76 @@
+# tests/test_profiles.py
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import fake_firestore
+from profiles import DEFAULT_NAME, ProfileResolver
+from repository import Repository, begin_request, end_request
+
+
+def _resolver(fetch, **kwargs):
+    db = fake_firestore.client()
+    kwargs.setdefault("refresh_interval", 0)
+    return ProfileResolver(fetch, users=Repository(db).users, **kwargs), db.collection("users")
+
+
+def test_cold_miss_waits_for_profile():
+    resolver, users = _resolver(lambda uid: SimpleNamespace(display_name="小明"))
+    assert resolver.display_name("U1") == "小明"
+    # 也寫回 users，下一個 worker 不必再打 LINE
+    assert users.document("U1").get().to_dict()["display_name"] == "小明"
+
+
+def test_cold_miss_timeout_falls_back_then_backfills():
+    release = threading.Event()
+
+    def slow(uid):
+        release.wait(5)
+        return SimpleNamespace(display_name="小華")
+
+    resolver, _ = _resolver(slow, fetch_timeout=0.05)
+    assert resolver.display_name("U1") == DEFAULT_NAME
+    assert resolver.stats()["fetch_timeout"] == 1
+    release.set()
+    for _ in range(100):
+        if resolver.cached("U1"):
+            break
+        time.sleep(0.01)
+    assert resolver.display_name("U1") == "小華"
+
+
+def test_refresh_loop_skips_entries_nobody_reads():
+    fetched = []
+    resolver, _ = _resolver(lambda uid: fetched.append(uid) or SimpleNamespace(display_name=uid),
+                            ttl=10, refresh_interval=0.02, active_window=60)
+    old = time.time() - 9
+    resolver._set("active", "A", old)
+    resolver._set("idle", "B", old)
+    with resolver._lock:
+        name, fetched_at, _ = resolver._cache["idle"]
+        resolver._cache["idle"] = (name, fetched_at, time.time() - 3600)
+    time.sleep(0.2)
+    resolver.stop()
+    assert "active" in fetched and "idle" not in fetched
+
+
+def test_lookup_and_accept_stored_leave_stale_refresh_to_caller():
+    calls = []
+    resolver, _ = _resolver(lambda uid: calls.append(uid) or SimpleNamespace(display_name="新名字"))
+    old = {"display_name": "舊名字", "profile_fetched_at": SimpleNamespace(timestamp=lambda: 0)}
+    assert resolver.accept_stored("U1", old, refresh=False) == "舊名字"
+    assert resolver.lookup("U1") == ("舊名字", False)
+    assert resolver.lookup("U2") == (None, False)
+    time.sleep(0.05)
+    assert calls == []
+    resolver.put("U1", "新名字", write_through=False)
+    assert resolver.lookup("U1") == ("新名字", True)
+
+
+def test_store_reads_count_as_request_round_trips():
+    resolver, users = _resolver(lambda uid: SimpleNamespace(display_name="小明"))
+    users.document("U1").set({"display_name": "小明", "profile_fetched_at": datetime.now(timezone.utc)})
+    token = begin_request()
+    assert resolver.display_name("U1") == "小明"
+    assert end_request(token) == {"users.get": 1}
@@ -0,0 +1,30 @@
+# tests/test_repository.py
+import fake_firestore
+from repository import Repository, begin_request, end_request
+
+
+def test_pipeline_commits_writes_in_one_round_trip():
+    db = fake_firestore.client()
+    repo = Repository(db)
+    token = begin_request()
+    with repo.pipeline() as p:
+        booking_id = repo.bookings.add({"userId": "U1", "name": "王小明"}, pipeline=p)
+        repo.users.set("U1", {"display_name": "小明"}, merge=True, pipeline=p)
+        # commit 之前還沒寫入
+        assert repo.users.get("U1") is None
+    counts = end_request(token)
+
+    assert counts == {"users.get": 1, "batch_commit": 1}
+    assert repo.bookings.get(booking_id) == {"userId": "U1", "name": "王小明"}
+    assert repo.users.get("U1") == {"display_name": "小明"}
+
+
+def test_create_or_update_with_hint_skips_create():
+    db = fake_firestore.client()
+    repo = Repository(db)
+    assert repo.forms.create_or_update("U1", {"budget": "1000萬以下"}, on_create={"created_at": 1}) is True
+
+    token = begin_request()
+    assert repo.forms.create_or_update("U1", {"budget": "3000萬以上"}, exists_hint=True) is False
+    assert end_request(token) == {"forms.set": 1}
+    assert repo.forms.get("U1") == {"budget": "3000萬以上", "created_at": 1}
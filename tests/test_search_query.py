@@ -0,0 +1,67 @@
+# tests/test_search_query.py
+import asyncio
+
+import fake_firestore
+from search_query import afetch_listings, afetch_top, fetch_listings, fetch_top
+
+
+def _listings(docs):
+    db = fake_firestore.client()
+    col = db.collection("listings")
+    for doc_id, data in docs.items():
+        col.document(doc_id).set(data)
+    return db, col
+
+
+DOCS = {
+    "a": {"room": 2, "genre": "公寓", "price": 1500},
+    "b": {"room": 2, "genre": "公寓", "price": 800},
+    "c": {"room": 2, "genre": "公寓", "price": None},
+    "d": {"room": 2, "genre": "公寓"},  # 沒有 price 欄位
+    "e": {"room": 3, "genre": "公寓", "price": 900},
+}
+
+
+def test_no_budget_orders_by_price_with_unpriced_last():
+    _, col = _listings(DOCS)
+    items = fetch_listings(col, room=2, genre="公寓")
+    # 依價格排序，price 是 null 的排最後；完全沒有 price 欄位的 Firestore 查不到
+    assert [doc_id for doc_id, _ in items] == ["b", "a", "c"]
+
+
+def test_no_budget_limit_keeps_cheapest():
+    docs = {f"h{i}": {"room": 2, "price": 1000 - i} for i in range(10)}
+    _, col = _listings(docs)
+    items = fetch_listings(col, room=2, limit=3, page_size=2)
+    assert [doc_id for doc_id, _ in items] == ["h9", "h8", "h7"]
+
+
+def test_budget_range_puts_unpriced_last():
+    _, col = _listings(DOCS)
+    items = fetch_listings(col, room=2, min_budget=1000, max_budget=2000)
+    assert [doc_id for doc_id, _ in items] == ["a", "c"]
+
+
+def test_limit_applies_across_both_passes():
+    _, col = _listings(DOCS)
+    items = fetch_listings(col, room=2, max_budget=2000, limit=2, page_size=1)
+    assert [doc_id for doc_id, _ in items] == ["b", "a"]
+
+
+def test_async_matches_sync():
+    db, col = _listings(DOCS)
+    acol = fake_firestore.async_client(db).collection("listings")
+    for kwargs in ({"room": 2}, {"room": 2, "max_budget": 1000}, {"genre": "公寓", "min_budget": 850}):
+        got = asyncio.run(afetch_listings(acol, **kwargs))
+        assert got == fetch_listings(col, **kwargs)
+
+
+def test_inactive_listings_skipped_and_backfilled():
+    docs = {f"h{i}": {"room": 2, "price": 100 + i, "top": True} for i in range(6)}
+    docs["h0"]["status"] = docs["h2"]["status"] = "inactive"
+    db, col = _listings(docs)
+    items = fetch_listings(col, room=2, max_budget=1000, limit=3, page_size=2)
+    assert [doc_id for doc_id, _ in items] == ["h1", "h3", "h4"]
+    assert [doc_id for doc_id, _ in fetch_top(col, 3)] == ["h1", "h3", "h4"]
+    acol = fake_firestore.async_client(db).collection("listings")
+    assert asyncio.run(afetch_top(acol, 3)) == fetch_top(col, 3)
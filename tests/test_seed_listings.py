@@ -0,0 +1,74 @@
+# tests/test_seed_listings.py
+import csv
+
+import pytest
+
+pytest.importorskip("firebase_admin")
+
+import fake_firestore  # noqa: E402
+import seed_listings  # noqa: E402
+
+
+def _write_csv(path, n):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["id", "title", "price"])
+        writer.writeheader()
+        for i in range(n):
+            # 每 7 列一列缺 id：不佔批次位置，重跑時切出的批次要和第一次相同
+            writer.writerow({"id": "" if i % 7 == 3 else f"h{i:03d}", "title": f"物件{i}", "price": str(i)})
+
+
+class _FlakyBatches:
+    """包住假的 Firestore：含 fail_id 的那一批 commit 一律失敗"""
+
+    def __init__(self, db, fail_id=None):
+        self._db = db
+        self.fail_id = fail_id
+        self.committed = []
+
+    def collection(self, name):
+        return self._db.collection(name)
+
+    def batch(self):
+        outer = self
+        batch = self._db.batch()
+        commit = batch.commit
+        ids = []
+        original_set = batch.set
+
+        def set_(ref, data, merge=False):
+            ids.append(ref.id)
+            return original_set(ref, data, merge=merge)
+
+        def commit_():
+            if outer.fail_id in ids:
+                raise RuntimeError("unavailable")
+            outer.committed.append(list(ids))
+            return commit()
+
+        batch.set = set_
+        batch.commit = commit_
+        return batch
+
+
+def test_import_resumes_from_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(seed_listings.time, "sleep", lambda s: None)
+    source = tmp_path / "listings.csv"
+    _write_csv(source, 60)
+    checkpoint = str(tmp_path / "listings.csv.checkpoint")
+    db = fake_firestore.client()
+
+    flaky = _FlakyBatches(db, fail_id="h040")
+    with pytest.raises(RuntimeError):
+        seed_listings.import_listings(flaky, str(source), batch_size=10, workers=1, checkpoint_path=checkpoint)
+    first = flaky.committed
+    assert first and all("h040" not in ids for ids in first)
+
+    resumed = _FlakyBatches(db)
+    result = seed_listings.import_listings(resumed, str(source), batch_size=10, workers=1,
+                                           checkpoint_path=checkpoint)
+    # 已完成的批次不再寫入
+    assert result["skipped"] == sum(len(ids) for ids in first)
+    assert not {i for ids in first for i in ids} & {i for ids in resumed.committed for i in ids}
+    assert len(list(db.collection("listings").stream())) == sum(1 for i in range(60) if i % 7 != 3)
+    assert not (tmp_path / "listings.csv.checkpoint").exists()
@@ -0,0 +1,93 @@
+# tests/test_shared_cache.py
+import os
+import sqlite3
+import stat
+from datetime import datetime, timezone
+
+import pytest
+
+from shared_cache import MISSING, SharedCache
+
+
+def _cache(tmp_path, **kwargs):
+    directory = tmp_path / "cache"
+    return SharedCache(str(directory / "shared.sqlite3"), poll_interval=0, **kwargs)
+
+
+def test_round_trip_keeps_datetimes(tmp_path):
+    cache = _cache(tmp_path)
+    house = {"title": "中壢透天", "price": 1880, "tags": ["車位"],
+             "updated_at": datetime(2026, 1, 2, 3, 4, 5, 123456, tzinfo=timezone.utc)}
+    cache.set("listing:h1", house)
+    cache.set("listing:gone", None)
+    assert cache.get("listing:h1") == house
+    assert cache.get("listing:gone") is None
+    assert cache.get("listing:nope") is MISSING
+
+
+def test_values_are_stored_as_json_text(tmp_path):
+    cache = _cache(tmp_path)
+    cache.set("card:x", {"type": "bubble"})
+    row = sqlite3.connect(cache.path).execute("SELECT value FROM entries").fetchone()
+    assert row == ('{"type":"bubble"}',)
+
+
+def test_unserializable_value_is_not_cached(tmp_path):
+    cache = _cache(tmp_path)
+    cache.set("bad", {"obj": object()})
+    assert cache.get("bad") is MISSING
+    assert cache.stats()["errors"] == 1
+
+
+def test_private_directory(tmp_path):
+    cache = _cache(tmp_path)
+    assert stat.S_IMODE(os.stat(os.path.dirname(cache.path)).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(cache.path).st_mode) == 0o600
+
+
+def test_refuses_shared_writable_directory(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o777)
+    with pytest.raises(PermissionError):
+        SharedCache(str(shared / "cache.sqlite3"), poll_interval=0)
+
+
+def test_invalidation_reaches_other_instance(tmp_path):
+    a = _cache(tmp_path)
+    b = _cache(tmp_path)
+    seen = []
+    b._listeners.append(seen.extend)
+    a.set("listing:h1", {"price": 1})
+    a.invalidate(["listing:h1"])
+    assert b.get("listing:h1") is MISSING
+    assert b.poll_invalidations() == ["listing:h1"]
+    assert seen == ["listing:h1"]
+
+
+def test_same_versioned_invalidation_recorded_once(tmp_path):
+    a = _cache(tmp_path)
+    b = _cache(tmp_path)
+    c = _cache(tmp_path)
+    # 兩個 worker 的監聽器都看到同一筆變動
+    a.invalidate([("listing:h1", "2026-01-01T00:00:00")])
+    b.invalidate([("listing:h1", "2026-01-01T00:00:00")])
+    assert c.poll_invalidations() == ["listing:h1"]
+    a.invalidate([("listing:h1", "2026-01-02T00:00:00"), "listing:h2"])
+    b.invalidate(["listing:h2"])
+    assert c.poll_invalidations() == ["listing:h1", "listing:h2", "listing:h2"]
+
+
+def test_adds_version_column_to_old_invalidations_table(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir(mode=0o700)
+    path = directory / "shared.sqlite3"
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE invalidations (seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, at REAL NOT NULL)")
+    conn.execute("INSERT INTO invalidations (key, at) VALUES ('listing:old', 0)")
+    conn.commit()
+    conn.close()
+    cache = SharedCache(str(path), poll_interval=0)
+    cache.invalidate([("listing:h1", "v1"), ("listing:h1", "v1")])
+    rows = sqlite3.connect(str(path)).execute("SELECT key, version FROM invalidations ORDER BY seq").fetchall()
+    assert rows == [("listing:old", None), ("listing:h1", "v1")]
@@ -0,0 +1,116 @@
+# tests/test_subscriptions.py
+import fake_firestore
+from subscriptions import MAX_BUCKETS, SubscriptionIndex, SubscriptionNotifier, _Sub
+
+
+def _index(forms):
+    index = SubscriptionIndex()
+    for user_id, data in forms.items():
+        index.upsert(user_id, data)
+    return index
+
+
+def test_buckets_cover_budget_range():
+    assert list(_Sub.from_form("U", {"budget": "1000-1500萬"}).buckets()) == [2, 3]
+    assert list(_Sub.from_form("U", {"budget": "1000萬以下"}).buckets()) == [0, 1, 2]
+    # 沒有上限：從 lo 到最後一個桶
+    assert _Sub.from_form("U", {"budget": "3000萬以上"}).buckets() == range(6, MAX_BUCKETS + 1)
+    assert _Sub.from_form("U", {"budget": "80000萬以上"}).buckets() == range(MAX_BUCKETS, MAX_BUCKETS + 1)
+
+
+def test_match_by_genre_room_and_budget():
+    index = _index({
+        "any": {},
+        "apt2": {"genre": "公寓", "room": "2"},
+        "mid": {"budget": "1000-1500萬"},
+        "rich": {"budget": "3000萬以上"},
+        "cheap": {"budget": "1000萬以下", "genre": "透天"},
+    })
+    assert index.match({"genre": "公寓", "room": 2, "price": 1200}) == {"any", "apt2", "mid"}
+    assert index.match({"genre": "透天", "room": 3, "price": 800}) == {"any", "cheap"}
+    assert index.match({"genre": "透天", "room": 4, "price": 3000}) == {"any", "rich"}
+    assert index.match({"genre": "大樓", "room": 4, "price": 99999}) == {"any", "rich"}
+    # 沒有價格的物件不受預算限制
+    assert index.match({"genre": "透天", "room": 5, "price": None}) == {"any", "mid", "rich", "cheap"}
+
+
+def test_upsert_and_remove_update_buckets():
+    index = _index({"U1": {"budget": "3000萬以上"}})
+    index.upsert("U1", {"budget": "1000萬以下"})
+    assert index.match({"price": 5000}) == set()
+    assert index.match({"price": 500}) == {"U1"}
+    index.remove("U1")
+    assert index.match({"price": 500}) == set()
+    assert len(index) == 0
+
+
+def test_changes_before_forms_sync_are_delivered_after_ready():
+    db = fake_firestore.client()
+    forms = db.collection("forms")
+    forms.document("U1").set({"genre": "公寓", "budget": "1000-2000萬"})
+    index = SubscriptionIndex(forms)
+    delivered = []
+    notifier = SubscriptionNotifier(index, lambda doc_id, data: {"id": doc_id}, delivered.extend)
+
+    notifier.on_listing_changes([("ADDED", "h1", None, {"genre": "公寓", "price": 1500})], version=2)
+    assert notifier.stats()["pending"] == 1
+
+    index.start()
+    db.flush_watches()
+    notifier._executor.shutdown(wait=True)
+    assert delivered == [("U1", {"type": "carousel", "contents": [{"id": "h1"}]})]
+    assert notifier.stats()["pending"] == 0
+
+
+def test_string_price_is_coerced():
+    index = _index({"mid": {"budget": "1000-1500萬"}, "rich": {"budget": "3000萬以上"}})
+    assert index.match({"price": "1200"}) == {"mid"}
+    # 轉不了的價格視為沒有價格
+    assert index.match({"price": "洽詢"}) == {"mid", "rich"}
+
+
+def _notifier(deliver):
+    db = fake_firestore.client()
+    forms = db.collection("forms")
+    forms.document("U1").set({})
+    forms.document("U2").set({})
+    index = SubscriptionIndex(forms).start()
+    db.flush_watches()
+    claims = db.collection("notifications")
+    notifier = SubscriptionNotifier(index, lambda doc_id, data: {"id": doc_id}, deliver, claims_col=claims)
+    return notifier, claims
+
+
+def _notify(notifier, version=2):
+    notifier.on_listing_changes([("ADDED", "h1", None, {"price": 1000})], version=version)
+    notifier._executor.submit(lambda: None).result()
+
+
+def test_failed_push_releases_claim():
+    attempts = []
+
+    def deliver(pairs):
+        attempts.append(sorted(user_id for user_id, _ in pairs))
+        return ["U2"] if len(attempts) == 1 else None
+
+    notifier, claims = _notifier(deliver)
+    _notify(notifier)
+    assert claims.document("h1_U1").get().exists
+    assert not claims.document("h1_U2").get().exists
+    # 物件再有變動時只補通知上次沒送到的人
+    _notify(notifier, version=3)
+    assert attempts == [["U1", "U2"], ["U2"]]
+    assert notifier.stats()["released"] == 1
+
+
+def test_deliver_exception_is_logged_and_claims_released(caplog):
+    def deliver(pairs):
+        raise RuntimeError("line down")
+
+    notifier, claims = _notifier(deliver)
+    _notify(notifier)
+    notifier._executor.shutdown(wait=True)
+    assert notifier.stats()["failed"] == 1
+    assert notifier.stats()["released"] == 2
+    assert not claims.document("h1_U1").get().exists
+    assert "line down" in caplog.text
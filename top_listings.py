@@ -0,0 +1,70 @@
+# top_listings.py
+"""
+精選物件 carousel（中壢夜市生活圈精選）
+
+整個 carousel 預先組好並凍結成 JSON，熱路徑只讀記憶體：
+  - top 物件新增 / 修改 / 移除時由 listings 監聽器立即重建
+  - 監聽器沒跑時以 TTL 兜底：過期先回舊的，背景重建
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+log = logging.getLogger("top_listings")
+
+
+class TopCarousel:
+    def __init__(self, build: Callable[[], Optional[object]], ttl: float = 60):
+        """build: 回傳凍結後的訊息（FrozenMessage），沒有精選物件時回傳 None"""
+        self._build = build
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._payload = None
+        self._built_at = None
+        self._refreshing = False
+        self.builds = 0
+
+    def get(self):
+        """回傳目前的 carousel；只有第一次（尚未建立過）會同步建立"""
+        if self._built_at is None:
+            return self.refresh()
+        if time.monotonic() - self._built_at > self.ttl:
+            self._refresh_async()
+        return self._payload
+
+    def refresh(self):
+        try:
+            payload = self._build()
+        except Exception:
+            log.exception("[top_listings] 重建精選 carousel 失敗")
+            return self._payload
+        with self._lock:
+            self._payload = payload
+            self._built_at = time.monotonic()
+            self.builds += 1
+        log.info("[top_listings] ✅ 精選 carousel 已重建 builds=%s empty=%s", self.builds, payload is None)
+        return payload
+
+    def _refresh_async(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name="top-listings-refresh", daemon=True).start()
+
+    def on_listing_changes(self, changes, version):
+        """給 ListingIndex.add_listener 使用：只有牽涉 top 物件的變動才重建"""
+        for _kind, _doc_id, old, new in changes:
+            if (old or {}).get("top") is True or (new or {}).get("top") is True:
+                self.refresh()
+                return
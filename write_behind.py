@@ -0,0 +1,137 @@
+# write_behind.py
+"""
+Firestore 延遲批次寫入（write-behind）
+
+分析用、只新增不修改的紀錄（search_logs 等）不需要讓使用者等：
+add() 只把紀錄放進記憶體，背景執行緒每 max_batch 筆或每 flush_interval_ms 毫秒
+以一個 Firestore batch 寫入。程式結束時會把剩下的寫完。
+佇列超過 max_pending 筆時新紀錄直接丟棄並計數，避免 Firestore 故障時把記憶體吃光。
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from metrics import firestore_call
+
+log = logging.getLogger("write_behind")
+
+FIRESTORE_BATCH_LIMIT = 500
+
+
+def collection_label(items) -> str:
+    """指標用：批次裡只有一個集合就用它的名稱，混合時標成 mixed"""
+    names = {collection for collection, _ in items}
+    return names.pop() if len(names) == 1 else "mixed"
+
+
+class WriteBehindBuffer:
+    def __init__(self, db, collection: str, max_batch: int = 100, flush_interval_ms: int = 1000,
+                 max_pending: int = 10000, max_retries: int = 3):
+        """
+        collection: 預設寫入的集合；add() 也可以個別指定
+        """
+        self._db = db
+        self.collection = collection
+        self.max_batch = min(max_batch, FIRESTORE_BATCH_LIMIT)
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+
+        self._pending: deque = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._counters = {"added": 0, "written": 0, "batches": 0, "dropped": 0, "failed": 0, "retries": 0}
+
+        self._thread = threading.Thread(target=self._run, name=f"write-behind-{collection}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # -------------------- 對外介面 --------------------
+    def add(self, record: Dict[str, Any], collection: Optional[str] = None) -> bool:
+        """放入一筆紀錄；回傳 False 代表緩衝區已滿被丟棄"""
+        with self._cond:
+            if self._closed or len(self._pending) >= self.max_pending:
+                self._counters["dropped"] += 1
+                if self._counters["dropped"] % 100 == 1:
+                    log.warning("[write_behind] ⚠️ 緩衝區已滿，丟棄紀錄 collection=%s dropped=%s",
+                                collection or self.collection, self._counters["dropped"])
+                return False
+            self._pending.append((collection or self.collection, record))
+            self._counters["added"] += 1
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify()
+        return True
+
+    def flush(self):
+        """同步寫完目前所有紀錄"""
+        while True:
+            with self._cond:
+                items = self._take()
+            if not items:
+                return
+            self._commit(items)
+
+    def close(self, timeout: float = 10.0):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats: Dict[str, Any] = dict(self._counters)
+            stats["pending"] = len(self._pending)
+        return stats
+
+    # -------------------- 內部 --------------------
+    def _take(self):
+        items = []
+        while self._pending and len(items) < self.max_batch:
+            items.append(self._pending.popleft())
+        return items
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closed and len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                closed = self._closed
+                items = self._take()
+            if items:
+                self._commit(items)
+            if closed:
+                return
+
+    def _commit(self, items):
+        for attempt in range(1, self.max_retries + 2):
+            try:
+                batch = self._db.batch()
+                for collection, record in items:
+                    batch.set(self._db.collection(collection).document(), record)
+                with firestore_call(f"{collection_label(items)}.batch_commit"):
+                    batch.commit()
+                with self._cond:
+                    self._counters["written"] += len(items)
+                    self._counters["batches"] += 1
+                return
+            except Exception as e:
+                if attempt > self.max_retries:
+                    with self._cond:
+                        self._counters["failed"] += len(items)
+                    log.error("[write_behind] ❌ 批次寫入失敗，放棄 %s 筆: %s", len(items), e)
+                    return
+                with self._cond:
+                    self._counters["retries"] += 1
+                log.warning("[write_behind] 批次寫入失敗，重試 attempt=%s: %s", attempt, e)
+                time.sleep(min(0.5 * 2 ** (attempt - 1), 5))